@@ -0,0 +1,190 @@
+"""
+Suíte de benchmarks do pipeline de conciliação.
+
+Exemplos (a partir da raiz do projeto):
+    python -m benchmarks.bench                                  # tamanhos padrão, compara com o baseline
+    python -m benchmarks.bench --sizes 10000 1000000 10000000
+    python -m benchmarks.bench --update-baseline                # grava os tempos atuais como baseline
+
+O processo termina com código 1 quando alguma etapa fica mais lenta que o baseline além do limite.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generator import generate_statement_pair, write_statement_xlsx
+from src.data_processor import COLUNAS_BANCO, COLUNAS_BRITECH, ConsistencyChecker, DataCleaner
+from src.keys import encode_keys
+from src.schema import QTD_FIXED_DECIMALS, from_day_codes, from_fixed
+from utils.utils import CsvSink, ExcelSink
+
+logger = logging.getLogger(__name__)
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SIZES = [10_000, 100_000]
+# Uma etapa regride quando fica mais lenta que o baseline por mais que esta fração
+DEFAULT_THRESHOLD = 0.25
+# Diferenças absolutas abaixo deste valor (em segundos) são ruído de medição, não regressão
+MIN_DELTA_SECONDS = 0.02
+# Execuções por medida; o baseline é gravado com pelo menos BASELINE_REPEAT execuções
+DEFAULT_REPEAT = 5
+BASELINE_REPEAT = 9
+# Acima destes tamanhos, as etapas que leem ou gravam Excel são puladas (lentas e limitadas a ~1M linhas)
+MAX_EXCEL_LOAD_ROWS = 200_000
+MAX_EXCEL_WRITE_ROWS = 200_000
+
+
+def _median_of(func: Callable[[], object], repeat: int) -> float:
+    """ Mediana dos tempos de `repeat` execuções: um pico isolado (aquecimento, GC, outro processo) não move a medida. """
+    tempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        func()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def _lazy_cleaner(df, required_columns) -> DataCleaner:
+    cleaner = DataCleaner('<sintetico>', required_columns, lazy=True)
+    cleaner.df = df
+    return cleaner
+
+
+def run_benchmarks(sizes: List[int], repeat: int = DEFAULT_REPEAT, seed: int = 0, work_dir: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Mede cada etapa do pipeline para cada tamanho de extrato. As chaves do resultado têm a forma
+    `etapa@linhas`; cada medida guarda a mediana dos tempos de `repeat` execuções e as linhas por segundo.
+    """
+    resultados = {}
+
+    def registrar(etapa: str, n_rows: int, segundos: float, linhas: int):
+        resultados[f'{etapa}@{n_rows}'] = {'segundos': segundos, 'linhas_por_s': linhas / segundos if segundos else None}
+        logger.info("[Benchmark] %s@%d: %.4fs (%.0f linhas/s)", etapa, n_rows, segundos, linhas / max(segundos, 1e-12))
+
+    with tempfile.TemporaryDirectory(prefix='pu_bench_', dir=work_dir) as tmp_dir:
+        for n_rows in sizes:
+            vezes = repeat if n_rows <= 1_000_000 else 1
+            raw_banco, raw_britech = generate_statement_pair(n_rows, seed=seed)
+
+            if n_rows <= MAX_EXCEL_LOAD_ROWS:
+                banco_xlsx = os.path.join(tmp_dir, f'Extrato_Banco_{n_rows}.xlsx')
+                write_statement_xlsx(raw_banco, banco_xlsx)
+                registrar('carga_excel', n_rows,
+                          _median_of(lambda: DataCleaner(banco_xlsx, COLUNAS_BANCO), vezes), len(raw_banco))
+
+            registrar('preparacao_banco', n_rows,
+                      _median_of(lambda: _lazy_cleaner(raw_banco, COLUNAS_BANCO).prepare_banco_data(), vezes), len(raw_banco))
+            registrar('preparacao_britech', n_rows,
+                      _median_of(lambda: _lazy_cleaner(raw_britech, COLUNAS_BRITECH).prepare_britech_data(), vezes), len(raw_britech))
+
+            df_banco = _lazy_cleaner(raw_banco, COLUNAS_BANCO).prepare_banco_data()
+            df_britech = _lazy_cleaner(raw_britech, COLUNAS_BRITECH).prepare_britech_data()
+
+            # Os DataFrames preparados guardam datas e quantidades no esquema compacto
+            vencimentos = from_day_codes(df_banco['VENCIMENTO_DATA_BANCO'])
+            quantidades = from_fixed(df_banco['QTD_BANCO'], QTD_FIXED_DECIMALS)
+            registrar('chaves', n_rows, _median_of(lambda: encode_keys(vencimentos, quantidades), vezes), len(df_banco))
+
+            checker = ConsistencyChecker(df_banco, df_britech)
+            registrar('merge', n_rows, _median_of(checker._merge_data_successive, vezes), len(df_banco) + len(df_britech))
+
+            def comparar():
+                checker._invalidate()
+                return checker.get_comparison_dataframe()
+            registrar('comparacao', n_rows, _median_of(comparar, vezes), len(checker.merged_df))
+
+            df_completo = checker.get_comparison_dataframe()
+            base_name = os.path.join(tmp_dir, f'relatorio_{n_rows}')
+            registrar('relatorio_csv', n_rows,
+                      _median_of(lambda: CsvSink().write(df_completo, base_name, 'Comparacao_Completa'), 1), len(df_completo))
+            if n_rows <= MAX_EXCEL_WRITE_ROWS:
+                registrar('relatorio_excel', n_rows,
+                          _median_of(lambda: ExcelSink().write(df_completo, base_name, 'Comparacao_Completa'), 1), len(df_completo))
+
+    return resultados
+
+
+def compare_with_baseline(resultados: Dict[str, Dict], baseline: Dict[str, Dict],
+                          threshold: float = DEFAULT_THRESHOLD, min_delta: float = MIN_DELTA_SECONDS) -> List[str]:
+    """ Lista as medidas mais lentas que o baseline além do limite; medidas sem baseline são ignoradas. """
+    regressoes = []
+    for nome, medida in resultados.items():
+        referencia = baseline.get(nome)
+        if referencia is None:
+            continue
+        razao = medida['segundos'] / max(referencia['segundos'], 1e-9)
+        if razao > 1 + threshold and medida['segundos'] - referencia['segundos'] > min_delta:
+            regressoes.append(f"{nome}: {medida['segundos']:.4f}s vs baseline {referencia['segundos']:.4f}s ({razao:.2f}x)")
+    return regressoes
+
+
+def load_baseline(path: str) -> Dict[str, Dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['resultados']
+
+
+def save_baseline(resultados: Dict[str, Dict], path: str):
+    baseline = {**load_baseline(path), **resultados}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'ambiente': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__},
+            'resultados': dict(sorted(baseline.items())),
+        }, f, indent=2)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline de conciliação com extratos sintéticos.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Quantidades de linhas por extrato.")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f"Execuções por medida (vale a mediana; ao gravar o baseline, no mínimo {BASELINE_REPEAT}).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Arquivo JSON com os tempos de referência.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Fração de lentidão tolerada em relação ao baseline antes de acusar regressão.")
+    parser.add_argument('--update-baseline', action='store_true', help="Grava os tempos medidos no baseline.")
+    parser.add_argument('--output', help="Grava também os tempos medidos neste arquivo JSON.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Os logs e avisos por etapa do pipeline poluiriam a saída dos benchmarks
+    logging.getLogger('src').setLevel(logging.WARNING)
+    logging.getLogger('utils').setLevel(logging.WARNING)
+    warnings.simplefilter('ignore', UserWarning)
+
+    args = parse_args(argv)
+    repeat = max(args.repeat, BASELINE_REPEAT) if args.update_baseline else args.repeat
+    resultados = run_benchmarks(args.sizes, repeat=repeat, seed=args.seed)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2)
+    if args.update_baseline:
+        save_baseline(resultados, args.baseline)
+        logger.info("[Benchmark] Baseline atualizado: %s", args.baseline)
+        return 0
+
+    regressoes = compare_with_baseline(resultados, load_baseline(args.baseline), args.threshold)
+    for regressao in regressoes:
+        logger.error("[Benchmark] Regressão: %s", regressao)
+    if not regressoes:
+        logger.info("[Benchmark] Nenhuma regressão em relação ao baseline.")
+    return 1 if regressoes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
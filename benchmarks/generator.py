@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from typing import Optional, Tuple
+
+# Linhas de "lixo" acima do cabeçalho, como nos extratos reais
+JUNK_HEADER_ROWS = [
+    ['Carteira Diária'],
+    ['Data Base', '21/11/2024'],
+    [],
+    ['Relatório gerado automaticamente - valores em R$'],
+]
+_BASE_DATE = np.datetime64('2015-01-01')
+_DAY = np.timedelta64(1, 'D')
+
+
+def _brl(values: np.ndarray) -> list:
+    """ Valores formatados como texto no padrão brasileiro ('R$ 1.234,56'). """
+    return [f"R$ {v:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.') for v in values]
+
+
+def generate_statement_pair(n_rows: int, match_rate: float = 0.9, duplicate_rate: float = 0.0,
+                            nat_rate: float = 0.05, text_value_rate: float = 0.02,
+                            inconsistency_rate: float = 0.01, subtotal_rate: float = 0.02,
+                            seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Gera um par de extratos sintéticos (Banco, Britech) no formato bruto das planilhas, já a
+    partir da linha de cabeçalho.
+
+    - `match_rate`: fração das posições do Banco que também estão no extrato da Britech.
+    - `duplicate_rate`: fração das posições do Banco que repetem a chave (data e quantidade) de outra.
+    - `nat_rate`: fração de vencimentos em branco no Banco (conciliados pela data de aplicação).
+    - `text_value_rate`: fração dos valores brutos gravados como texto ('R$ 1.234,56').
+    - `inconsistency_rate`: fração dos pares conciliados com diferença de PU na Britech.
+    - `subtotal_rate`: fração de linhas de seção/total intercaladas no extrato do Banco.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Quantidades distintas garantem chaves únicas antes da injeção de duplicidades
+    qtd = (rng.permutation(n_rows) + 1).astype(float)
+    aplicacao = _BASE_DATE + rng.integers(0, 3650, n_rows) * _DAY
+    vencimento = aplicacao + rng.integers(180, 7300, n_rows) * _DAY
+    vencimento[rng.random(n_rows) < nat_rate] = np.datetime64('NaT')
+    pu = rng.uniform(900, 1500, n_rows).round(8)
+
+    duplicadas = np.flatnonzero(rng.random(n_rows) < duplicate_rate)
+    if len(duplicadas):
+        origem = rng.integers(0, n_rows, len(duplicadas))
+        qtd[duplicadas], aplicacao[duplicadas], vencimento[duplicadas] = qtd[origem], aplicacao[origem], vencimento[origem]
+    valor = pu * qtd
+
+    codigo = pd.Series(np.arange(n_rows)).map('ATV{:08d}'.format)
+    banco = pd.DataFrame({
+        'Código': codigo,
+        'Aplicação': aplicacao.astype('datetime64[ns]'),
+        'Emitente': 'EMISSOR SINTETICO',
+        'Vcto.': vencimento.astype('datetime64[ns]'),
+        'Qtd.': qtd,
+        'PU Atual': pu,
+        'Valor Bruto': valor.astype(object),
+    })
+
+    # --- Britech: posições conciliáveis + posições que só existem na Britech ---
+    n_match = int(round(n_rows * match_rate))
+    conciliaveis = rng.choice(n_rows, n_match, replace=False)
+    fator = np.where(rng.random(n_match) < inconsistency_rate, 1 + rng.uniform(1e-4, 1e-2, n_match), 1.0)
+
+    n_extra = n_rows - n_match
+    qtd_extra = (n_rows + rng.permutation(n_extra) + 1).astype(float)
+    operacao_extra = _BASE_DATE + rng.integers(0, 3650, n_extra) * _DAY
+
+    britech_qtd = np.concatenate([qtd[conciliaveis], qtd_extra])
+    britech_operacao = np.concatenate([aplicacao[conciliaveis], operacao_extra])
+    britech_vencimento = np.concatenate([vencimento[conciliaveis], operacao_extra + 365 * _DAY])
+    # Vencimentos em branco no Banco existem na Britech (a conciliação usa a aplicação)
+    sem_venc = np.isnat(britech_vencimento)
+    britech_vencimento[sem_venc] = britech_operacao[sem_venc] + 730 * _DAY
+    britech_valor = np.concatenate([valor[conciliaveis] * fator, rng.uniform(1e4, 1e7, n_extra)])
+
+    britech = pd.DataFrame({
+        'MERCADO': 'RENDA FIXA',
+        'DESCRIÇÃO': pd.Series(np.concatenate([conciliaveis, np.arange(n_rows, n_rows + n_extra)])).map('TITULO {:08d} - Vcto'.format),
+        'QUANTIDADE': britech_qtd,
+        'DATA VENCIMENTO': pd.Series(britech_vencimento).dt.strftime('%d/%m/%Y'),
+        'DATA OPERAÇÃO': pd.Series(britech_operacao).dt.strftime('%d/%m/%Y'),
+        'VALOR BRUTO': britech_valor.astype(object),
+    }).sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+    for df, col in ((banco, 'Valor Bruto'), (britech, 'VALOR BRUTO')):
+        texto = np.flatnonzero(rng.random(len(df)) < text_value_rate)
+        df.loc[texto, col] = _brl(df.loc[texto, col].astype(float).to_numpy())
+
+    banco = _insert_subtotals(banco, rng, subtotal_rate)
+    return banco, britech
+
+
+def _insert_subtotals(banco: pd.DataFrame, rng: np.random.Generator, subtotal_rate: float) -> pd.DataFrame:
+    """ Intercala linhas de seção ('Negociação') e de total, sem PU, como no extrato do Banco. """
+    n_sub = int(len(banco) * subtotal_rate)
+    if n_sub == 0:
+        return banco
+    subtotais = pd.DataFrame({
+        'Código': np.where(rng.random(n_sub) < 0.5, 'Negociação', 'Total CRA'),
+        'Qtd.': np.where(rng.random(n_sub) < 0.5, rng.integers(1, 100, n_sub), np.nan),
+    }).reindex(columns=banco.columns).astype(banco.dtypes.to_dict())
+    posicoes = np.sort(rng.integers(0, len(banco), n_sub)) + np.arange(n_sub)
+    ordem = np.full(len(banco) + n_sub, -1)
+    ordem[posicoes] = np.arange(n_sub)
+    dados = np.flatnonzero(ordem == -1)
+    return pd.concat([banco.set_axis(dados), subtotais.set_axis(posicoes)]).sort_index().reset_index(drop=True)
+
+
+def write_statement_xlsx(df: pd.DataFrame, file_path: str, junk_rows: Optional[list] = None):
+    """
+    Grava o extrato em .xlsx com linhas de lixo acima do cabeçalho (modo `constant_memory`,
+    linha a linha). Limitado ao máximo de linhas de uma planilha do Excel.
+    """
+    junk_rows = JUNK_HEADER_ROWS if junk_rows is None else junk_rows
+    if len(df) + len(junk_rows) + 1 > 1_048_576:
+        raise ValueError(f"O Excel não comporta {len(df)} linhas em uma planilha.")
+
+    workbook = xlsxwriter.Workbook(file_path, {'constant_memory': True, 'default_date_format': 'dd/mm/yyyy'})
+    worksheet = workbook.add_worksheet('Extrato')
+    for row_num, row in enumerate(junk_rows):
+        worksheet.write_row(row_num, 0, row)
+
+    header_row = len(junk_rows)
+    worksheet.write_row(header_row, 0, list(df.columns))
+    columns = [df[col].astype(object).where(df[col].notna(), None).tolist() for col in df.columns]
+    for row_num, row in enumerate(zip(*columns), start=header_row + 1):
+        worksheet.write_row(row_num, 0, row)
+    workbook.close()
@@ -1,23 +1,21 @@
 import os
+import sys
+import argparse
 import logging
-import pandas as pd
+from datetime import date
+from typing import List, Optional, Tuple
 
-from src.data_processor import DataCleaner, ConsistencyChecker, TOLERANCE
-from utils.utils import save_to_excel
+from src.logging_setup import DEFAULT_KEEP_RUNS, configure_logging, shutdown_logging
+from src.settings import (DEFAULT_HOST, DEFAULT_MAX_BYTES, DEFAULT_MEMORY_BUDGET, DEFAULT_PORT, DEFAULT_SERVICE_ROOT, DUPLICATE_MODES,
+                          OUTPUT_FORMATS)
+
+# Os módulos de processamento (pandas, NumPy, openpyxl) são importados dentro de cada subcomando:
+# `--help` e `validate-headers` não pagam esse custo.
 
 
 # --- CONFIGURAÇÃO DO LOGGING ---
-LOG_FILE = 'log.log'
-LOG_LEVEL = logging.INFO
-
-logging.basicConfig(
-    level=LOG_LEVEL,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, mode='w', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+LOG_LEVEL = 'INFO'
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
 
 logger = logging.getLogger(__name__)
 
@@ -27,48 +25,430 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 BANCO_FILE = os.path.join(BASE_DIR, 'data', 'Extrato_Banco.xlsx')
 BRITECH_FILE = os.path.join(BASE_DIR, 'data', 'Extrato_Britech.xlsx')
 
-OUTPUT_FILE_TOTAL = 'relatorio_comparacao_completa.xlsx'
-OUTPUT_FILE_INCONSISTENT = 'relatorio_inconsistencias.xlsx'
+# Nomes base dos relatórios; a extensão é definida por cada formato de saída
+OUTPUT_FILE_TOTAL = 'relatorio_comparacao_completa'
+OUTPUT_FILE_INCONSISTENT = 'relatorio_inconsistencias'
+OUTPUT_FILE_DELTA = 'relatorio_delta'
+OUTPUT_FILE_BANCO_ONLY = 'relatorio_somente_banco'
+OUTPUT_FILE_BRITECH_ONLY = 'relatorio_somente_britech'
+OUTPUT_FILE_QUARANTINE = 'relatorio_quarentena'
+OUTPUT_FILE_SOURCE_ONLY = 'relatorio_somente_fonte'
+OUTPUT_FILE_PU_BY_SOURCE = 'relatorio_pu_fontes'
+# Nome da fonte interna padrão (o extrato da Britech), sempre presente na conciliação com --fontes
+BRITECH_SOURCE = 'BRITECH'
+RUN_REPORT_FILE = 'relatorio_execucao.json'
+CACHE_DIR = os.path.join(BASE_DIR, '.cache')
+STATE_DIR = os.path.join(BASE_DIR, '.state')
+HISTORY_FILE = os.path.join(BASE_DIR, 'historico_pu.sqlite')
+LOG_DIR = os.path.join(BASE_DIR, 'logs')
+
+COMMANDS = ('run', 'batch', 'serve', 'validate-headers', 'history')
+
+
+def _processing_options() -> argparse.ArgumentParser:
+    """ Opções comuns aos subcomandos que conciliam (run, batch e serve). """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--no-cache', action='store_true', help="Ignora o cache em disco e reprocessa os arquivos Excel.")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="Diretório do cache dos dados preparados.")
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Tamanho máximo do cache em MB; as entradas mais antigas são removidas ao exceder.")
+    parser.add_argument('--formats', nargs='+', choices=OUTPUT_FORMATS, default=['excel'],
+                        help="Formatos dos relatórios; vários formatos são gravados na mesma execução.")
+    parser.add_argument('--nearest-days', type=int, default=0,
+                        help="Conciliação aproximada das linhas sem match exato: diferença máxima de data, em dias corridos.")
+    parser.add_argument('--nearest-qty', type=float, default=0.0,
+                        help="Conciliação aproximada das linhas sem match exato: diferença máxima de quantidade.")
+    parser.add_argument('--duplicates', choices=DUPLICATE_MODES, default='raise',
+                        help="Chaves duplicadas: 'raise' interrompe a conciliação; 'group' desempata os lotes por data "
+                             "de aplicação, vencimento e valor, e envia os ambíguos para o relatório de quarentena.")
+    parser.add_argument('--rules', type=_rules_arg, default=None, metavar='ARQUIVO',
+                        help="Regras de inconsistência em JSON (por classe de ativo, relativas ou por valor); "
+                             "sem o arquivo, vale a tolerância global sobre a diferença absoluta de PU.")
+    parser.add_argument('--log-dir', default=LOG_DIR,
+                        help="Diretório dos logs estruturados (JSON, um arquivo por execução, identificado pelo run id); vazio, só console.")
+    parser.add_argument('--log-keep', type=int, default=DEFAULT_KEEP_RUNS,
+                        help="Número de execuções cujos arquivos de log são mantidos em --log-dir.")
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default=LOG_LEVEL,
+                        help="Nível mínimo dos registros de log; acima de INFO, as etapas não são cronometradas.")
+    return parser
+
+
+def _report_options() -> argparse.ArgumentParser:
+    """ Opções do relatório de execução (run e batch; as etapas do profiler não são separadas por thread do serviço). """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--run-report', nargs='?', const=RUN_REPORT_FILE, default=None,
+                        help=f"Grava o relatório de execução em JSON (tempo, CPU, linhas e memória por etapa; padrão: {RUN_REPORT_FILE}).")
+    parser.add_argument('--profile', action='store_true',
+                        help="Executa sob cProfile e tracemalloc; implica --run-report e grava também o arquivo .prof.")
+    return parser
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Verificação de inconsistências de PU entre Banco e Britech.",
+                                     epilog="Sem subcomando, executa o 'run' com as opções informadas.")
+    subcommands = parser.add_subparsers(dest='command', metavar='{' + ','.join(COMMANDS) + '}')
+    processing, report = _processing_options(), _report_options()
+
+    run_parser = subcommands.add_parser('run', parents=[processing, report], help="Concilia os extratos de data/ (padrão).")
+    run_parser.add_argument('--streaming', action='store_true',
+                            help="Concilia em blocos com partições em disco, para extratos que não cabem em memória (saída em CSV).")
+    run_parser.add_argument('--memory-budget-mb', type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                            help="Orçamento de memória do modo streaming, em MB.")
+    run_parser.add_argument('--parallel-load', action='store_true',
+                            help="Carrega e prepara os extratos do Banco e da Britech ao mesmo tempo, em processos separados.")
+    run_parser.add_argument('--incremental', action='store_true',
+                            help="Reavalia apenas as posições que mudaram desde a execução anterior e gera o relatório delta.")
+    run_parser.add_argument('--state-dir', default=STATE_DIR, help="Diretório do estado persistido do modo incremental.")
+    run_parser.add_argument('--fontes', nargs='+', type=_source_arg, default=None, metavar='NOME=ARQUIVO',
+                            help="Fontes internas adicionais (no layout da Britech), conciliadas junto com a Britech contra o mesmo extrato do Banco.")
+    run_parser.add_argument('--history', nargs='?', const=HISTORY_FILE, default=None, metavar='ARQUIVO',
+                            help=f"Acrescenta o relatório de comparação ao histórico de PU em SQLite (padrão: {os.path.basename(HISTORY_FILE)}).")
+    run_parser.add_argument('--run-date', type=date.fromisoformat, default=None, metavar='AAAA-MM-DD',
+                            help="Data da execução gravada no histórico (padrão: hoje).")
+
+    batch_parser = subcommands.add_parser('batch', parents=[processing, report], help="Concilia vários pares de extratos em lote.")
+    origem = batch_parser.add_mutually_exclusive_group(required=True)
+    origem.add_argument('--batch-dir', help="Concilia todos os pares de extratos encontrados nesta árvore de diretórios.")
+    origem.add_argument('--manifest', help="Concilia os pares listados neste CSV (carteira,banco,britech).")
+    batch_parser.add_argument('--workers', type=int, default=None, help="Número de processos (padrão: núcleos da CPU).")
+    batch_parser.add_argument('--output-dir', default='relatorios_lote', help="Diretório de saída.")
+
+    serve_parser = subcommands.add_parser('serve', parents=[processing],
+                                          help="Mantém a Britech preparada em memória e concilia extratos do Banco sob demanda (HTTP).")
+    serve_parser.add_argument('--britech', default=BRITECH_FILE, help="Extrato da Britech mantido em memória.")
+    serve_parser.add_argument('--host', default=DEFAULT_HOST, help="Endereço do serviço.")
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Porta do serviço.")
+    serve_parser.add_argument('--socket', default=None, help="Atende neste socket Unix, em vez de TCP.")
+    serve_parser.add_argument('--workers', type=int, default=None, help="Número de threads de atendimento (padrão: núcleos da CPU).")
+    serve_parser.add_argument('--raiz', default=DEFAULT_SERVICE_ROOT,
+                              help="Diretório raiz dos caminhos recebidos nas requisições (extratos e relatórios); "
+                                   "caminhos fora dele são recusados (padrão: diretório atual).")
+
+    validate_parser = subcommands.add_parser('validate-headers',
+                                             help="Só verifica o cabeçalho dos extratos, sem carregar os dados (para hooks de ingestão).")
+    validate_parser.add_argument('files', nargs='*', default=[BANCO_FILE, BRITECH_FILE],
+                                 help="Arquivos a verificar (padrão: os extratos de data/).")
+    validate_parser.add_argument('--layout', choices=['banco', 'britech'], default=None,
+                                 help="Aceita só os layouts deste tipo de extrato; por padrão, qualquer layout do registro é aceito.")
+
+    history_parser = subcommands.add_parser('history', help="Consulta o histórico de PU gravado com 'run --history'.")
+    history_parser.add_argument('asset_id', nargs='?', default=None,
+                                help="Histórico e estatísticas móveis do PU_DIFF deste ativo; sem ativo, lista os ativos com maior tendência.")
+    history_parser.add_argument('--db', default=HISTORY_FILE, help="Arquivo do histórico.")
+    history_parser.add_argument('--fonte', default=BRITECH_SOURCE, help="Fonte interna consultada.")
+    history_parser.add_argument('--window', default='20',
+                                help="Janela das estatísticas móveis: número de execuções ou período corrido (ex.: 30D).")
+    history_parser.add_argument('--days', type=int, default=30, help="Janela da tendência, em dias corridos até a última execução.")
+    history_parser.add_argument('--top', type=int, default=20, help="Número de ativos listados por tendência.")
+    return parser
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # Compatibilidade com as chamadas antigas (`python main.py --no-cache`): sem subcomando, executa o 'run'
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ('-h', '--help')):
+        argv = ['run'] + argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        # As partições do streaming e o fecho de chaves do incremental dependem do match exato
+        if (args.nearest_days or args.nearest_qty) and (args.streaming or args.incremental):
+            parser.error("A conciliação aproximada (--nearest-days/--nearest-qty) não está disponível nos modos streaming e incremental.")
+        if args.duplicates != 'raise' and (args.streaming or args.incremental):
+            parser.error("O agrupamento de chaves duplicadas (--duplicates group) não está disponível nos modos streaming e incremental.")
+        if args.history and args.streaming:
+            parser.error("--history não está disponível no modo streaming, que não mantém o relatório de comparação em memória.")
+        if args.fontes and (args.streaming or args.incremental or args.parallel_load or args.nearest_days or args.nearest_qty
+                            or args.duplicates != 'raise'):
+            parser.error("--fontes não pode ser combinado com --streaming, --incremental, --parallel-load, --nearest-* ou --duplicates group.")
+        nomes = [nome for nome, _ in args.fontes or []]
+        repetidos = sorted({nome for nome in nomes if nomes.count(nome) > 1})
+        if repetidos:
+            parser.error(f"--fontes: nomes de fonte repetidos {repetidos}.")
+    return args
+
+
+def _source_arg(value: str) -> Tuple[str, str]:
+    nome, sep, arquivo = value.partition('=')
+    if not sep or not nome or not arquivo:
+        raise argparse.ArgumentTypeError(f"Fonte inválida: '{value}'. Use NOME=ARQUIVO.")
+    if nome.upper() == BRITECH_SOURCE:
+        raise argparse.ArgumentTypeError(f"Fonte inválida: '{value}'. O nome {BRITECH_SOURCE} é reservado para o extrato da Britech.")
+    return nome.upper(), arquivo
+
+
+def _rules_arg(path: str):
+    from src.rules import load_rules
+
+    try:
+        return load_rules(path)
+    except (OSError, ValueError) as e:
+        raise argparse.ArgumentTypeError(str(e))
+
 
+def build_nearest(args: argparse.Namespace):
+    """ Conciliação aproximada configurada na linha de comando, ou None se nenhuma tolerância foi informada. """
+    if not (args.nearest_days or args.nearest_qty):
+        return None
+    from src.matcher import NearestMatcher
+    return NearestMatcher(max_days=args.nearest_days, max_qty=args.nearest_qty)
+
+
+def build_cache(args: argparse.Namespace):
+    """ Cache em disco dos dados preparados, ou None com --no-cache. """
+    if args.no_cache:
+        return None
+    from src.cache import PreparedFrameCache
+    return PreparedFrameCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        return _dispatch(args)
+    finally:
+        # Esvazia a fila do logging antes de sair: nenhum registro fica sem gravar
+        shutdown_logging()
+
+
+def _dispatch(args: argparse.Namespace) -> int:
+    if args.command == 'validate-headers':
+        # Só console: o comando roda em hooks, possivelmente em paralelo, fora da raiz do projeto
+        configure_logging()
+        return validate_headers(args.files, args.layout)
+    if args.command == 'history':
+        configure_logging()
+        return query_history(args)
+
+    log_path = configure_logging(args.log_dir, getattr(logging, args.log_level), args.log_keep)
+    if log_path:
+        logger.info("Log estruturado da execução: %s", log_path)
+    command = {'run': run, 'batch': run_batch_command, 'serve': run_service}[args.command]
+    report_path = getattr(args, 'run_report', None) or (RUN_REPORT_FILE if getattr(args, 'profile', False) else None)
+    if report_path is None:
+        command(args)
+        return 0
+
+    from src.profiling import RunProfiler
+    profiler = RunProfiler(deep=args.profile)
+    with profiler:
+        command(args)
+    profiler.save(report_path, os.path.splitext(report_path)[0] + '.prof')
+    return 0
+
+
+def validate_headers(files: List[str], kind: Optional[str] = None) -> int:
+    """
+    Verifica se cada arquivo tem, nas primeiras linhas, o cabeçalho de um layout do registro
+    (`src/layouts.py` e os arquivos de layouts/). Lê só o início da primeira planilha, sem pandas
+    nem openpyxl. Retorna 1 se algum arquivo falhar.
+    """
+    from src.excel_reader import MAX_ROWS_TO_CHECK, read_sheet_preview
+    from src.layouts import detect_header, layout_registry
+
+    layouts = [layout for layout in layout_registry() if kind is None or layout.kind == kind]
+
+    falhas = 0
+    for file_path in files:
+        try:
+            preview = read_sheet_preview(file_path)
+        except Exception as e:
+            logger.error("[Validação] %s: arquivo ilegível (%s)", file_path, e)
+            falhas += 1
+            continue
+
+        match = detect_header(preview, layouts)
+        if match is None:
+            nomes = ', '.join(layout.name for layout in layouts)
+            logger.error("[Validação] %s: nenhum cabeçalho (%s) nas %d primeiras linhas", file_path, nomes, MAX_ROWS_TO_CHECK)
+            falhas += 1
+            continue
+
+        apelidos = {header: col for header, col in match.mapping.items() if header != col}
+        detalhe = f" (colunas: {apelidos})" if apelidos else ''
+        logger.info("[Validação] %s: cabeçalho do layout '%s' na linha %d%s", file_path, match.layout.name, match.row + 1, detalhe)
+    return 1 if falhas else 0
+
+
+def run_batch_command(args: argparse.Namespace):
+    from src.batch import discover_pairs, read_manifest, run_batch
 
-def main():
     logger.info("--- Iniciando Verificação de Inconsistências de PU ---")
+    pairs = discover_pairs(args.batch_dir) if args.batch_dir else read_manifest(args.manifest)
+    logger.info("Modo lote: %d pares de extratos encontrados", len(pairs))
+    run_batch(pairs, args.output_dir, workers=args.workers, cache_dir=None if args.no_cache else args.cache_dir,
+              formats=args.formats, nearest=build_nearest(args), duplicates=args.duplicates, rules=args.rules)
+    logger.info("--- Fim do processamento ---")
+
 
-    COLUNAS_BANCO = ['Aplicação', 'Qtd.', 'PU Atual', 'Código', 'Vcto.', 'Valor Bruto']
-    COLUNAS_BRITECH = ['DATA OPERAÇÃO', 'VALOR BRUTO', 'QUANTIDADE', 'DESCRIÇÃO', 'DATA VENCIMENTO']
+def run_service(args: argparse.Namespace):
+    from src.service import ReconciliationService, serve
+
+    logger.info("--- Iniciando Verificação de Inconsistências de PU ---")
+    service = ReconciliationService(args.britech, cache=build_cache(args), nearest=build_nearest(args),
+                                    duplicates=args.duplicates, formats=args.formats, rules=args.rules,
+                                    root_dir=args.raiz)
+    serve(service, args.host, args.port, socket_path=args.socket, workers=args.workers)
+    logger.info("--- Fim do processamento ---")
+
+
+def run(args: argparse.Namespace):
+    from src.data_processor import DataCleaner, ConsistencyChecker, TOLERANCE, COLUNAS_BANCO, COLUNAS_BRITECH
+    from utils.utils import build_sinks, write_report
+
+    logger.info("--- Iniciando Verificação de Inconsistências de PU ---")
+
+    sinks = build_sinks(args.formats)
+    nearest = build_nearest(args)
+    cache = build_cache(args)
+
+    if args.fontes:
+        run_multi_source(args, cache, sinks)
+        return
+
+    if args.streaming:
+        from src.streaming import StreamingReconciler
+
+        logger.info("Modo streaming: conciliação por partições em disco...")
+        try:
+            reconciler = StreamingReconciler(BANCO_FILE, COLUNAS_BANCO, BRITECH_FILE, COLUNAS_BRITECH,
+                                             memory_budget=args.memory_budget_mb * 1024 * 1024, rules=args.rules)
+            reconciler.run(OUTPUT_FILE_TOTAL, OUTPUT_FILE_INCONSISTENT, OUTPUT_FILE_BANCO_ONLY, OUTPUT_FILE_BRITECH_ONLY)
+        except Exception as e:
+            logger.critical("❌ Erro crítico no processamento: %s", e, exc_info=True)
+            return
+        logger.info("--- Fim do processamento ---")
+        return
 
     try:
-        logger.info("1. Processando dados do Banco...")
-        df_banco = DataCleaner(BANCO_FILE, COLUNAS_BANCO).prepare_banco_data()
+        if args.parallel_load:
+            from src.parallel_load import load_prepared_concurrently
+
+            logger.info("1-2. Processando dados do Banco e da Britech em paralelo...")
+            df_banco, df_britech = load_prepared_concurrently(BANCO_FILE, BRITECH_FILE, cache=cache)
+        else:
+            logger.info("1. Processando dados do Banco...")
+            df_banco = DataCleaner(BANCO_FILE, COLUNAS_BANCO, cache=cache).prepare_banco_data()
 
-        logger.info("2. Processando dados da Britech...")
-        df_britech = DataCleaner(BRITECH_FILE, COLUNAS_BRITECH).prepare_britech_data()
+            logger.info("2. Processando dados da Britech...")
+            df_britech = DataCleaner(BRITECH_FILE, COLUNAS_BRITECH, cache=cache).prepare_britech_data()
 
     except Exception as e:
-        logger.critical(f"❌ Erro crítico no processamento: {e}", exc_info=True)
+        logger.critical("❌ Erro crítico no processamento: %s", e, exc_info=True)
         return
 
-    logger.info(f" -> Dados limpos: Banco ({len(df_banco)}), Britech ({len(df_britech)})")
+    logger.info(" -> Dados limpos: Banco (%d), Britech (%d)", len(df_banco), len(df_britech))
+
+    checker = None
+    if args.incremental:
+        from src.incremental import IncrementalReconciler
+
+        logger.info("3. Iniciando conciliação incremental...")
+        df_completo, df_delta = IncrementalReconciler(args.state_dir, rules=args.rules).run(df_banco, df_britech)
+        write_report(df_delta, OUTPUT_FILE_DELTA, 'Delta_Inconsistencias', sinks)
+    else:
+        checker = ConsistencyChecker(df_banco, df_britech, nearest=nearest, duplicates=args.duplicates, rules=args.rules)
+
+        logger.info("3. Iniciando conciliação...")
+        df_completo = checker.get_comparison_dataframe()
+
+    logger.info("4. Conciliação concluída: %d ativos", len(df_completo))
+    write_report(df_completo, OUTPUT_FILE_TOTAL, 'Comparacao_Completa', sinks)
+    save_history(args, df_completo)
+
+    # Posições sem par, já separadas na passada de conciliação (o modo incremental só reavalia os pares afetados)
+    if checker is not None:
+        for df_sem_par, nome, aba in ((checker.get_banco_only_dataframe(), OUTPUT_FILE_BANCO_ONLY, 'Somente_Banco'),
+                                      (checker.get_britech_only_dataframe(), OUTPUT_FILE_BRITECH_ONLY, 'Somente_Britech'),
+                                      (checker.get_quarantine_dataframe(), OUTPUT_FILE_QUARANTINE, 'Quarentena')):
+            if not df_sem_par.empty:
+                write_report(df_sem_par, nome, aba, sinks)
+
+    criterio = f"{len(args.rules)} regras" if args.rules else f"tolerância {TOLERANCE:.2e}"
+    logger.info("5. Verificando inconsistências (%s)...", criterio)
+    df_inconsistencias = df_completo[df_completo['STATUS_INCONSISTENCIA'] == True].copy()
+
+    if not df_inconsistencias.empty:
+        write_report(df_inconsistencias, OUTPUT_FILE_INCONSISTENT, 'Inconsistencias', sinks)
+        logger.info("✅ Inconsistências encontradas: %d", len(df_inconsistencias))
+    else:
+        logger.info("Nenhuma inconsistência encontrada.")
+
+    logger.info("--- Fim do processamento ---")
+
 
-    checker = ConsistencyChecker(df_banco, df_britech)
+def run_multi_source(args: argparse.Namespace, cache, sinks):
+    """ Concilia o extrato do Banco contra a Britech e as fontes de --fontes em uma única passada. """
+    from src.data_processor import DataCleaner, MultiSourceChecker, COLUNAS_BANCO, COLUNAS_BRITECH
+    from utils.utils import write_report
 
-    logger.info("3. Iniciando conciliação...")
+    fontes = dict([(BRITECH_SOURCE, BRITECH_FILE)] + args.fontes)
+    try:
+        logger.info("1. Processando dados do Banco...")
+        df_banco = DataCleaner(BANCO_FILE, COLUNAS_BANCO, cache=cache).prepare_banco_data()
+
+        logger.info("2. Processando dados das fontes internas (%s)...", ', '.join(fontes))
+        df_fontes = {nome: DataCleaner(arquivo, COLUNAS_BRITECH, cache=cache).prepare_britech_data() for nome, arquivo in fontes.items()}
+    except Exception as e:
+        logger.critical("❌ Erro crítico no processamento: %s", e, exc_info=True)
+        return
+
+    logger.info("3. Iniciando conciliação com várias fontes...")
+    checker = MultiSourceChecker(df_banco, df_fontes, rules=args.rules)
     df_completo = checker.get_comparison_dataframe()
 
-    logger.info(f"4. Conciliação concluída: {len(df_completo)} ativos")
-    save_to_excel(df_completo, OUTPUT_FILE_TOTAL, 'Comparacao_Completa')
+    logger.info("4. Conciliação concluída: %d pares em %d fontes", len(df_completo), len(fontes))
+    write_report(df_completo, OUTPUT_FILE_TOTAL, 'Comparacao_Completa', sinks)
+    save_history(args, df_completo)
+    write_report(checker.get_pu_by_source_dataframe(), OUTPUT_FILE_PU_BY_SOURCE, 'PU_Fontes', sinks)
+    for df_sem_par, nome, aba in ((checker.get_banco_only_dataframe(), OUTPUT_FILE_BANCO_ONLY, 'Somente_Banco'),
+                                  (checker.get_source_only_dataframe(), OUTPUT_FILE_SOURCE_ONLY, 'Somente_Fonte')):
+        if not df_sem_par.empty:
+            write_report(df_sem_par, nome, aba, sinks)
 
-    logger.info(f"5. Verificando inconsistências (tolerância {TOLERANCE:.2e})...")
     df_inconsistencias = checker.get_inconsistent_dataframe()
-
     if not df_inconsistencias.empty:
-        save_to_excel(df_inconsistencias, OUTPUT_FILE_INCONSISTENT, 'Inconsistencias')
-        logger.info(f"✅ Inconsistências encontradas: {len(df_inconsistencias)}")
+        write_report(df_inconsistencias, OUTPUT_FILE_INCONSISTENT, 'Inconsistencias', sinks)
+        logger.info("✅ Inconsistências encontradas: %d", len(df_inconsistencias))
     else:
         logger.info("Nenhuma inconsistência encontrada.")
 
     logger.info("--- Fim do processamento ---")
 
 
+def save_history(args: argparse.Namespace, df_completo):
+    """ Com --history, acrescenta o relatório de comparação ao histórico de PU. """
+    if not args.history:
+        return
+    from src.history import PUHistoryStore
+
+    try:
+        with PUHistoryStore(args.history) as store:
+            store.append(df_completo, args.run_date)
+    except ValueError as e:
+        # Os relatórios da execução já foram gravados; só o histórico fica sem esta data
+        logger.error("❌ Histórico não atualizado: %s", e)
+
+
+def query_history(args: argparse.Namespace) -> int:
+    """ Imprime o histórico e as estatísticas móveis de um ativo, ou os ativos com maior tendência de PU_DIFF. """
+    if not os.path.exists(args.db):
+        logger.error("Histórico não encontrado: %s", args.db)
+        return 1
+    from src.history import PUHistoryStore
+
+    with PUHistoryStore(args.db) as store:
+        if args.asset_id is None:
+            df = store.top_drift(days=args.days, n=args.top, fonte=args.fonte)
+        else:
+            window = int(args.window) if args.window.isdigit() else args.window
+            df = store.rolling_stats(args.asset_id, window=window, fonte=args.fonte)
+    if df.empty:
+        logger.info("Nenhum registro no histórico para a consulta.")
+        return 0
+    print(df.to_string(index=False))
+    return 0
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import csv
+import fnmatch
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import pandas as pd
+
+from src.cache import PreparedFrameCache
+from src.data_processor import COLUNAS_BANCO, COLUNAS_BRITECH, ConsistencyChecker, DataCleaner
+from src.logging_setup import init_process_logging, log_context, process_logging_args
+from src.matcher import NearestMatcher
+from src.rules import RuleEngine
+from utils.utils import build_sinks, save_to_excel, write_report
+
+logger = logging.getLogger(__name__)
+
+# Padrões de nome usados na descoberta de pares em uma árvore de diretórios
+BANCO_PATTERN = 'Extrato_Banco*.xlsx'
+BRITECH_PATTERN = 'Extrato_Britech*.xlsx'
+
+OUTPUT_FILE_TOTAL = 'relatorio_comparacao_completa'
+OUTPUT_FILE_INCONSISTENT = 'relatorio_inconsistencias'
+OUTPUT_FILE_BANCO_ONLY = 'relatorio_somente_banco'
+OUTPUT_FILE_BRITECH_ONLY = 'relatorio_somente_britech'
+OUTPUT_FILE_QUARANTINE = 'relatorio_quarentena'
+SUMMARY_FILE = 'resumo_lote.xlsx'
+
+
+class StatementPair(NamedTuple):
+    """ Par de extratos (Banco e Britech) de uma carteira. """
+    carteira: str
+    banco_file: str
+    britech_file: str
+
+
+def discover_pairs(root_dir: str) -> List[StatementPair]:
+    """
+    Percorre a árvore de diretórios e forma um par para cada diretório com exatamente um
+    extrato do Banco e um da Britech. O nome da carteira é o caminho relativo do diretório.
+    """
+    pairs = []
+    for dir_path, _, files in sorted(os.walk(root_dir)):
+        banco = fnmatch.filter(files, BANCO_PATTERN)
+        britech = fnmatch.filter(files, BRITECH_PATTERN)
+        if not banco and not britech:
+            continue
+        if len(banco) != 1 or len(britech) != 1:
+            logger.warning("[Lote] Diretório ignorado, pares ambíguos ou incompletos: %s (Banco=%d, Britech=%d)", dir_path, len(banco), len(britech))
+            continue
+
+        carteira = os.path.relpath(dir_path, root_dir)
+        carteira = os.path.basename(os.path.abspath(root_dir)) if carteira == '.' else carteira
+        pairs.append(StatementPair(carteira, os.path.join(dir_path, banco[0]), os.path.join(dir_path, britech[0])))
+    return pairs
+
+
+def read_manifest(manifest_path: str) -> List[StatementPair]:
+    """ Lê um manifesto CSV com as colunas `carteira,banco,britech` (caminhos relativos ao manifesto). """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline='', encoding='utf-8') as f:
+        return [
+            StatementPair(
+                row['carteira'].strip(),
+                os.path.join(base_dir, row['banco'].strip()),
+                os.path.join(base_dir, row['britech'].strip()),
+            )
+            for row in csv.DictReader(f)
+        ]
+
+
+def write_checker_reports(checker: ConsistencyChecker, output_dir: str, formats: Sequence[str] = ('excel',)) -> Dict:
+    """
+    Grava os relatórios de uma conciliação em `output_dir` (os opcionais só quando têm linhas)
+    e retorna as contagens usadas nos resumos.
+    """
+    df_completo = checker.get_comparison_dataframe()
+    relatorios = [
+        (df_completo, OUTPUT_FILE_TOTAL, 'Comparacao_Completa', 'CONCILIADOS'),
+        (checker.get_inconsistent_dataframe(), OUTPUT_FILE_INCONSISTENT, 'Inconsistencias', 'INCONSISTENCIAS'),
+        (checker.get_banco_only_dataframe(), OUTPUT_FILE_BANCO_ONLY, 'Somente_Banco', 'SOMENTE_BANCO'),
+        (checker.get_britech_only_dataframe(), OUTPUT_FILE_BRITECH_ONLY, 'Somente_Britech', 'SOMENTE_BRITECH'),
+        (checker.get_quarantine_dataframe(), OUTPUT_FILE_QUARANTINE, 'Quarentena', 'QUARENTENA'),
+    ]
+    os.makedirs(output_dir, exist_ok=True)
+    sinks = build_sinks(formats)
+    contagens = {}
+    for df, nome, aba, coluna in relatorios:
+        if df is df_completo or not df.empty:
+            write_report(df, os.path.join(output_dir, nome), aba, sinks)
+        contagens[coluna] = len(df)
+    return contagens
+
+
+def reconcile_pair(pair: StatementPair, output_dir: str, cache_dir: Optional[str] = None,
+                   formats: Sequence[str] = ('excel',), nearest: Optional[NearestMatcher] = None,
+                   duplicates: str = 'raise', rules: Optional[RuleEngine] = None) -> Dict:
+    """
+    Executa o fluxo DataCleaner -> ConsistencyChecker -> write_report para um par de extratos.
+    Nunca propaga exceções: falhas são registradas no resumo da carteira.
+    """
+    inicio = time.perf_counter()
+    resumo = {
+        'CARTEIRA': pair.carteira, 'STATUS': 'OK', 'LINHAS_BANCO': 0, 'LINHAS_BRITECH': 0,
+        'CONCILIADOS': 0, 'TAXA_CONCILIACAO': 0.0, 'INCONSISTENCIAS': 0, 'SOMENTE_BANCO': 0, 'SOMENTE_BRITECH': 0,
+        'QUARENTENA': 0, 'ERRO': '',
+    }
+    with log_context(carteira=pair.carteira):
+        try:
+            cache = PreparedFrameCache(cache_dir) if cache_dir else None
+            df_banco = DataCleaner(pair.banco_file, COLUNAS_BANCO, cache=cache).prepare_banco_data()
+            df_britech = DataCleaner(pair.britech_file, COLUNAS_BRITECH, cache=cache).prepare_britech_data()
+
+            checker = ConsistencyChecker(df_banco, df_britech, nearest=nearest, duplicates=duplicates, rules=rules)
+            resumo.update(write_checker_reports(checker, os.path.join(output_dir, pair.carteira), formats))
+            resumo.update({
+                'LINHAS_BANCO': len(df_banco),
+                'LINHAS_BRITECH': len(df_britech),
+                'TAXA_CONCILIACAO': resumo['CONCILIADOS'] / len(df_banco) if len(df_banco) else 0.0,
+            })
+        except Exception as e:
+            logger.error("[Lote] Falha na carteira %s: %s", pair.carteira, e, exc_info=True)
+            resumo.update({'STATUS': 'ERRO', 'ERRO': str(e)})
+
+    resumo['DURACAO_S'] = time.perf_counter() - inicio
+    return resumo
+
+
+def run_batch(pairs: List[StatementPair], output_dir: str, workers: Optional[int] = None,
+              cache_dir: Optional[str] = None, formats: Sequence[str] = ('excel',),
+              nearest: Optional[NearestMatcher] = None, duplicates: str = 'raise',
+              rules: Optional[RuleEngine] = None) -> pd.DataFrame:
+    """
+    Concilia todos os pares em um pool de processos e grava o resumo consolidado em `output_dir`.
+    A falha de uma carteira (inclusive a queda de um processo) não interrompe as demais.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    resumos = []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_process_logging,
+                             initargs=process_logging_args()) as executor:
+        futures = {executor.submit(reconcile_pair, pair, output_dir, cache_dir, formats, nearest, duplicates, rules): pair for pair in pairs}
+        for future in as_completed(futures):
+            pair = futures[future]
+            try:
+                resumo = future.result()
+            except Exception as e:
+                logger.error("[Lote] Processo da carteira %s falhou: %s", pair.carteira, e)
+                resumo = {'CARTEIRA': pair.carteira, 'STATUS': 'ERRO', 'ERRO': str(e)}
+            logger.info("[Lote] %s: %s (%d/%d)", pair.carteira, resumo['STATUS'], len(resumos) + 1, len(pairs))
+            resumos.append(resumo)
+
+    df_resumo = pd.DataFrame(resumos, columns=[
+        'CARTEIRA', 'STATUS', 'LINHAS_BANCO', 'LINHAS_BRITECH', 'CONCILIADOS',
+        'TAXA_CONCILIACAO', 'INCONSISTENCIAS', 'SOMENTE_BANCO', 'SOMENTE_BRITECH', 'QUARENTENA', 'DURACAO_S', 'ERRO',
+    ]).sort_values('CARTEIRA').reset_index(drop=True)
+
+    save_to_excel(df_resumo, os.path.join(output_dir, SUMMARY_FILE), 'Resumo_Lote')
+    falhas = int((df_resumo['STATUS'] == 'ERRO').sum())
+    logger.info("[Lote] Concluído: %d carteiras conciliadas, %d com erro, %d inconsistências no total",
+                len(df_resumo) - falhas, falhas, int(df_resumo['INCONSISTENCIAS'].fillna(0).sum()))
+    return df_resumo
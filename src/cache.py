@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.schema import text_dtype
+from src.settings import DEFAULT_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+_META_FILE = 'meta.json'
+
+
+def file_sha256(file_path: str) -> str:
+    """ Hash do conteúdo do arquivo, lido em blocos para não carregar o arquivo inteiro em memória. """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _save_column(series: pd.Series, path: str) -> str:
+    """ Grava uma coluna; category e Int64 (esquema compacto) são gravados em partes e os textos do Arrow, como objetos. """
+    if isinstance(series.dtype, pd.ArrowDtype):
+        np.save(f'{path}.npy', series.to_numpy(dtype=object, na_value=None), allow_pickle=True)
+        return 'text'
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        np.save(f'{path}.npy', series.cat.codes.to_numpy())
+        np.save(f'{path}.categories.npy', series.cat.categories.to_numpy(), allow_pickle=True)
+        return 'category'
+    if series.dtype == 'Int64':
+        np.save(f'{path}.npy', series.to_numpy(dtype=np.int64, na_value=0))
+        np.save(f'{path}.mask.npy', series.isna().to_numpy())
+        return 'Int64'
+    np.save(f'{path}.npy', series.to_numpy(), allow_pickle=True)
+    return 'numpy'
+
+
+def _load_column(path: str, kind: str):
+    values = np.load(f'{path}.npy', allow_pickle=True)
+    if kind == 'category':
+        categories = np.load(f'{path}.categories.npy', allow_pickle=True)
+        return pd.Categorical.from_codes(values, categories=categories)
+    if kind == 'Int64':
+        return pd.arrays.IntegerArray(values, np.load(f'{path}.mask.npy'))
+    if kind == 'text':
+        return pd.array(values, dtype=text_dtype())
+    return values
+
+
+def save_frame(df: pd.DataFrame, dir_path: str) -> None:
+    """
+    Grava o DataFrame em `dir_path` de forma atômica: um `.npy` por coluna (mais as categorias
+    ou a máscara de nulos, nas colunas category e Int64), um para o índice e um `meta.json`
+    com a ordem e o tipo das colunas.
+    """
+    parent = os.path.dirname(os.path.abspath(dir_path))
+    tmp_dir = tempfile.mkdtemp(prefix=f'.{os.path.basename(dir_path)[:12]}-', dir=parent)
+    try:
+        kinds = [_save_column(df[col], os.path.join(tmp_dir, str(i))) for i, col in enumerate(df.columns)]
+        np.save(os.path.join(tmp_dir, 'index.npy'), df.index.to_numpy(), allow_pickle=True)
+        with open(os.path.join(tmp_dir, _META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'columns': list(df.columns), 'kinds': kinds}, f)
+
+        shutil.rmtree(dir_path, ignore_errors=True)
+        os.replace(tmp_dir, dir_path)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def load_frame(dir_path: str) -> pd.DataFrame:
+    """ Lê um DataFrame gravado por `save_frame`. """
+    with open(os.path.join(dir_path, _META_FILE), encoding='utf-8') as f:
+        meta = json.load(f)
+    kinds = meta.get('kinds', ['numpy'] * len(meta['columns']))
+    data = {
+        col: _load_column(os.path.join(dir_path, str(i)), kind)
+        for i, (col, kind) in enumerate(zip(meta['columns'], kinds))
+    }
+    index = np.load(os.path.join(dir_path, 'index.npy'), allow_pickle=True)
+    return pd.DataFrame(data, columns=meta['columns'], index=index)
+
+
+class PreparedFrameCache:
+    """
+    Cache em disco dos DataFrames já preparados pelo `DataCleaner`.
+
+    Cada entrada é um diretório com os arquivos `.npy` de cada coluna (e um para o índice) mais
+    um `meta.json` com a ordem e o tipo das colunas. A chave combina o hash do arquivo de entrada, as colunas
+    exigidas, o tipo de preparação e a versão do código. Quando o tamanho total ultrapassa
+    `max_bytes`, as entradas menos usadas recentemente são removidas.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, file_path: str, required_columns: List[str], kind: str, salt: str) -> str:
+        payload = json.dumps({
+            'file': file_sha256(file_path),
+            'columns': list(required_columns),
+            'kind': kind,
+            'salt': salt,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, _META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+
+        try:
+            df = load_frame(entry_dir)
+        except Exception as e:
+            logger.warning("[Cache] Entrada %s corrompida, descartando: %s", key[:12], e)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+        # Atualiza o mtime para que a evicção remova primeiro as entradas menos usadas
+        os.utime(meta_path)
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        try:
+            save_frame(df, self._entry_dir(key))
+        except Exception as e:
+            logger.warning("[Cache] Não foi possível gravar a entrada %s: %s", key[:12], e)
+            return
+
+        self.evict()
+
+    def _entries(self) -> List[tuple]:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(entry_dir, _META_FILE)
+            if name.startswith('.') or not os.path.exists(meta_path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+            entries.append((os.path.getmtime(meta_path), size, entry_dir))
+        return entries
+
+    def evict(self) -> None:
+        """ Remove as entradas menos usadas recentemente até o cache caber em `max_bytes`. """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            logger.info("[Cache] Entrada removida por limite de tamanho: %s", os.path.basename(entry_dir)[:12])
@@ -1,90 +1,255 @@
+import numpy as np
 import pandas as pd
-from typing import List
+from contextlib import ExitStack
+from itertools import chain, islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import os
 import logging
+
+from src.cache import PreparedFrameCache
+from src.excel_reader import COLUNAS_BANCO, COLUNAS_BRITECH, MAX_ROWS_TO_CHECK, build_dataframe, is_blank_row, open_sheet_rows
+from src.layouts import HeaderMatch, StatementLayout, detect_header, layouts_for, layouts_signature
+from src.keys import dates_from_codes, encode_asset_id_strings, encode_keys, render_asset_ids
+from src.matcher import DEFAULT_STRATEGIES, DuplicateGroupMatcher, KeyStrategy, MultiSourceMatcher, NearestMatcher, SuccessiveMatcher
+from src.numeric import to_numeric_br
+from src.profiling import stage
+from src.rules import RuleEngine
+from src.schema import (QTD_FIXED_DECIMALS, VALUE_FIXED_DECIMALS, abs_difference, compact_frame, concat_frames, expand_columns,
+                        expand_frame, from_fixed)
+from src.settings import DUPLICATE_MODES
+
 # Define a tolerância para a inconsistência de PU
 TOLERANCE = 1e-6
+# Versão da preparação dos dados: incrementar sempre que o resultado de prepare_* mudar,
+# para invalidar as entradas do cache em disco
+PREPARED_CACHE_VERSION = '4'
+# Número mínimo de linhas por bloco na leitura em blocos (modo streaming)
+MIN_CHUNK_ROWS = 1000
+COLUNAS_ORGANIZADAS_ESQUEMA = [
+    'ASSET_ID', 'TIPO_ID_USADO', 'DIST_DIAS', 'DIST_QTD', 'STATUS_INCONSISTENCIA', 'REGRA_INCONSISTENCIA', 'VALOR_DIF_REAL', 'PU_DIFF_VALOR', 'PU_DIFF_PERC', 'CODIGO_BANCO', 'CODIGO_BRITECH', 
+    'APLICACAO_DATA_BANCO', 'VENCIMENTO_DATA_BANCO', 'QTD_BANCO', 'VALOR_BRUTO_BANCO', 'PU_BANCO',
+    'OPERACAO_DATA_BRITECH', 'VENCIMENTO_DATA_BRITECH', 'QTD_BRITECH', 'VALOR_BRUTO_BRITECH', 'PU_BRITECH', 'PU_DIFF'
+]
+# Colunas da decisão de inconsistência, preenchidas pelas regras depois das demais
+COLUNAS_STATUS = ['STATUS_INCONSISTENCIA', 'REGRA_INCONSISTENCIA']
+# Colunas dos pares conciliados, antes das colunas derivadas da comparação
+COLUNAS_PARES = [
+    'ASSET_ID', 'TIPO_ID_USADO', 'DIST_DIAS', 'DIST_QTD',
+    'CODIGO_BANCO', 'APLICACAO_DATA_BANCO', 'VENCIMENTO_DATA_BANCO',
+    'QTD_BANCO', 'PU_BANCO', 'VALOR_BRUTO_BANCO',
+    'CODIGO_BRITECH', 'OPERACAO_DATA_BRITECH', 'VENCIMENTO_DATA_BRITECH',
+    'QTD_BRITECH', 'PU_BRITECH', 'VALOR_BRUTO_BRITECH'
+]
+# Colunas dos relatórios de posições sem par (somente no Banco / somente na Britech)
+COLUNAS_SOMENTE_BANCO = ['CODIGO_BANCO', 'APLICACAO_DATA_BANCO', 'VENCIMENTO_DATA_BANCO', 'QTD_BANCO', 'VALOR_BRUTO_BANCO', 'PU_BANCO']
+COLUNAS_SOMENTE_BRITECH = ['CODIGO_BRITECH', 'OPERACAO_DATA_BRITECH', 'VENCIMENTO_DATA_BRITECH', 'QTD_BRITECH', 'VALOR_BRUTO_BRITECH', 'PU_BRITECH']
+# Colunas do relatório de quarentena, com as linhas dos dois lados (na ordem de COLUNAS_SOMENTE_*)
+COLUNAS_QUARENTENA = ['LADO', 'CODIGO', 'APLICACAO_DATA', 'VENCIMENTO_DATA', 'QTD', 'VALOR_BRUTO', 'PU']
 logger = logging.getLogger(__name__) # Obtém o logger configurado no main.py
 
+
+def _to_datetime(values: pd.Series) -> pd.Series:
+    """
+    `pd.to_datetime(errors='coerce')` aplicado só aos valores distintos: as datas em texto se repetem
+    muito nos extratos, e o parse linha a linha dominava a preparação. O formato é inferido do primeiro
+    valor não nulo, como no parse da coluna inteira.
+    """
+    if pd.api.types.is_datetime64_dtype(values):
+        return values
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), errors='coerce').to_numpy()
+    # O código -1 (valor nulo) pega o NaT acrescentado no fim
+    return pd.Series(np.append(parsed, np.datetime64('NaT'))[codes], index=values.index, name=values.name)
+
 # --- CLASSE DATACLEANER ---
 class DataCleaner:
     """
     Responsável por carregar, localizar o cabeçalho e limpar os dados de entrada.
+
+    Com um `cache` configurado (ou `lazy=True`), o arquivo só é lido quando `df` é acessado;
+    com cache, apenas quando não há uma versão já preparada em disco.
+
+    O cabeçalho é procurado entre os `layouts` informados ou, por padrão, entre os layouts do
+    registro que entregam as `required_columns` (`src/layouts.py`). O layout detectado fica em
+    `header_match`, e as colunas do arquivo são renomeadas para os nomes canônicos na leitura.
     """
-    def __init__(self, file_path: str, required_columns: List[str]):
+    cache: Optional[PreparedFrameCache] = None
+    layouts: Optional[List[StatementLayout]] = None
+    header_match: Optional[HeaderMatch] = None
+    _df: Optional[pd.DataFrame] = None
+
+    def __init__(self, file_path: str, required_columns: List[str], cache: Optional[PreparedFrameCache] = None,
+                 lazy: bool = False, layouts: Optional[List[StatementLayout]] = None):
         self.file_path = file_path
         self.required_columns = [col.strip() for col in required_columns] 
-        self.df = self._load_data()
-        
-                
-    def _find_header_row(self) -> int:
-        MAX_ROWS_TO_CHECK = 50 
+        self.cache = cache
+        self.layouts = layouts if layouts is not None else layouts_for(self.required_columns)
+        if cache is None and not lazy:
+            self.df = self._load_data()
+
+    @property
+    def df(self) -> pd.DataFrame:
+        # Com cache, o Excel só é carregado se a preparação precisar ser refeita
+        if self._df is None:
+            self._df = self._load_data()
+        return self._df
+
+    @df.setter
+    def df(self, value: pd.DataFrame):
+        self._df = value
+
+    def _cached(self, kind: str, prepare: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        with stage(f'preparacao.{kind}', arquivo=self.file_path.split(os.sep)[-1]) as etapa:
+            df = self._cached_prepare(kind, prepare, etapa)
+            etapa['linhas_saida'] = len(df)
+        return df
+
+    def _cached_prepare(self, kind: str, prepare: Callable[[], pd.DataFrame], etapa: dict) -> pd.DataFrame:
+        if self.cache is None:
+            return prepare()
+
+        file_name = self.file_path.split(os.sep)[-1]
+        # Os layouts entram na chave: um apelido novo pode mudar as colunas usadas do mesmo arquivo
+        key = self.cache.make_key(self.file_path, self.required_columns, kind,
+                                  f'{PREPARED_CACHE_VERSION}:{layouts_signature(self.layouts)}')
+        df = self.cache.get(key)
+        etapa['cache'] = df is not None
+        if df is not None:
+            logger.info("[%s] Dados preparados carregados do cache. Ativos válidos para conciliação: %d", file_name, len(df))
+            return df
+
+        df = prepare()
+        self.cache.put(key, df)
+        return df
+
+    def _open_preview(self, stack: ExitStack) -> Tuple[List[tuple], Iterator[tuple]]:
+        """
+        Abre a planilha no `stack` e lê as primeiras linhas, usadas na busca pelo cabeçalho.
+        Retorna as linhas lidas e o iterador posicionado logo após elas.
+        """
         file_name = self.file_path.split(os.sep)[-1]
-        
         try:
-            df_raw = pd.read_excel(self.file_path, header=None, nrows=MAX_ROWS_TO_CHECK)
+            rows = stack.enter_context(open_sheet_rows(self.file_path))
+            return list(islice(rows, MAX_ROWS_TO_CHECK)), rows
         except Exception as e:
-            logger.error(f"[{file_name}] Erro ao tentar pré-carregar as primeiras linhas: {e}", exc_info=True)
+            logger.error("[%s] Erro ao tentar pré-carregar as primeiras linhas: %s", file_name, e, exc_info=True)
             raise Exception(f"Erro ao tentar pré-carregar as primeiras linhas do Excel: {e}")
-        
-        num_rows = len(df_raw)
-        if num_rows == 0: 
-            logger.warning(f"[{file_name}] O arquivo Excel parece estar vazio ou não contém dados válidos.")
+
+    def _find_header_row(self, preview: Optional[List[tuple]] = None) -> int:
+        file_name = self.file_path.split(os.sep)[-1]
+
+        if preview is None:
+            with ExitStack() as stack:
+                preview, _ = self._open_preview(stack)
+
+        if all(is_blank_row(row) for row in preview):
+            logger.warning("[%s] O arquivo Excel parece estar vazio ou não contém dados válidos.", file_name)
             raise ValueError("O arquivo Excel parece estar vazio ou não contém dados válidos.")
-            
-        for i in range(num_rows):
-            current_header = df_raw.iloc[i].astype(str).str.strip().tolist()
-            if all(col in current_header for col in self.required_columns): 
-                logger.info(f"[{file_name}] Cabeçalho encontrado no índice de linha {i}.")
-                return i
-                
-        logger.warning(f"[{file_name}] A linha de cabeçalho não foi encontrada nas {MAX_ROWS_TO_CHECK} linhas inspecionadas.")
+
+        self.header_match = detect_header(preview, self.layouts)
+        if self.header_match is not None:
+            logger.info("[%s] Cabeçalho encontrado no índice de linha %d (layout '%s').", file_name, self.header_match.row, self.header_match.layout.name)
+            return self.header_match.row
+
+        logger.warning("[%s] A linha de cabeçalho não foi encontrada nas %d linhas inspecionadas.", file_name, MAX_ROWS_TO_CHECK)
         return -1
 
     def _load_data(self) -> pd.DataFrame:
+        """
+        Carrega o arquivo em uma única passada: o workbook é aberto uma vez em modo read-only,
+        o cabeçalho é localizado nas primeiras linhas e o restante é lido do mesmo iterador.
+        """
         file_name = self.file_path.split(os.sep)[-1]
         try:
-            header_index = self._find_header_row()
-            if header_index == -1: 
-                raise ValueError(f"A linha de cabeçalho não foi encontrada nas 50 linhas inspecionadas. Colunas necessárias: {self.required_columns}")
-            
-            df = pd.read_excel(self.file_path, header=header_index)
-            df.columns = df.columns.str.strip()
-            logger.info(f"[{file_name}] Dados carregados com sucesso (header index: {header_index}). Total de linhas brutas: {len(df)}")
+            with ExitStack() as stack:
+                with stage('carga.cabecalho', arquivo=file_name):
+                    preview, rows = self._open_preview(stack)
+                    header_index = self._find_header_row(preview)
+                if header_index == -1:
+                    raise ValueError(f"A linha de cabeçalho não foi encontrada nas {MAX_ROWS_TO_CHECK} linhas inspecionadas. Colunas necessárias: {self.required_columns}")
+
+                with stage('carga.leitura', arquivo=file_name) as etapa:
+                    df = build_dataframe(preview[header_index], chain(preview[header_index + 1:], rows))
+                    etapa['linhas_saida'] = len(df)
+
+            df = self._canonical_columns(df)
+            logger.info("[%s] Dados carregados com sucesso (header index: %d). Total de linhas brutas: %d", file_name, header_index, len(df))
             return df
         except Exception as e:
-            logger.error(f"[{file_name}] Erro ao carregar e processar o arquivo: {e}", exc_info=True)
+            logger.error("[%s] Erro ao carregar e processar o arquivo: %s", file_name, e, exc_info=True)
             raise Exception(f"Erro ao carregar e processar o arquivo: {e}")
 
+    def _canonical_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """ Remove os espaços dos nomes das colunas e aplica o mapeamento do layout detectado. """
+        df.columns = df.columns.str.strip()
+        renomear = {header: col for header, col in self.header_match.mapping.items() if header != col}
+        return df.rename(columns=renomear) if renomear else df
+
+    def iter_prepared_chunks(self, kind: str, chunk_bytes: int) -> Iterator[pd.DataFrame]:
+        """
+        Lê o arquivo em blocos de linhas e devolve cada bloco já preparado (`kind` = 'banco' ou 'britech').
+        O tamanho dos blocos é ajustado para que cada bloco bruto ocupe cerca de `chunk_bytes` em memória.
+        """
+        prepare = {'banco': self._prepare_banco_data, 'britech': self._prepare_britech_data}[kind]
+        file_name = self.file_path.split(os.sep)[-1]
+
+        with ExitStack() as stack:
+            preview, rows = self._open_preview(stack)
+            header_index = self._find_header_row(preview)
+            if header_index == -1:
+                raise ValueError(f"A linha de cabeçalho não foi encontrada nas {MAX_ROWS_TO_CHECK} linhas inspecionadas. Colunas necessárias: {self.required_columns}")
+
+            header = preview[header_index]
+            data = chain(preview[header_index + 1:], rows)
+            chunk_rows, offset = MIN_CHUNK_ROWS, 0
+            while True:
+                batch = list(islice(data, chunk_rows))
+                if not batch:
+                    break
+
+                df = self._canonical_columns(build_dataframe(header, batch))
+                df.index = pd.RangeIndex(offset, offset + len(df))
+                offset += len(batch)
+
+                # As tuplas lidas e o DataFrame bruto coexistem durante a conversão
+                row_bytes = 2 * df.memory_usage(deep=True).sum() / max(len(df), 1)
+                chunk_rows = max(MIN_CHUNK_ROWS, int(chunk_bytes // max(row_bytes, 1)))
+                del batch
+
+                self.df = df
+                yield prepare()
+
+        self.df = None
+        logger.info("[%s] Leitura em blocos finalizada. Total de linhas brutas: %d", file_name, offset)
+
     def prepare_banco_data(self) -> pd.DataFrame:
         """ Prepara os dados do Banco, cria as chaves de conciliação VENCIMENTO e APLICACAO. """
+        return self._cached('banco', self._prepare_banco_data)
+
+    def _prepare_banco_data(self) -> pd.DataFrame:
         COL_VALOR_BRUTO, COL_CODIGO, COL_APLICACAO, COL_QTD, COL_PU, COL_VENCIMENTO = 'Valor Bruto','Código', 'Aplicação', 'Qtd.', 'PU Atual', 'Vcto.' 
         COLUNAS_BANCO_MANTER = [COL_VALOR_BRUTO, COL_CODIGO, COL_APLICACAO, COL_QTD, COL_PU, COL_VENCIMENTO]
         
         try: df_banco = self.df[COLUNAS_BANCO_MANTER].copy()
         except KeyError as e: 
-            logger.error(f"[Banco] Erro de Coluna (KeyError): {e}", exc_info=True)
+            logger.error("[Banco] Erro de Coluna (KeyError): %s", e, exc_info=True)
             raise KeyError(f"Erro de Coluna no Extrato do Banco: {e}")
 
         # Conversão de Tipos
-        df_banco[COL_APLICACAO] = pd.to_datetime(df_banco[COL_APLICACAO], errors='coerce')
-        df_banco[COL_VENCIMENTO] = pd.to_datetime(df_banco[COL_VENCIMENTO], errors='coerce')
-        df_banco['PU_BANCO'] = pd.to_numeric(df_banco[COL_PU], errors='coerce')
-        df_banco['QTD_BANCO'] = pd.to_numeric(df_banco[COL_QTD], errors='coerce')
-        df_banco['VALOR_BRUTO_BANCO'] = pd.to_numeric(df_banco[COL_VALOR_BRUTO], errors='coerce')
-
-        # Criação de Chaves
-        df_banco['APLICACAO_PAD'] = df_banco[COL_APLICACAO].dt.strftime('%Y%m%d').fillna('NULL_APL')
-        df_banco['VENCIMENTO_PAD'] = df_banco[COL_VENCIMENTO].dt.strftime('%Y%m%d').fillna('NULL_VENC')
-        df_banco['QTD_STR'] = df_banco[COL_QTD].astype(str).str.replace(r'\.0+$', '', regex=True).str.strip() 
-        
-        df_banco['ASSET_ID_VENC'] = df_banco['VENCIMENTO_PAD'] + '_' + df_banco['QTD_STR']
-        df_banco['ASSET_ID_APL'] = df_banco['APLICACAO_PAD'] + '_' + df_banco['QTD_STR']
+        df_banco[COL_APLICACAO] = _to_datetime(df_banco[COL_APLICACAO])
+        df_banco[COL_VENCIMENTO] = _to_datetime(df_banco[COL_VENCIMENTO])
+        # Valores numéricos passam direto; textos no padrão brasileiro ('R$ 1.234,56') são convertidos
+        df_banco['PU_BANCO'] = to_numeric_br(df_banco[COL_PU], 'Banco')
+        df_banco['QTD_BANCO'] = to_numeric_br(df_banco[COL_QTD], 'Banco')
+        df_banco['VALOR_BRUTO_BANCO'] = to_numeric_br(df_banco[COL_VALOR_BRUTO], 'Banco')
+
+        # Criação de Chaves (int64: data em dias + quantidade em ponto fixo)
+        with stage('preparacao.chaves', rows_in=len(df_banco)):
+            df_banco['KEY_VENC'] = encode_keys(df_banco[COL_VENCIMENTO], df_banco['QTD_BANCO'])
+            df_banco['KEY_APL'] = encode_keys(df_banco[COL_APLICACAO], df_banco['QTD_BANCO'])
         
         # Definição de Prioridade de Chave
-        df_banco['ASSET_ID'] = df_banco['ASSET_ID_VENC']
-        df_banco['TIPO_ID_USADO'] = 'VENCIMENTO'
-        df_banco.loc[df_banco['ASSET_ID'].str.contains('NULL_VENC', na=False), 'TIPO_ID_USADO'] = 'APLICACAO'
+        df_banco['TIPO_ID_USADO'] = np.where(df_banco[COL_VENCIMENTO].isna(), 'APLICACAO', 'VENCIMENTO')
         
         # Finalização e Renomeação
         df_banco.rename(columns={
@@ -93,42 +258,43 @@ class DataCleaner:
             COL_VENCIMENTO: 'VENCIMENTO_DATA_BANCO'
         }, inplace=True)
         
-        COLS_DROP = ['APLICACAO_PAD', 'QTD_STR', 'VENCIMENTO_PAD', COL_PU, COL_QTD]
+        COLS_DROP = [COL_PU, COL_QTD, COL_VALOR_BRUTO]
         COLUNAS_SAIDA = [col for col in df_banco.columns if col not in COLS_DROP]
         
-        df_final = df_banco.dropna(subset=['PU_BANCO'])[COLUNAS_SAIDA].copy()
-        logger.info(f"[Banco] Preparação de dados finalizada. Ativos válidos para conciliação: {len(df_final)}")
+        # Esquema compacto (códigos em category, datas em dias, quantidades e valores em ponto fixo)
+        df_final = compact_frame(df_banco.dropna(subset=['PU_BANCO'])[COLUNAS_SAIDA])
+        logger.info("[Banco] Preparação de dados finalizada. Ativos válidos para conciliação: %d", len(df_final))
         return df_final
 
 
     def prepare_britech_data(self) -> pd.DataFrame:
         """ Prepara os dados da Britech, cria as chaves de conciliação VENCIMENTO e APLICACAO. """
+        return self._cached('britech', self._prepare_britech_data)
+
+    def _prepare_britech_data(self) -> pd.DataFrame:
         COL_DESC, COL_OPERACAO, COL_VALOR, COL_QTD, COL_VENCIMENTO = 'DESCRIÇÃO', 'DATA OPERAÇÃO', 'VALOR BRUTO', 'QUANTIDADE', 'DATA VENCIMENTO' 
         COLUNAS_BRITECH_MANTER = [COL_DESC, COL_OPERACAO, COL_VALOR, COL_QTD, COL_VENCIMENTO]
         
         try: df_britech = self.df[COLUNAS_BRITECH_MANTER].copy()
         except KeyError as e: 
-            logger.error(f"[Britech] Erro de Coluna (KeyError): {e}", exc_info=True)
+            logger.error("[Britech] Erro de Coluna (KeyError): %s", e, exc_info=True)
             raise KeyError(f"Erro de Coluna no Extrato da Britech: {e}")
             
         # Conversão e Limpeza de Dados
-        df_britech[COL_OPERACAO] = pd.to_datetime(df_britech[COL_OPERACAO], errors='coerce')
-        df_britech[COL_VENCIMENTO] = pd.to_datetime(df_britech[COL_VENCIMENTO], errors='coerce')
+        df_britech[COL_OPERACAO] = _to_datetime(df_britech[COL_OPERACAO])
+        df_britech[COL_VENCIMENTO] = _to_datetime(df_britech[COL_VENCIMENTO])
         
-        # Remoção de R$ e Substituição de vírgula por ponto para conversão numérica
-        df_britech[COL_VALOR] = pd.to_numeric(df_britech[COL_VALOR].astype(str).str.replace(r'[R$]', '', regex=True).str.replace(',', '.', regex=False), errors='coerce')
-        df_britech[COL_QTD] = pd.to_numeric(df_britech[COL_QTD], errors='coerce')
+        # Conversão numérica no padrão brasileiro ('R$ 1.234,56'), sem passar as células numéricas por texto
+        df_britech[COL_VALOR] = to_numeric_br(df_britech[COL_VALOR], 'Britech')
+        df_britech[COL_QTD] = to_numeric_br(df_britech[COL_QTD], 'Britech')
         
         # Filtro de linhas inválidas (QTD e Valor nulos/zero)
         df_britech = df_britech[(df_britech[COL_QTD].notna()) & (df_britech[COL_QTD] != 0) & (df_britech[COL_VALOR].notna())].copy()
 
-        # Criação de Chaves
-        df_britech['APLICACAO_PAD'] = df_britech[COL_OPERACAO].dt.strftime('%Y%m%d').fillna('NULL_APL')
-        df_britech['VENCIMENTO_PAD'] = df_britech[COL_VENCIMENTO].dt.strftime('%Y%m%d').fillna('NULL_VENC')
-        df_britech['QTD_STR'] = df_britech[COL_QTD].astype(str).str.replace(r'\.0+$', '', regex=True).str.strip()
-        
-        df_britech['ASSET_ID_VENC'] = df_britech['VENCIMENTO_PAD'] + '_' + df_britech['QTD_STR']
-        df_britech['ASSET_ID_APL'] = df_britech['APLICACAO_PAD'] + '_' + df_britech['QTD_STR']
+        # Criação de Chaves (int64: data em dias + quantidade em ponto fixo)
+        with stage('preparacao.chaves', rows_in=len(df_britech)):
+            df_britech['KEY_VENC'] = encode_keys(df_britech[COL_VENCIMENTO], df_britech[COL_QTD])
+            df_britech['KEY_APL'] = encode_keys(df_britech[COL_OPERACAO], df_britech[COL_QTD])
 
         # Cálculo do PU (Preço Unitário)
         df_britech['PU_BRITECH'] = df_britech[COL_VALOR] / df_britech[COL_QTD]
@@ -142,135 +308,516 @@ class DataCleaner:
             COL_QTD: 'QTD_BRITECH'
         }, inplace=True)
         
-        COLS_DROP = ['APLICACAO_PAD', 'QTD_STR', 'VENCIMENTO_PAD']
-        COLUNAS_SAIDA = [col for col in df_britech.columns if col not in COLS_DROP]
-        
-        df_final = df_britech[COLUNAS_SAIDA].copy()
-        logger.info(f"[Britech] Preparação de dados finalizada. Ativos válidos para conciliação: {len(df_final)}")
+        df_final = compact_frame(df_britech)
+        logger.info("[Britech] Preparação de dados finalizada. Ativos válidos para conciliação: %d", len(df_final))
         return df_final
 
 
+# --- PARES CONCILIADOS E COMPARAÇÃO ---
+def build_pairs_frame(df_banco: pd.DataFrame, df_britech: pd.DataFrame, banco_pos: np.ndarray, britech_pos: np.ndarray,
+                      strategy_idx: np.ndarray, dist_dias: np.ndarray, dist_qtd: np.ndarray,
+                      estrategias: List) -> pd.DataFrame:
+    """
+    Monta o DataFrame dos pares conciliados (`COLUNAS_PARES`, esquema compacto) a partir das posições
+    de cada lado e do índice da estratégia usada em `estrategias`.
+    """
+    cols_banco = [col for col in COLUNAS_PARES if col in df_banco.columns]
+    cols_britech = [col for col in COLUNAS_PARES if col in df_britech.columns and col not in cols_banco]
+    df_final = pd.concat([
+        df_banco[cols_banco].take(banco_pos).reset_index(drop=True),
+        df_britech[cols_britech].take(britech_pos).reset_index(drop=True),
+    ], axis=1)
+
+    if df_final.empty:
+        return df_final.reindex(columns=COLUNAS_PARES)
+
+    nomes = [s.name for s in estrategias]
+    df_final['TIPO_ID_USADO'] = pd.Categorical.from_codes(strategy_idx, categories=nomes)
+    df_final['DIST_DIAS'] = dist_dias.astype(np.int32)
+    df_final['DIST_QTD'] = pd.array(dist_qtd, dtype='Int64')
+
+    # O ASSET_ID legível só é gerado para as linhas conciliadas (datas em código de dias no esquema compacto)
+    codigo_data = np.zeros(len(df_final), dtype=np.int64)
+    for i, strategy in enumerate(estrategias):
+        usa_estrategia = strategy_idx == i
+        codigo_data[usa_estrategia] = df_final[strategy.date_column].to_numpy()[usa_estrategia]
+    data_chave = pd.Series(dates_from_codes(codigo_data), index=df_final.index)
+    null_labels = {s.name: s.null_label for s in estrategias}
+    df_final['ASSET_ID'] = render_asset_ids(
+        data_chave, from_fixed(df_final['QTD_BANCO'], QTD_FIXED_DECIMALS), df_final['TIPO_ID_USADO'].astype(object), null_labels
+    )
+
+    return compact_frame(df_final.reindex(columns=COLUNAS_PARES))
+
+
+def derive_comparison_columns(df: pd.DataFrame, rules: RuleEngine) -> pd.DataFrame:
+    """
+    Cria o DataFrame de comparação com cálculo de diferenças de PU e Valor, e decide a inconsistência
+    de cada linha pelas `rules` (STATUS_INCONSISTENCIA e a regra que disparou, REGRA_INCONSISTENCIA).
+    `df` (os pares no esquema compacto) não é alterado.
+    """
+    pu_banco = df['PU_BANCO'].to_numpy(dtype=np.float64, na_value=np.nan)
+    pu_britech = df['PU_BRITECH'].to_numpy(dtype=np.float64, na_value=np.nan)
+    pu_diff = pu_banco - pu_britech
+    pu_diff_valor = np.abs(pu_diff)
+    calculadas = {
+        'PU_DIFF': pu_diff,
+        'PU_DIFF_VALOR': pu_diff_valor,
+        # Adicionamos 1e-12 ao divisor para evitar divisão por zero, caso PU_BRITECH seja zero
+        'PU_DIFF_PERC': pu_diff_valor / (np.abs(pu_britech) + 1e-12),
+        # Diferença exata em ponto fixo
+        'VALOR_DIF_REAL': abs_difference(df['VALOR_BRUTO_BANCO'], df['VALOR_BRUTO_BRITECH'], VALUE_FIXED_DECIMALS).to_numpy(),
+    }
+
+    # O relatório volta aos tipos originais (datas, float64, textos) e é montado uma única vez, já com
+    # o status. As regras são avaliadas sobre os valores do relatório (valores brutos e quantidades em
+    # reais, não em ponto fixo)
+    colunas = expand_columns(df, [col for col in COLUNAS_ORGANIZADAS_ESQUEMA if col not in COLUNAS_STATUS], calculadas)
+    colunas['STATUS_INCONSISTENCIA'], colunas['REGRA_INCONSISTENCIA'] = rules.evaluate(colunas)
+    return pd.DataFrame({col: colunas[col] for col in COLUNAS_ORGANIZADAS_ESQUEMA}, index=df.index)
+
+
 # --- CLASSE CONSISTENCYCHECKER ---
 class ConsistencyChecker:
     """
     Responsável por unir os dados e identificar as inconsistências, usando as 2 chaves de conciliação.
+    Com `nearest`, as linhas que sobram da conciliação exata passam pela conciliação aproximada.
+    Com `duplicates='group'`, chaves duplicadas não interrompem a conciliação: as linhas são
+    desempatadas pelo `DuplicateGroupMatcher` e as que continuam ambíguas vão para a quarentena.
+    Com `britech_matcher`, o índice hash já construído sobre o mesmo `df_britech` (e as mesmas
+    estratégias) é reaproveitado, em vez de reconstruído a cada conciliação; `df_britech` deve então
+    ser o DataFrame já normalizado por `normalize_input` sobre o qual o índice foi construído (como o
+    do `BritechSnapshot`), e é usado como está. Com `rules`, a
+    inconsistência é decidida pelas regras (`src/rules.py`) em vez da tolerância global `tolerance`.
     """
-    def __init__(self, df_banco: pd.DataFrame, df_britech: pd.DataFrame):
+    def __init__(self, df_banco: pd.DataFrame, df_britech: pd.DataFrame, strategies: Optional[List[KeyStrategy]] = None,
+                 tolerance: float = TOLERANCE, nearest: Optional[NearestMatcher] = None, duplicates: str = 'raise',
+                 britech_matcher: Optional[SuccessiveMatcher] = None, rules: Optional[RuleEngine] = None):
+        if duplicates not in DUPLICATE_MODES:
+            raise ValueError(f"Modo de chaves duplicadas inválido: '{duplicates}'. Use um de {DUPLICATE_MODES}.")
+        self.strategies = list(strategies or DEFAULT_STRATEGIES)
+        self.nearest = nearest
+        self.duplicates = duplicates
+        self.britech_matcher = britech_matcher
+        self._tolerance = tolerance
+        self._rules = rules
+        self.set_inputs(df_banco, df_britech)
+
+    def set_inputs(self, df_banco: pd.DataFrame, df_britech: pd.DataFrame):
+        """ Troca os DataFrames de entrada, refaz a conciliação e descarta os resultados derivados em cache. """
         # AQUI PRECISAMOS REINICIAR OS ÍNDICES SE ELES NÃO TIVEREM SIDO RESETADOS NA PREPARAÇÃO
         # Assumindo que você manteve o reset_index do teste, vamos garantir que o df_banco/df_britech 
         # tenham um índice sequencial para o merge. 
-        self.df_banco = df_banco.reset_index(drop=True)
-        self.df_britech = df_britech.reset_index(drop=True)
-        self._validate_duplicate_keys()
-        self.merged_df = self._merge_data_successive()
+        # DataFrames montados fora do DataCleaner (testes, estado legado) também passam para o esquema compacto
+        self.df_banco = self.normalize_input(df_banco)
+        # Com o índice hash pronto, a Britech já foi normalizada junto com ele: não refaz a cada conciliação
+        self.df_britech = df_britech if self.britech_matcher is not None else self.normalize_input(df_britech)
+        linhas = len(self.df_banco) + len(self.df_britech)
+        with stage('conciliacao.validacao', rows_in=linhas):
+            chaves_duplicadas = self._validate_duplicate_keys()
+        with stage('conciliacao.merge', rows_in=linhas) as etapa:
+            self.merged_df = self._merge_data_successive(chaves_duplicadas)
+            etapa['linhas_saida'] = len(self.merged_df)
+        logger.info(
+            "[Conciliação] Pares conciliados: %d; somente no Banco: %d; somente na Britech: %d",
+            len(self.merged_df), len(self.banco_only_pos), len(self.britech_only_pos),
+        )
+        if len(self.quarantine_banco_pos) or len(self.quarantine_britech_pos):
+            logger.warning(
+                "[Conciliação] Linhas em quarentena por chaves duplicadas: Banco=%d, Britech=%d",
+                len(self.quarantine_banco_pos), len(self.quarantine_britech_pos),
+            )
+        self._invalidate()
+
+    @property
+    def tolerance(self) -> float:
+        return self._tolerance
+
+    @tolerance.setter
+    def tolerance(self, value: float):
+        if value != self._tolerance:
+            self._tolerance = value
+            self._invalidate()
+
+    @property
+    def rules(self) -> RuleEngine:
+        """ Regras de inconsistência; sem regras próprias, a tolerância global sobre a diferença absoluta de PU. """
+        return self._rules if self._rules is not None else RuleEngine.from_tolerance(self._tolerance)
+
+    @rules.setter
+    def rules(self, value: Optional[RuleEngine]):
+        if value is not self._rules:
+            self._rules = value
+            self._invalidate()
+
+    def _invalidate(self):
+        self._comparison: Optional[pd.DataFrame] = None
+        self._sorted_comparison: Optional[pd.DataFrame] = None
     
-    def _validate_duplicate_keys(self):
-        duplicate_found = False
-        for key in ['ASSET_ID_VENC', 'ASSET_ID_APL']:
-            banco_dupes = self.df_banco[self.df_banco.duplicated(subset=[key], keep=False)]
-            britech_dupes = self.df_britech[self.df_britech.duplicated(subset=[key], keep=False)]
-
-            if not banco_dupes.empty or not britech_dupes.empty:
-                duplicate_found = True
-                logger.warning(
-                    f"[Validação] Chaves duplicadas encontradas para {key}: "
-                    f"Banco={len(banco_dupes)}, Britech={len(britech_dupes)}"
-                )
-                raise ValueError("Duplicidade de chave detectada no banco")
+    @staticmethod
+    def normalize_input(df: pd.DataFrame) -> pd.DataFrame:
+        """ Índice sequencial, chaves int64 e esquema compacto: a forma dos DataFrames usados na conciliação. """
+        return compact_frame(ConsistencyChecker._ensure_int_keys(df.reset_index(drop=True)))
 
-            
-        if not duplicate_found:
+    @staticmethod
+    def _ensure_int_keys(df: pd.DataFrame) -> pd.DataFrame:
+        """ Garante as chaves int64; DataFrames com as chaves textuais legadas (ASSET_ID_*) são codificados aqui. """
+        for key, legacy in [('KEY_VENC', 'ASSET_ID_VENC'), ('KEY_APL', 'ASSET_ID_APL')]:
+            if key not in df.columns:
+                df[key] = encode_asset_id_strings(df[legacy])
+        return df
+
+    def _validate_duplicate_keys(self) -> Dict[str, np.ndarray]:
+        """
+        Procura chaves duplicadas em cada coluna de chave dos dois lados. No modo 'raise', a primeira
+        chave com duplicidade interrompe a conciliação; no modo 'group', retorna as chaves duplicadas
+        de cada coluna (em qualquer um dos lados), usadas para separar as linhas ambíguas.
+        """
+        chaves_duplicadas = {}
+        for key in dict.fromkeys(s.key_column for s in self.strategies):
+            banco, banco_linhas = self._sorted_duplicates(self.df_banco[key].to_numpy())
+            britech, britech_linhas = self._sorted_duplicates(self.df_britech[key].to_numpy())
+
+            if banco_linhas or britech_linhas:
+                logger.warning("[Validação] Chaves duplicadas encontradas para %s: Banco=%s, Britech=%s",
+                               key, banco_linhas, britech_linhas)
+                if self.duplicates == 'raise':
+                    raise ValueError("Duplicidade de chave detectada no banco")
+                chaves_duplicadas[key] = np.union1d(banco, britech)
+
+        if not chaves_duplicadas:
             logger.info("[Validação] Nenhuma duplicidade de chaves detectada.")
-    
-    def _merge_data_successive(self) -> pd.DataFrame:
+        return chaves_duplicadas
+
+    @staticmethod
+    def _sorted_duplicates(keys: np.ndarray) -> Tuple[np.ndarray, int]:
         """
-        Merge sucessivo:
+        Chaves repetidas e o número de linhas com elas, em uma passada sobre as chaves ordenadas:
+        a ordenação só dos valores int64 é bem mais barata que o `duplicated` (tabela hash) seguido
+        do filtro das linhas do DataFrame.
+        """
+        ordenadas = np.sort(keys)
+        iguais = ordenadas[1:] == ordenadas[:-1]
+        if not iguais.any():
+            return ordenadas[:0], 0
+        repetidas = np.zeros(len(ordenadas), dtype=bool)
+        repetidas[1:] |= iguais
+        repetidas[:-1] |= iguais
+        return np.unique(ordenadas[1:][iguais]), int(repetidas.sum())
+
+    def _merge_data_successive(self, chaves_duplicadas: Optional[Dict[str, np.ndarray]] = None) -> pd.DataFrame:
+        """
+        Merge sucessivo, resolvido em uma única passada pelo `SuccessiveMatcher`:
         1º Vencimento
         2º Aplicação (fallback)
-        """
+        Outras estratégias podem ser adicionadas à lista `self.strategies`. Por último, se configurada,
+        a conciliação aproximada (`self.nearest`); DIST_DIAS e DIST_QTD guardam a distância do par
+        (zero nos pares exatos).
 
-        df_final = pd.DataFrame()
-        used_asset_ids = set()
+        As linhas com alguma chave em `chaves_duplicadas` ficam fora do índice hash e são conciliadas
+        pelo `DuplicateGroupMatcher`, antes da conciliação aproximada.
 
-        # ---------- 1º MERGE: VENCIMENTO ----------
-        merge_venc = pd.merge(
-            self.df_banco,
-            self.df_britech,
-            on='ASSET_ID_VENC',
-            how='inner',
-            suffixes=('_BANCO', '_BRITECH')
-        )
+        As posições que ficaram sem par em cada lado são guardadas em `banco_only_pos` e
+        `britech_only_pos`, e as ambíguas em `quarantine_banco_pos` e `quarantine_britech_pos`.
+        `matched_banco_pos` guarda a posição no Banco de cada par, na ordem do `merged_df`.
+        """
+        if chaves_duplicadas:
+            banco_pos, britech_pos, strategy_idx = self._match_with_duplicates(chaves_duplicadas)
+        else:
+            matcher = self.britech_matcher or SuccessiveMatcher(self.df_britech, self.strategies)
+            banco_pos, britech_pos, strategy_idx, _ = matcher.match(self.df_banco)
+            self.quarantine_banco_pos = self.quarantine_britech_pos = np.array([], dtype=np.int64)
+        dist_dias = np.zeros(len(banco_pos), dtype=np.int64)
+        dist_qtd = np.zeros(len(banco_pos), dtype=np.int64)
+        estrategias = list(self.strategies)
+        # Linhas em quarentena não voltam a ser conciliadas nem entram nos relatórios de posições sem par
+        banco_pos_usadas = np.concatenate([banco_pos, self.quarantine_banco_pos])
+        britech_pos_usadas = np.concatenate([britech_pos, self.quarantine_britech_pos])
 
-        if not merge_venc.empty:
-            merge_venc['ASSET_ID'] = merge_venc['ASSET_ID_VENC']
-            merge_venc['TIPO_ID_USADO'] = 'VENCIMENTO'
-            used_asset_ids.update(merge_venc['ASSET_ID_VENC'].unique())
-            df_final = merge_venc.copy()
+        if self.nearest is not None:
+            banco_pending = np.ones(len(self.df_banco), dtype=bool)
+            banco_pending[banco_pos_usadas] = False
+            britech_available = np.ones(len(self.df_britech), dtype=bool)
+            britech_available[britech_pos_usadas] = False
+            aprox_banco, aprox_britech, aprox_idx, aprox_dias, aprox_qtd = self.nearest.match(
+                self.df_banco, self.df_britech, banco_pending, britech_available
+            )
+            logger.info("[Conciliação] Pares conciliados por aproximação: %d", len(aprox_banco))
 
-        # ---------- 2º MERGE: APLICAÇÃO (FALLBACK) ----------
-        banco_pending = self.df_banco[
-            ~self.df_banco['ASSET_ID_VENC'].isin(used_asset_ids)
-        ]
+            banco_pos = np.concatenate([banco_pos, aprox_banco])
+            britech_pos = np.concatenate([britech_pos, aprox_britech])
+            banco_pos_usadas = np.concatenate([banco_pos_usadas, aprox_banco])
+            britech_pos_usadas = np.concatenate([britech_pos_usadas, aprox_britech])
+            strategy_idx = np.concatenate([strategy_idx, aprox_idx + len(estrategias)])
+            dist_dias = np.concatenate([dist_dias, aprox_dias])
+            dist_qtd = np.concatenate([dist_qtd, aprox_qtd])
+            estrategias += self.nearest.strategies
 
-        britech_pending = self.df_britech[
-            ~self.df_britech['ASSET_ID_VENC'].isin(used_asset_ids)
-        ]
+        self.matched_banco_pos = banco_pos
+        self.banco_only_pos = self._unmatched_positions(len(self.df_banco), banco_pos_usadas)
+        self.britech_only_pos = self._unmatched_positions(len(self.df_britech), britech_pos_usadas)
 
-        merge_apl = pd.merge(
-            banco_pending,
-            britech_pending,
-            on='ASSET_ID_APL',
-            how='inner',
-            suffixes=('_BANCO', '_BRITECH')
-        )
+        return build_pairs_frame(self.df_banco, self.df_britech, banco_pos, britech_pos, strategy_idx,
+                                 dist_dias, dist_qtd, estrategias)
 
-        if not merge_apl.empty:
-            merge_apl['ASSET_ID'] = merge_apl['ASSET_ID_APL']
-            merge_apl['TIPO_ID_USADO'] = 'APLICACAO'
-            df_final = pd.concat([df_final, merge_apl], ignore_index=True)
-
-        # ---------- LIMPEZA FINAL ----------
-        cols_to_keep = [
-            'ASSET_ID', 'TIPO_ID_USADO',
-            'CODIGO_BANCO', 'APLICACAO_DATA_BANCO', 'VENCIMENTO_DATA_BANCO',
-            'QTD_BANCO', 'PU_BANCO', 'VALOR_BRUTO_BANCO',
-            'CODIGO_BRITECH', 'OPERACAO_DATA_BRITECH', 'VENCIMENTO_DATA_BRITECH',
-            'QTD_BRITECH', 'PU_BRITECH', 'VALOR_BRUTO_BRITECH'
-        ]
+    def _match_with_duplicates(self, chaves_duplicadas: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Conciliação exata das linhas sem chaves duplicadas (índice hash) seguida da conciliação dos
+        grupos; guarda as posições em quarentena de cada lado. Todas as linhas que sobraram do índice
+        participam dos grupos, já que o par de uma linha ambígua pode não ter chave duplicada.
+        """
+        colunas = [s.key_column for s in self.strategies]
+        ambiguas_banco = self._rows_with_keys(self.df_banco, chaves_duplicadas)
+        ambiguas_britech = self._rows_with_keys(self.df_britech, chaves_duplicadas)
+        livres_banco = np.flatnonzero(~ambiguas_banco)
+        livres_britech = np.flatnonzero(~ambiguas_britech)
 
+        matcher = SuccessiveMatcher(self.df_britech[colunas].take(livres_britech), self.strategies)
+        banco_pos, britech_pos, strategy_idx, _ = matcher.match(self.df_banco[colunas].take(livres_banco))
+        banco_pos, britech_pos = livres_banco[banco_pos], livres_britech[britech_pos]
+
+        banco_pending = np.ones(len(self.df_banco), dtype=bool)
+        banco_pending[banco_pos] = False
+        britech_available = np.ones(len(self.df_britech), dtype=bool)
+        britech_available[britech_pos] = False
+        grupo_banco, grupo_britech, grupo_idx, self.quarantine_banco_pos, self.quarantine_britech_pos = (
+            DuplicateGroupMatcher(self.strategies).match(self.df_banco, self.df_britech, banco_pending, britech_available)
+        )
+        logger.info("[Conciliação] Pares conciliados nos grupos de chaves duplicadas: %d", len(grupo_banco))
         return (
-            df_final
-            .reindex(columns=cols_to_keep)
-            .drop_duplicates(subset=['ASSET_ID'])
-            .reset_index(drop=True)
+            np.concatenate([banco_pos, grupo_banco]),
+            np.concatenate([britech_pos, grupo_britech]),
+            np.concatenate([strategy_idx, grupo_idx]),
         )
 
-    def get_comparison_dataframe(self) -> pd.DataFrame:
-        """ Cria o DataFrame de comparação com cálculo de diferenças de PU e Valor. """
-        df = self.merged_df.copy()
-        
-        COLUNAS_ORGANIZADAS_ESQUEMA = [
-            'ASSET_ID', 'TIPO_ID_USADO', 'STATUS_INCONSISTENCIA', 'VALOR_DIF_REAL', 'PU_DIFF_VALOR', 'PU_DIFF_PERC', 'CODIGO_BANCO', 'CODIGO_BRITECH', 
-            'APLICACAO_DATA_BANCO', 'VENCIMENTO_DATA_BANCO', 'QTD_BANCO', 'VALOR_BRUTO_BANCO', 'PU_BANCO',
-            'OPERACAO_DATA_BRITECH', 'VENCIMENTO_DATA_BRITECH', 'QTD_BRITECH', 'VALOR_BRUTO_BRITECH', 'PU_BRITECH', 'PU_DIFF'
-        ]
+    @staticmethod
+    def _rows_with_keys(df: pd.DataFrame, chaves: Dict[str, np.ndarray]) -> np.ndarray:
+        """ Máscara das linhas com alguma das chaves informadas, em qualquer uma das colunas. """
+        mascara = np.zeros(len(df), dtype=bool)
+        for coluna, valores in chaves.items():
+            mascara |= np.isin(df[coluna].to_numpy(), valores)
+        return mascara
+
+    @staticmethod
+    def _unmatched_positions(size: int, matched: np.ndarray) -> np.ndarray:
+        sem_par = np.ones(size, dtype=bool)
+        sem_par[matched] = False
+        return np.flatnonzero(sem_par)
+
+    def _comparison_frame(self) -> pd.DataFrame:
+        """ Colunas derivadas (diferenças, percentual e status), calculadas uma vez e mantidas em cache, sem ordenação. """
+        if self._comparison is not None:
+            return self._comparison
 
-        if df.empty: 
+        if self.merged_df.empty: 
             logger.warning("Nenhum ativo foi conciliado. Retornando DataFrame de comparação vazio.")
-            return pd.DataFrame(columns=COLUNAS_ORGANIZADAS_ESQUEMA)
+            self._comparison = pd.DataFrame(columns=COLUNAS_ORGANIZADAS_ESQUEMA)
+            return self._comparison
 
-        df['PU_DIFF'] = df['PU_BANCO'] - df['PU_BRITECH'] 
-        df['PU_DIFF_VALOR'] = df['PU_DIFF'].abs() 
-        # Adicionamos 1e-12 ao divisor para evitar divisão por zero, caso PU_BRITECH seja zero
-        df['PU_DIFF_PERC'] = (df['PU_DIFF_VALOR'] / (df['PU_BRITECH'].abs() + 1e-12))
-        df['STATUS_INCONSISTENCIA'] = df['PU_DIFF_VALOR'] > TOLERANCE
-        
-        df['VALOR_DIF_REAL'] = (df['VALOR_BRUTO_BANCO'] - df['VALOR_BRUTO_BRITECH']).abs() 
-        
-        df_saida = df.reindex(columns=COLUNAS_ORGANIZADAS_ESQUEMA).sort_values(by='VALOR_DIF_REAL', ascending=False)
-        return df_saida.reset_index(drop=True)
+        with stage('conciliacao.comparacao', rows_in=len(self.merged_df)) as etapa:
+            self._comparison = self._derive_columns(self.merged_df)
+            etapa['linhas_saida'] = len(self._comparison)
+        return self._comparison
+
+    def _derive_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        return derive_comparison_columns(df, self.rules)
+
+    def get_comparison_dataframe(self, sort: bool = True, top_n: Optional[int] = None) -> pd.DataFrame:
+        """
+        Cria o DataFrame de comparação com cálculo de diferenças de PU e Valor, ordenado pela maior
+        diferença de valor (`VALOR_DIF_REAL`). Com `top_n`, só os N maiores são selecionados, sem
+        ordenar o relatório inteiro; com `sort=False`, a ordem é a da conciliação.
+
+        O resultado fica em cache até a troca das entradas ou da tolerância: o DataFrame retornado
+        é compartilhado entre as chamadas e não deve ser alterado.
+        """
+        df = self._comparison_frame()
+        if not sort or df.empty:
+            return df if top_n is None else df.head(top_n)
+
+        if self._sorted_comparison is not None:
+            return self._sorted_comparison if top_n is None else self._sorted_comparison.head(top_n)
+        if top_n is not None:
+            return self._top_n(df, top_n)
+
+        with stage('conciliacao.ordenacao', rows_in=len(df)):
+            self._sorted_comparison = df.sort_values(by='VALOR_DIF_REAL', ascending=False, ignore_index=True)
+        return self._sorted_comparison
+
+    @staticmethod
+    def _top_n(df: pd.DataFrame, top_n: int) -> pd.DataFrame:
+        """ Os N maiores por `VALOR_DIF_REAL` (seleção parcial); valores nulos ficam no final, como no `sort_values`. """
+        if df.empty:
+            return df.reset_index(drop=True)
+        top = df.nlargest(top_n, 'VALOR_DIF_REAL')
+        if len(top) < top_n:
+            top = pd.concat([top, df[df['VALOR_DIF_REAL'].isna()].head(top_n - len(top))])
+        return top.reset_index(drop=True)
+
+    def get_banco_only_dataframe(self) -> pd.DataFrame:
+        """ Posições do Banco sem par na Britech, da maior para a menor em valor bruto. """
+        return self._unmatched(self.df_banco, self.banco_only_pos, COLUNAS_SOMENTE_BANCO)
+
+    def get_britech_only_dataframe(self) -> pd.DataFrame:
+        """ Posições da Britech sem par no Banco, da maior para a menor em valor bruto. """
+        return self._unmatched(self.df_britech, self.britech_only_pos, COLUNAS_SOMENTE_BRITECH)
+
+    def get_quarantine_dataframe(self) -> pd.DataFrame:
+        """
+        Linhas de chaves duplicadas que não puderam ser desempatadas, dos dois lados, ordenadas por
+        vencimento e quantidade para que os lotes que colidem fiquem juntos.
+        """
+        partes = [
+            expand_frame(df.take(positions).reindex(columns=columns)).set_axis(COLUNAS_QUARENTENA[1:], axis=1)
+            .assign(LADO=lado)
+            for lado, df, positions, columns in [
+                ('BANCO', self.df_banco, self.quarantine_banco_pos, COLUNAS_SOMENTE_BANCO),
+                ('BRITECH', self.df_britech, self.quarantine_britech_pos, COLUNAS_SOMENTE_BRITECH),
+            ]
+        ]
+        df_quarentena = pd.concat(partes, ignore_index=True).reindex(columns=COLUNAS_QUARENTENA)
+        return df_quarentena.sort_values(by=['VENCIMENTO_DATA', 'QTD', 'LADO'], kind='stable').reset_index(drop=True)
+
+    @staticmethod
+    def _unmatched(df: pd.DataFrame, positions: np.ndarray, columns: List[str]) -> pd.DataFrame:
+        df_sem_par = expand_frame(df.take(positions).reindex(columns=columns))
+        return df_sem_par.sort_values(by=columns[-2], ascending=False).reset_index(drop=True)
+
+    def get_inconsistent_dataframe(self, sort: bool = True, top_n: Optional[int] = None) -> pd.DataFrame:
+        """ Retorna apenas os ativos conciliados com inconsistência de PU/Valor, filtrando o relatório em cache. """
+        if sort and top_n is not None and self._sorted_comparison is None:
+            # Seleção parcial só entre os inconsistentes, sem ordenar o relatório inteiro
+            df = self._comparison_frame()
+            return self._top_n(df[df['STATUS_INCONSISTENCIA'] == True], top_n)
+
+        df_completo = self.get_comparison_dataframe(sort=sort)
+        df_inconsistente = df_completo[df_completo['STATUS_INCONSISTENCIA'] == True]
+        return (df_inconsistente if top_n is None else df_inconsistente.head(top_n)).copy()
+
+
+# --- CLASSE MULTISOURCECHECKER ---
+class MultiSourceChecker:
+    """
+    Concilia um extrato do Banco contra várias fontes internas (Britech, sistema de risco,
+    administrador do fundo...), todas preparadas como a Britech (`prepare_britech_data`).
+
+    O índice hash das chaves do Banco é construído uma única vez (`MultiSourceMatcher`): os pares
+    e as diferenças de PU de todas as fontes saem de uma passada sobre o índice, em um DataFrame
+    longo com a coluna FONTE, em que as colunas *_BRITECH trazem os dados da fonte indicada.
+    Chaves duplicadas interrompem a conciliação; as conciliações aproximada e por grupos de
+    chaves duplicadas continuam disponíveis só no `ConsistencyChecker`, fonte a fonte. As `rules`
+    (ou, sem elas, a tolerância global) valem para todas as fontes.
+    """
+    def __init__(self, df_banco: pd.DataFrame, sources: Dict[str, pd.DataFrame], strategies: Optional[List[KeyStrategy]] = None,
+                 tolerance: float = TOLERANCE, rules: Optional[RuleEngine] = None):
+        if not sources:
+            raise ValueError("Informe ao menos uma fonte interna para a conciliação.")
+        self.strategies = list(strategies or DEFAULT_STRATEGIES)
+        self.rules = rules if rules is not None else RuleEngine.from_tolerance(tolerance)
+        self.names = list(sources)
+        self.df_banco = ConsistencyChecker.normalize_input(df_banco)
+        frames = [ConsistencyChecker.normalize_input(df) for df in sources.values()]
+        # Todas as fontes em um só DataFrame; `source_id` indica a fonte de cada linha
+        self.df_fontes = compact_frame(concat_frames(frames, ignore_index=True))
+        self.source_id = np.repeat(np.arange(len(frames)), [len(df) for df in frames])
+
+        linhas = len(self.df_banco) + len(self.df_fontes)
+        with stage('conciliacao.validacao', rows_in=linhas):
+            self._validate_duplicate_keys(frames)
+        with stage('conciliacao.merge', rows_in=linhas) as etapa:
+            self.merged_df = self._merge_sources(frames)
+            etapa['linhas_saida'] = len(self.merged_df)
+
+        pares = np.bincount(self.pair_source, minlength=len(self.names))
+        logger.info("[Conciliação] Pares conciliados por fonte: %s", dict(zip(self.names, pares.tolist())))
+        self._comparison: Optional[pd.DataFrame] = None
+
+    def _validate_duplicate_keys(self, frames: List[pd.DataFrame]):
+        """ Chaves duplicadas no Banco ou em qualquer fonte interrompem a conciliação. """
+        for key in dict.fromkeys(s.key_column for s in self.strategies):
+            for nome, df in [('Banco', self.df_banco)] + list(zip(self.names, frames)):
+                _, linhas = ConsistencyChecker._sorted_duplicates(df[key].to_numpy())
+                if linhas:
+                    logger.warning("[Validação] Chaves duplicadas encontradas para %s: %s=%s", key, nome, linhas)
+                    raise ValueError("Duplicidade de chave detectada no banco" if nome == 'Banco'
+                                     else f"Duplicidade de chave detectada na fonte {nome}")
+        logger.info("[Validação] Nenhuma duplicidade de chaves detectada.")
+
+    def _merge_sources(self, frames: List[pd.DataFrame]) -> pd.DataFrame:
+        """
+        Pares de todas as fontes, com as posições sem par de cada lado: `banco_only` (fonte, posição no
+        Banco) e `source_only_pos` (posições em `df_fontes`).
+        """
+        banco_pos, fonte_pos, self.pair_source, strategy_idx = MultiSourceMatcher(self.df_banco, self.strategies).match(frames)
+        self.banco_pos, self.fonte_pos = banco_pos, fonte_pos
+
+        com_par = np.zeros((len(self.names), len(self.df_banco)), dtype=bool)
+        com_par[self.pair_source, banco_pos] = True
+        self.banco_only = np.argwhere(~com_par)
+        self.source_only_pos = ConsistencyChecker._unmatched_positions(len(self.df_fontes), fonte_pos)
+
+        zeros = np.zeros(len(banco_pos), dtype=np.int64)
+        df_final = build_pairs_frame(self.df_banco, self.df_fontes, banco_pos, fonte_pos, strategy_idx, zeros, zeros, self.strategies)
+        df_final.insert(0, 'FONTE', pd.Categorical.from_codes(self.pair_source, categories=self.names))
+        return df_final
+
+    def get_comparison_dataframe(self, sort: bool = True) -> pd.DataFrame:
+        """
+        Comparação de todas as fontes (coluna FONTE), com as colunas derivadas calculadas de uma vez
+        sobre todos os pares. Ordenada pela maior diferença de valor, ou na ordem da conciliação
+        com `sort=False`. O resultado fica em cache e não deve ser alterado.
+        """
+        if self._comparison is None:
+            with stage('conciliacao.comparacao', rows_in=len(self.merged_df)) as etapa:
+                df = derive_comparison_columns(self.merged_df, self.rules)
+                df.insert(0, 'FONTE', self.merged_df['FONTE'].astype(object).to_numpy())
+                self._comparison = df
+                etapa['linhas_saida'] = len(df)
+        if not sort:
+            return self._comparison
+        return self._comparison.sort_values(by='VALOR_DIF_REAL', ascending=False, kind='stable', ignore_index=True)
 
     def get_inconsistent_dataframe(self) -> pd.DataFrame:
-        """ Retorna apenas os ativos conciliados com inconsistência de PU/Valor. """
         df_completo = self.get_comparison_dataframe()
-        return df_completo[df_completo['STATUS_INCONSISTENCIA'] == True].copy()
\ No newline at end of file
+        return df_completo[df_completo['STATUS_INCONSISTENCIA'] == True].reset_index(drop=True)
+
+    def get_pu_by_source_dataframe(self) -> pd.DataFrame:
+        """
+        Uma linha por posição do Banco conciliada em ao menos uma fonte, com o PU e a diferença de PU
+        de cada fonte lado a lado (PU_<FONTE>, PU_DIFF_<FONTE>) e o número de fontes inconsistentes.
+        """
+        df = self.get_comparison_dataframe(sort=False)
+        pu = np.full((len(self.names), len(self.df_banco)), np.nan)
+        pu[self.pair_source, self.banco_pos] = df['PU_BRITECH'].to_numpy(dtype=np.float64)
+        linhas = np.flatnonzero(~np.isnan(pu).all(axis=0))
+
+        df_pu = expand_frame(self.df_banco.take(linhas).reindex(columns=COLUNAS_SOMENTE_BANCO)).reset_index(drop=True)
+        pu_banco = df_pu['PU_BANCO'].to_numpy(dtype=np.float64)
+        diffs = pu_banco - pu[:, linhas]
+        for i, nome in enumerate(self.names):
+            df_pu[f'PU_{nome}'] = pu[i, linhas]
+            df_pu[f'PU_DIFF_{nome}'] = diffs[i]
+        # Fontes em que o par do Banco foi marcado como inconsistente pelas regras
+        inconsistentes = np.zeros(len(self.df_banco), dtype=np.int64)
+        np.add.at(inconsistentes, self.banco_pos, df['STATUS_INCONSISTENCIA'].to_numpy(dtype=bool))
+        df_pu['FONTES_INCONSISTENTES'] = inconsistentes[linhas]
+        return df_pu
+
+    def get_banco_only_dataframe(self) -> pd.DataFrame:
+        """ Posições do Banco sem par em cada fonte (coluna FONTE), da maior para a menor em valor bruto. """
+        fontes, posicoes = self.banco_only[:, 0], self.banco_only[:, 1]
+        df = expand_frame(self.df_banco.take(posicoes).reindex(columns=COLUNAS_SOMENTE_BANCO)).reset_index(drop=True)
+        df.insert(0, 'FONTE', np.array(self.names, dtype=object)[fontes])
+        return self._sorted_by_source(df, 'VALOR_BRUTO_BANCO')
+
+    def get_source_only_dataframe(self) -> pd.DataFrame:
+        """ Posições de cada fonte sem par no Banco (coluna FONTE), da maior para a menor em valor bruto. """
+        posicoes = self.source_only_pos
+        df = expand_frame(self.df_fontes.take(posicoes).reindex(columns=COLUNAS_SOMENTE_BRITECH)).reset_index(drop=True)
+        df.insert(0, 'FONTE', np.array(self.names, dtype=object)[self.source_id[posicoes]])
+        return self._sorted_by_source(df, 'VALOR_BRUTO_BRITECH')
+
+    def _sorted_by_source(self, df: pd.DataFrame, valor: str) -> pd.DataFrame:
+        ordem = pd.Categorical(df['FONTE'], categories=self.names).codes
+        return (df.assign(_ORDEM=ordem).sort_values(by=['_ORDEM', valor], ascending=[True, False], kind='stable')
+                .drop(columns='_ORDEM').reset_index(drop=True))
@@ -0,0 +1,182 @@
+import posixpath
+import zipfile
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Sequence
+from xml.etree import ElementTree
+import logging
+
+# Este módulo é importado na validação de cabeçalhos da linha de comando: o pandas e o openpyxl
+# só são importados pelas funções que os usam
+
+logger = logging.getLogger(__name__)
+
+# Número máximo de linhas inspecionadas na busca pelo cabeçalho
+MAX_ROWS_TO_CHECK = 50
+# Colunas obrigatórias de cada extrato, com os nomes usados na preparação (os apelidos ficam em src/layouts.py)
+COLUNAS_BANCO = ['Aplicação', 'Qtd.', 'PU Atual', 'Código', 'Vcto.', 'Valor Bruto']
+COLUNAS_BRITECH = ['DATA OPERAÇÃO', 'VALOR BRUTO', 'QUANTIDADE', 'DESCRIÇÃO', 'DATA VENCIMENTO']
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+
+
+@contextmanager
+def open_sheet_rows(file_path: str) -> Iterator[Iterator[tuple]]:
+    """
+    Abre a primeira planilha do arquivo uma única vez, em modo read-only, e entrega
+    um iterador sobre os valores das linhas. O workbook é fechado ao sair do contexto.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        # Arquivos gerados por outros sistemas podem trazer dimensões incorretas no XML
+        sheet.reset_dimensions()
+        yield sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_sheet_preview(file_path: str, max_rows: int = MAX_ROWS_TO_CHECK) -> List[tuple]:
+    """
+    Lê as primeiras `max_rows` linhas da primeira planilha direto do XML do arquivo, só com a
+    biblioteca padrão, para validações rápidas do cabeçalho. As linhas seguem a numeração do
+    `open_sheet_rows` (linhas ausentes no XML viram linhas vazias). Só os textos são fiéis ao
+    openpyxl: números ficam como int/float e datas como o número serial do Excel.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        cells_by_row = _preview_cells(archive, _first_sheet_path(archive), max_rows)
+        needed = [value for row in cells_by_row for _, kind, value in row if kind == 's']
+        shared = _shared_strings(archive, max(needed) + 1) if needed else []
+
+    preview = []
+    for row in cells_by_row:
+        values = [None] * (max((col for col, _, _ in row), default=-1) + 1)
+        for col, kind, value in row:
+            values[col] = shared[value] if kind == 's' else value
+        preview.append(tuple(values))
+    return preview
+
+
+def _first_sheet_path(archive: zipfile.ZipFile) -> str:
+    """ Caminho, dentro do arquivo, da primeira planilha listada no workbook. """
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    rel_id = workbook.find(f'{_NS}sheets/{_NS}sheet').get(_REL_ID)
+    rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    target = next(rel.get('Target') for rel in rels if rel.get('Id') == rel_id)
+    return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+
+
+def _column_index(ref: str) -> int:
+    """ Índice (base 0) da coluna de uma referência como 'AB12'. """
+    index = 0
+    for char in ref:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - ord('A') + 1
+    return index - 1
+
+
+def _cell_value(cell: ElementTree.Element):
+    """ Tipo e valor de uma célula; textos compartilhados ficam como ('s', índice) até a resolução. """
+    kind = cell.get('t', 'n')
+    if kind == 'inlineStr':
+        return 'text', ''.join(t.text or '' for t in cell.iter(f'{_NS}t'))
+    v = cell.find(f'{_NS}v')
+    if v is None or v.text is None:
+        return 'empty', None
+    if kind == 's':
+        return 's', int(v.text)
+    if kind == 'b':
+        return 'bool', v.text == '1'
+    if kind == 'n':
+        return 'number', int(v.text) if v.text.lstrip('-').isdigit() else float(v.text)
+    return 'text', v.text
+
+
+def _preview_cells(archive: zipfile.ZipFile, sheet_path: str, max_rows: int) -> List[list]:
+    rows = []
+    with archive.open(sheet_path) as sheet:
+        for _, elem in ElementTree.iterparse(sheet):
+            if elem.tag != f'{_NS}row':
+                continue
+            number = int(elem.get('r', len(rows) + 1))
+            while len(rows) < min(number - 1, max_rows):
+                rows.append([])
+            if len(rows) >= max_rows:
+                break
+            cells, col = [], -1
+            for cell in elem.iter(f'{_NS}c'):
+                ref = cell.get('r')
+                col = _column_index(ref) if ref else col + 1
+                kind, value = _cell_value(cell)
+                if kind != 'empty':
+                    cells.append((col, kind, value))
+            rows.append(cells)
+            elem.clear()
+            if len(rows) >= max_rows:
+                break
+    return rows
+
+
+def _shared_strings(archive: zipfile.ZipFile, count: int) -> List[str]:
+    """ Os primeiros `count` textos compartilhados; o restante do arquivo não é lido. """
+    strings = []
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return strings
+    with archive.open('xl/sharedStrings.xml') as f:
+        for _, elem in ElementTree.iterparse(f):
+            if elem.tag != f'{_NS}si':
+                continue
+            # Texto simples (<t>) ou formatado (<r><t>); a transcrição fonética (<rPh>) fica de fora
+            parts = elem.findall(f'{_NS}t') + elem.findall(f'{_NS}r/{_NS}t')
+            strings.append(''.join(t.text or '' for t in parts))
+            elem.clear()
+            if len(strings) >= count:
+                break
+    return strings
+
+
+def is_blank_row(row: Sequence) -> bool:
+    return all(value is None or value == '' for value in row)
+
+
+def _column_names(header_row: Sequence, width: int) -> list:
+    """ Nomeia as colunas como o `pd.read_excel`: células vazias viram 'Unnamed: i' e repetidas ganham sufixo '.n'. """
+    names = []
+    seen = {}
+    for i in range(width):
+        value = header_row[i] if i < len(header_row) else None
+        name = f'Unnamed: {i}' if value is None or value == '' else value
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _trim_row(row: Sequence) -> list:
+    """ Converte células vazias em None e remove as células vazias do fim da linha. """
+    values = [None if value == '' else value for value in row]
+    while values and values[-1] is None:
+        values.pop()
+    return values
+
+
+def build_dataframe(header_row: Sequence, data_rows: Iterable[Sequence]) -> 'pd.DataFrame':
+    """ Monta o DataFrame a partir das linhas abaixo do cabeçalho, descartando linhas e colunas vazias finais. """
+    import pandas as pd
+
+    header_row = _trim_row(header_row)
+    rows = [_trim_row(row) for row in data_rows]
+    while rows and not rows[-1]:
+        rows.pop()
+
+    width = max([len(header_row)] + [len(row) for row in rows])
+    columns = _column_names(header_row, width)
+    rows = [row + [None] * (width - len(row)) for row in rows]
+
+    return pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,258 @@
+import logging
+import sqlite3
+from datetime import date, datetime
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from src.keys import date_codes, dates_from_codes
+from src.profiling import stage
+from src.schema import from_day_codes
+
+logger = logging.getLogger(__name__)
+
+# Fonte gravada para os relatórios de comparação sem a coluna FONTE (conciliação só com a Britech)
+DEFAULT_SOURCE = 'BRITECH'
+
+DateLike = Union[date, str]
+
+# As datas de execução ficam no mesmo código de dias do esquema compacto (`src/keys.py`).
+#
+# Cada linha do histórico guarda também as somas acumuladas do ativo até ela (número de execuções
+# com PU_DIFF, Σx, Σy, Σxy e Σx², com x = dias desde a primeira execução do ativo e y = PU_DIFF).
+# As somas de uma janela são a diferença entre as somas da última linha da janela e as da última
+# linha antes dela: a tendência de todos os ativos sai de duas buscas no índice por ativo, com
+# custo independente do tamanho da janela e do histórico. `ativos` guarda as somas da última
+# linha de cada ativo, ponto de partida da execução seguinte.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS execucoes (
+    dia INTEGER NOT NULL,
+    fonte TEXT NOT NULL,
+    gravada_em TEXT NOT NULL,
+    ativos INTEGER NOT NULL,
+    PRIMARY KEY (fonte, dia)
+);
+CREATE TABLE IF NOT EXISTS ativos (
+    fonte TEXT NOT NULL,
+    asset_id TEXT NOT NULL,
+    primeiro_dia INTEGER NOT NULL,
+    ultimo_dia INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    sx INTEGER NOT NULL,
+    sy REAL NOT NULL,
+    sxy REAL NOT NULL,
+    sxx INTEGER NOT NULL,
+    PRIMARY KEY (fonte, asset_id)
+);
+CREATE TABLE IF NOT EXISTS pu_historico (
+    dia INTEGER NOT NULL,
+    fonte TEXT NOT NULL,
+    asset_id TEXT NOT NULL,
+    tipo_id_usado TEXT,
+    codigo_banco TEXT,
+    pu_banco REAL,
+    pu_britech REAL,
+    pu_diff REAL,
+    pu_diff_perc REAL,
+    valor_dif_real REAL,
+    inconsistente INTEGER,
+    n INTEGER NOT NULL,
+    sx INTEGER NOT NULL,
+    sy REAL NOT NULL,
+    sxy REAL NOT NULL,
+    sxx INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_pu_historico_ativo ON pu_historico (fonte, asset_id, dia);
+"""
+
+_SUMS = ['n', 'sx', 'sy', 'sxy', 'sxx']
+
+_HISTORY_COLUMNS = {
+    'dia': 'DATA_EXECUCAO', 'asset_id': 'ASSET_ID', 'tipo_id_usado': 'TIPO_ID_USADO', 'codigo_banco': 'CODIGO_BANCO',
+    'pu_banco': 'PU_BANCO', 'pu_britech': 'PU_BRITECH', 'pu_diff': 'PU_DIFF', 'pu_diff_perc': 'PU_DIFF_PERC',
+    'valor_dif_real': 'VALOR_DIF_REAL', 'inconsistente': 'STATUS_INCONSISTENCIA',
+}
+
+# Última linha do ativo até um dia (com duas linhas no mesmo dia, a gravada por último)
+_LAST_ROW = ("(SELECT rowid FROM pu_historico WHERE fonte = a.fonte AND asset_id = a.asset_id AND dia {op} :{limite} "
+             "ORDER BY dia DESC, rowid DESC LIMIT 1)")
+
+# Inclinação da reta de mínimos quadrados do PU_DIFF contra o dia (em PU por dia), a partir das somas da janela
+_TOP_DRIFT_QUERY = f"""
+SELECT asset_id AS ASSET_ID,
+       n AS EXECUCOES,
+       sy / n AS PU_DIFF_MEDIO,
+       ultimo AS PU_DIFF_ULTIMO,
+       (n * sxy - sx * sy) / NULLIF(n * sxx - sx * sx, 0) AS TENDENCIA_DIA
+FROM (SELECT a.asset_id, f.pu_diff AS ultimo,
+             {', '.join(f'f.{s} - COALESCE(i.{s}, 0) AS {s}' for s in _SUMS)}
+      FROM ativos a
+      JOIN pu_historico f ON f.rowid = {_LAST_ROW.format(op='<=', limite='fim')}
+      LEFT JOIN pu_historico i ON i.rowid = {_LAST_ROW.format(op='<', limite='inicio')}
+      WHERE a.fonte = :fonte AND a.ultimo_dia >= :inicio AND a.primeiro_dia <= :fim)
+WHERE n >= :min_execucoes
+ORDER BY ABS(TENDENCIA_DIA) DESC, ASSET_ID
+LIMIT :n
+"""
+
+
+def _day_code(value: DateLike) -> int:
+    """ Código de dias de uma data (ou texto AAAA-MM-DD). """
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    elif isinstance(value, datetime):
+        value = value.date()
+    return int(date_codes(pd.Series([pd.Timestamp(value)]))[0])
+
+
+def _date(dia: int) -> str:
+    return str(dates_from_codes(np.array([dia]))[0])[:10]
+
+
+def _texts(series: pd.Series) -> list:
+    """ Valores de texto para o SQLite, com None nos nulos. """
+    values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+
+def _floats(df: pd.DataFrame, column: str) -> np.ndarray:
+    return df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+class PUHistoryStore:
+    """
+    Histórico dos relatórios de comparação em um arquivo SQLite, para acompanhar a evolução do
+    PU_DIFF de cada ativo entre as execuções diárias.
+
+    O histórico só recebe inclusões: cada execução grava, uma única vez por data e fonte e em
+    ordem cronológica, as linhas de `get_comparison_dataframe`. As consultas por ativo usam o
+    índice (fonte, ASSET_ID, data) e leem só as linhas do ativo; a consulta de tendência usa as
+    somas acumuladas gravadas com cada linha.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # WAL: consultas de outros processos não bloqueiam (nem são bloqueadas por) a gravação de uma execução
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> 'PUHistoryStore':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, df_comparacao: pd.DataFrame, run_date: Optional[DateLike] = None) -> int:
+        """
+        Grava o relatório de comparação da execução de `run_date` (padrão: hoje). Relatórios com a
+        coluna FONTE (`MultiSourceChecker`) são gravados por fonte. Uma data igual ou anterior à
+        última execução gravada da fonte gera ValueError: o histórico não é reescrito. Retorna o
+        número de linhas gravadas.
+        """
+        dia = _day_code(run_date or date.today())
+        df = df_comparacao[df_comparacao['ASSET_ID'].notna()]
+        if len(df) < len(df_comparacao):
+            logger.warning("[Histórico] %d linhas sem ASSET_ID não foram gravadas.", len(df_comparacao) - len(df))
+        fontes = pd.Series(_texts(df['FONTE']) if 'FONTE' in df.columns else [DEFAULT_SOURCE] * len(df),
+                           index=df.index, dtype=object)
+
+        with stage('historico.gravacao', rows_in=len(df)):
+            gravada_em = datetime.now().isoformat(timespec='seconds')
+            with self.conn:
+                for fonte, df_fonte in df.groupby(fontes, sort=False):
+                    self._append_source(df_fonte, fonte, dia, gravada_em)
+
+        logger.info("[Histórico] Execução de %s gravada: %d ativos em %s", _date(dia), len(df), self.path)
+        return len(df)
+
+    def _append_source(self, df: pd.DataFrame, fonte: str, dia: int, gravada_em: str):
+        ultimo = self.conn.execute('SELECT MAX(dia) FROM execucoes WHERE fonte = ?', (fonte,)).fetchone()[0]
+        if ultimo is not None and dia <= ultimo:
+            raise ValueError(f"O histórico da fonte '{fonte}' já tem execuções até {_date(ultimo)}: "
+                             f"cada data é gravada uma única vez, em ordem cronológica ({_date(dia)}).")
+        self.conn.execute('INSERT INTO execucoes VALUES (?, ?, ?, ?)', (dia, fonte, gravada_em, len(df)))
+
+        ids = pd.Series(_texts(df['ASSET_ID']), dtype=object)
+        cursor = self.conn.execute(f"SELECT asset_id, primeiro_dia, {', '.join(_SUMS)} FROM ativos WHERE fonte = ?", (fonte,))
+        anteriores = pd.DataFrame.from_records(cursor.fetchall(), columns=['asset_id', 'primeiro_dia'] + _SUMS, index='asset_id')
+        anteriores = anteriores.reindex(ids).astype(np.float64)
+
+        # Somas da execução, acumuladas por ativo (um ativo pode repetir no relatório) sobre as somas anteriores
+        primeiro_dia = anteriores['primeiro_dia'].fillna(dia).to_numpy(dtype=np.int64)
+        x = dia - primeiro_dia
+        y = _floats(df, 'PU_DIFF')
+        valido = ~np.isnan(y)
+        y0 = np.where(valido, y, 0.0)
+        termos = pd.DataFrame({'n': valido.astype(np.int64), 'sx': x * valido, 'sy': y0, 'sxy': x * y0, 'sxx': x * x * valido})
+        somas = termos.groupby(ids.to_numpy(), sort=False).cumsum() + anteriores[_SUMS].fillna(0).to_numpy()
+        somas[['n', 'sx', 'sxx']] = somas[['n', 'sx', 'sxx']].astype(np.int64)
+
+        rows = zip(
+            [dia] * len(df), [fonte] * len(df), ids.tolist(), _texts(df['TIPO_ID_USADO']), _texts(df['CODIGO_BANCO']),
+            # NaN é gravado como NULL pelo SQLite
+            _floats(df, 'PU_BANCO').tolist(), _floats(df, 'PU_BRITECH').tolist(), y.tolist(), _floats(df, 'PU_DIFF_PERC').tolist(),
+            _floats(df, 'VALOR_DIF_REAL').tolist(), df['STATUS_INCONSISTENCIA'].fillna(False).astype(int).tolist(),
+            *(somas[s].tolist() for s in _SUMS),
+        )
+        self.conn.executemany(f"INSERT INTO pu_historico VALUES ({', '.join('?' * 16)})", rows)
+
+        ultimas = ~ids.duplicated(keep='last').to_numpy()
+        self.conn.executemany(
+            f"INSERT INTO ativos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (fonte, asset_id) DO UPDATE SET "
+            f"ultimo_dia = excluded.ultimo_dia, {', '.join(f'{s} = excluded.{s}' for s in _SUMS)}",
+            zip([fonte] * int(ultimas.sum()), ids[ultimas].tolist(), primeiro_dia[ultimas].tolist(), [dia] * int(ultimas.sum()),
+                *(somas[s][ultimas].tolist() for s in _SUMS)))
+
+    def run_dates(self, fonte: str = DEFAULT_SOURCE) -> pd.Series:
+        """ Datas das execuções gravadas para a fonte, em ordem. """
+        dias = pd.Series([row[0] for row in self.conn.execute('SELECT dia FROM execucoes WHERE fonte = ? ORDER BY dia', (fonte,))],
+                         dtype=np.int64, name='DATA_EXECUCAO')
+        return from_day_codes(dias)
+
+    def asset_history(self, asset_id: str, start: Optional[DateLike] = None, end: Optional[DateLike] = None,
+                      fonte: str = DEFAULT_SOURCE) -> pd.DataFrame:
+        """ PUs e diferenças de um ativo em cada execução do intervalo [start, end], da mais antiga para a mais recente. """
+        inicio = _day_code(start) if start is not None else 0
+        fim = _day_code(end) if end is not None else np.iinfo(np.int32).max
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(_HISTORY_COLUMNS)} FROM pu_historico "
+            "WHERE fonte = ? AND asset_id = ? AND dia BETWEEN ? AND ? ORDER BY dia, rowid",
+            (fonte, asset_id, inicio, fim))
+        df = pd.DataFrame.from_records(cursor.fetchall(), columns=list(_HISTORY_COLUMNS.values()))
+        df['DATA_EXECUCAO'] = from_day_codes(df['DATA_EXECUCAO'].astype(np.int64))
+        df['STATUS_INCONSISTENCIA'] = df['STATUS_INCONSISTENCIA'].astype(bool)
+        return df
+
+    def rolling_stats(self, asset_id: str, window: Union[int, str] = 20, start: Optional[DateLike] = None,
+                      end: Optional[DateLike] = None, fonte: str = DEFAULT_SOURCE) -> pd.DataFrame:
+        """
+        Estatísticas móveis do PU_DIFF de um ativo: média, desvio padrão, mínimo e máximo das últimas
+        `window` execuções, ou de um período corrido com um texto como '30D'.
+        """
+        df = self.asset_history(asset_id, start, end, fonte)[['DATA_EXECUCAO', 'PU_DIFF']]
+        janela = df.rolling(window, on='DATA_EXECUCAO', min_periods=1)['PU_DIFF']
+        return df.assign(PU_DIFF_MEDIA=janela.mean(), PU_DIFF_DESVIO=janela.std(),
+                         PU_DIFF_MIN=janela.min(), PU_DIFF_MAX=janela.max())
+
+    def top_drift(self, days: int = 30, end: Optional[DateLike] = None, n: int = 20, min_runs: int = 2,
+                  fonte: str = DEFAULT_SOURCE) -> pd.DataFrame:
+        """
+        Os `n` ativos cujo PU_DIFF mais variou nos `days` dias corridos até `end` (padrão: a última
+        execução gravada), ordenados pela inclinação absoluta da reta de mínimos quadrados do PU_DIFF
+        ao longo dos dias (TENDENCIA_DIA, em PU por dia). Ativos com menos de `min_runs` execuções na
+        janela são ignorados.
+        """
+        if end is None:
+            fim = self.conn.execute('SELECT MAX(dia) FROM execucoes WHERE fonte = ?', (fonte,)).fetchone()[0]
+            if fim is None:
+                fim = _day_code(date.today())
+        else:
+            fim = _day_code(end)
+        params = {'fonte': fonte, 'inicio': fim - days + 1, 'fim': fim, 'min_execucoes': max(min_runs, 1), 'n': n}
+        cursor = self.conn.execute(_TOP_DRIFT_QUERY, params)
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=[col[0] for col in cursor.description])
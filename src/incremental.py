@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.cache import load_frame, save_frame
+from src.data_processor import PREPARED_CACHE_VERSION, TOLERANCE, ConsistencyChecker
+from src.rules import RuleEngine
+
+logger = logging.getLogger(__name__)
+
+# Versão do formato do estado persistido; estados de outra versão forçam um recálculo completo
+STATE_VERSION = '2'
+_STATE_META = 'estado.json'
+_KEY_COLUMNS = ['KEY_VENC', 'KEY_APL']
+# Identidade de um par entre execuções: o ASSET_ID se repete entre pares distintos (mesmo vencimento e quantidade)
+_PAIR_COLUMNS = ['CODIGO_BANCO', 'CODIGO_BRITECH'] + _KEY_COLUMNS
+
+
+def row_fingerprints(df: pd.DataFrame) -> np.ndarray:
+    """ Hash de 64 bits de cada linha, considerando todas as colunas (o índice é ignorado). """
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def _with_pair_keys(checker: ConsistencyChecker) -> pd.DataFrame:
+    """
+    Relatório de comparação (na ordem da conciliação) com as chaves do Banco usadas em cada par.
+    As chaves vêm das linhas conciliadas, e não da quantidade do relatório: a quantidade em ponto
+    fixo é arredondada e nem sempre gera de novo a mesma chave.
+    """
+    df = checker.get_comparison_dataframe(sort=False)
+    chaves = {col: checker.df_banco[col].to_numpy()[checker.matched_banco_pos] for col in _KEY_COLUMNS}
+    return df.assign(**chaves)
+
+
+def _key_closure(seeds: np.ndarray, venc: np.ndarray, apl: np.ndarray) -> np.ndarray:
+    """
+    Expande o conjunto de chaves afetadas até o fecho: toda linha com alguma chave no conjunto
+    contribui com suas outras chaves. O resultado cobre todas as linhas cujo match pode ter mudado.
+    """
+    affected = np.unique(seeds)
+    while True:
+        touched = np.isin(venc, affected) | np.isin(apl, affected)
+        expanded = np.unique(np.concatenate([affected, venc[touched], apl[touched]]))
+        if len(expanded) == len(affected):
+            return affected
+        affected = expanded
+
+
+class IncrementalReconciler:
+    """
+    Conciliação incremental entre execuções diárias.
+
+    O estado da execução anterior (DataFrames preparados e relatório de comparação) fica em
+    `state_dir`. Na nova execução, as linhas são comparadas por fingerprint; só as linhas
+    inseridas, removidas ou alteradas, junto com as linhas que compartilham chaves com elas,
+    são conciliadas e avaliadas novamente. Os demais pares são reaproveitados do estado, que é
+    descartado quando as regras de inconsistência (`rules`) mudam.
+    """
+    def __init__(self, state_dir: str, rules: Optional[RuleEngine] = None):
+        self.state_dir = state_dir
+        self.rules = rules if rules is not None else RuleEngine.from_tolerance(TOLERANCE)
+
+    def _meta(self) -> Dict:
+        return {'versao': STATE_VERSION, 'preparacao': PREPARED_CACHE_VERSION, 'regras': self.rules.signature()}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.state_dir, name)
+
+    def _load_state(self) -> Optional[Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]]:
+        meta_path = self._path(_STATE_META)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta != self._meta():
+            logger.info("[Incremental] Estado anterior incompatível (%s); recalculando tudo.", meta)
+            return None
+        return tuple(load_frame(self._path(name)) for name in ('banco', 'britech', 'comparacao'))
+
+    def _save_state(self, df_banco: pd.DataFrame, df_britech: pd.DataFrame, df_comparacao: pd.DataFrame):
+        os.makedirs(self.state_dir, exist_ok=True)
+        for name, df in (('banco', df_banco), ('britech', df_britech), ('comparacao', df_comparacao)):
+            save_frame(df, self._path(name))
+        with open(self._path(_STATE_META), 'w', encoding='utf-8') as f:
+            json.dump(self._meta(), f)
+
+    def run(self, df_banco: pd.DataFrame, df_britech: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Retorna o relatório de comparação completo e o relatório delta das inconsistências
+        (coluna DELTA com NOVA, RESOLVIDA ou INALTERADA), e grava o novo estado.
+        """
+        df_banco = ConsistencyChecker._ensure_int_keys(df_banco.reset_index(drop=True))
+        df_britech = ConsistencyChecker._ensure_int_keys(df_britech.reset_index(drop=True))
+        estado = self._load_state()
+
+        if estado is None:
+            df_anterior = None
+            df_comparacao = _with_pair_keys(ConsistencyChecker(df_banco, df_britech, rules=self.rules))
+        else:
+            df_comparacao, df_anterior = self._reconcile_changes(df_banco, df_britech, *estado)
+        df_comparacao = df_comparacao.sort_values(by='VALOR_DIF_REAL', ascending=False).reset_index(drop=True)
+
+        # As chaves dos pares ficam só no estado; o relatório mantém as colunas de sempre
+        self._save_state(df_banco, df_britech, df_comparacao)
+        return df_comparacao.drop(columns=_KEY_COLUMNS), self._delta(df_anterior, df_comparacao).drop(columns=_KEY_COLUMNS)
+
+    def _reconcile_changes(self, df_banco, df_britech, old_banco, old_britech, old_comparacao):
+        mudancas: Dict[str, int] = {}
+        seeds = []
+        for lado, novo, antigo in (('banco', df_banco, old_banco), ('britech', df_britech, old_britech)):
+            fp_novo, fp_antigo = row_fingerprints(novo), row_fingerprints(antigo.reindex(columns=novo.columns))
+            novas = ~np.isin(fp_novo, fp_antigo)
+            removidas = ~np.isin(fp_antigo, fp_novo)
+            mudancas[f'{lado}_novas_ou_alteradas'] = int(novas.sum())
+            mudancas[f'{lado}_removidas'] = int(removidas.sum())
+            for col in _KEY_COLUMNS:
+                seeds += [novo[col].to_numpy()[novas], antigo[col].to_numpy()[removidas]]
+
+        todas = [df_banco, df_britech, old_banco, old_britech]
+        afetadas = _key_closure(
+            np.concatenate(seeds),
+            np.concatenate([df['KEY_VENC'].to_numpy() for df in todas]),
+            np.concatenate([df['KEY_APL'].to_numpy() for df in todas]),
+        )
+
+        def _afetadas(df: pd.DataFrame) -> np.ndarray:
+            return df['KEY_VENC'].isin(afetadas).to_numpy() | df['KEY_APL'].isin(afetadas).to_numpy()
+
+        banco_afetado, britech_afetado = df_banco[_afetadas(df_banco)], df_britech[_afetadas(df_britech)]
+        mantidos = old_comparacao[~_afetadas(old_comparacao)]
+
+        partes = [mantidos]
+        if len(banco_afetado) and len(britech_afetado):
+            partes.append(_with_pair_keys(ConsistencyChecker(banco_afetado, britech_afetado, rules=self.rules)))
+
+        logger.info(
+            "[Incremental] Linhas reavaliadas: Banco=%d, Britech=%d; pares reaproveitados: %d; mudanças: %s",
+            len(banco_afetado), len(britech_afetado), len(mantidos), mudancas,
+        )
+
+        return pd.concat(partes, ignore_index=True), old_comparacao
+
+    @staticmethod
+    def _delta(df_anterior, df_atual: pd.DataFrame) -> pd.DataFrame:
+        """
+        Classifica as inconsistências em novas, resolvidas e inalteradas em relação à execução anterior.
+        Os pares das duas execuções são identificados pelos códigos e pelas chaves (_PAIR_COLUMNS).
+        """
+        atual = df_atual[df_atual['STATUS_INCONSISTENCIA'] == True]
+        if df_anterior is None:
+            return atual.assign(DELTA='NOVA')[['DELTA'] + list(atual.columns)].reset_index(drop=True)
+
+        anterior = df_anterior[df_anterior['STATUS_INCONSISTENCIA'] == True]
+        pares_anteriores = row_fingerprints(anterior[_PAIR_COLUMNS])
+        pares_atuais = row_fingerprints(atual[_PAIR_COLUMNS])
+
+        delta = pd.concat([
+            atual.assign(DELTA=np.where(np.isin(pares_atuais, pares_anteriores), 'INALTERADA', 'NOVA')),
+            anterior[~np.isin(pares_anteriores, pares_atuais)].assign(DELTA='RESOLVIDA'),
+        ], ignore_index=True)
+
+        resumo = delta['DELTA'].value_counts().to_dict()
+        logger.info("[Incremental] Delta de inconsistências: %s", resumo)
+        return delta[['DELTA'] + list(atual.columns)]
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+# --- CHAVES DE CONCILIAÇÃO CODIFICADAS EM INT64 ---
+#
+# Cada chave combina uma data e uma quantidade em um único int64:
+#   bits 46..62 -> código da data (dias desde 1899-12-31; 0 representa data nula)
+#   bits 0..45  -> quantidade em ponto fixo com QTD_DECIMALS casas decimais
+# Quantidades que não cabem nesse formato (negativas, NaN, com mais casas decimais ou grandes demais)
+# e datas fora do intervalo recebem uma chave derivada de um hash de 62 bits dos valores exatos,
+# sempre negativa, para nunca colidir com as chaves empacotadas.
+
+QTD_DECIMALS = 4
+QTD_SCALE = 10 ** QTD_DECIMALS
+QTD_BITS = 46
+DATE_BITS = 17
+
+_QTD_LIMIT = 1 << QTD_BITS
+_DATE_LIMIT = 1 << DATE_BITS
+# Dias entre 1899-12-31 e 1970-01-01: o código 1 corresponde a 1900-01-01
+_DATE_OFFSET = 25568
+
+NULL_LABELS = {'VENCIMENTO': 'NULL_VENC', 'APLICACAO': 'NULL_APL'}
+
+
+def date_codes(dates: pd.Series) -> np.ndarray:
+    """ Converte datas em número de dias desde 1899-12-31 (int64), com 0 para datas nulas. """
+    # Colunas já em datetime64 não passam de novo pelo to_datetime (que inspeciona os valores)
+    values = dates if pd.api.types.is_datetime64_dtype(dates) else pd.to_datetime(dates)
+    values = np.asarray(values).astype('datetime64[D]')
+    codes = values.astype(np.int64) + _DATE_OFFSET
+    codes[np.isnat(values)] = 0
+    return codes
+
+
+def dates_from_codes(codes: np.ndarray) -> np.ndarray:
+    """ Inverso de `date_codes`: códigos de dias para datetime64[ns], com NaT no código 0. """
+    codes = np.asarray(codes, dtype=np.int64)
+    dates = (codes - _DATE_OFFSET).astype('datetime64[D]').astype('datetime64[ns]')
+    dates[codes == 0] = np.datetime64('NaT')
+    return dates
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """ Finalizador do splitmix64, aplicado de forma vetorizada sobre uint64. """
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def encode_keys(dates: pd.Series, quantities: pd.Series) -> np.ndarray:
+    """ Codifica os pares (data, quantidade) em chaves int64; valores iguais geram sempre a mesma chave. """
+    codes = date_codes(dates)
+    qtd = pd.to_numeric(quantities, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+    with np.errstate(invalid='ignore', over='ignore'):
+        scaled = np.rint(qtd * QTD_SCALE)
+        packable = (
+            (qtd >= 0) & (scaled < _QTD_LIMIT) & (scaled / QTD_SCALE == qtd)
+            & (codes >= 0) & (codes < _DATE_LIMIT)
+        )
+
+    keys = np.empty(len(qtd), dtype=np.int64)
+    keys[packable] = (codes[packable] << QTD_BITS) | scaled[packable].astype(np.int64)
+
+    if not packable.all():
+        outliers = ~packable
+        # NaN são normalizados para que todas as quantidades nulas compartilhem a mesma chave
+        bits = np.where(np.isnan(qtd[outliers]), np.nan, qtd[outliers]).view(np.uint64)
+        hashed = _mix64(_mix64(codes[outliers].astype(np.uint64)) ^ bits)
+        keys[outliers] = -((hashed >> np.uint64(2)).astype(np.int64)) - 1
+
+    return keys
+
+
+def quantity_buckets(quantities: pd.Series, n_buckets: int) -> np.ndarray:
+    """
+    Distribui as linhas em `n_buckets` partições pelo hash da quantidade. Como todas as chaves
+    incluem a quantidade, linhas que podem ser conciliadas entre si caem sempre na mesma partição.
+    """
+    qtd = pd.to_numeric(quantities, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    # Somar 0.0 normaliza -0.0, que gera a mesma chave que 0.0
+    bits = np.where(np.isnan(qtd), np.nan, qtd + 0.0).view(np.uint64)
+    return (_mix64(bits) % np.uint64(n_buckets)).astype(np.int64)
+
+
+def key_components(venc: np.ndarray, apl: np.ndarray) -> np.ndarray:
+    """
+    Componente conexo de cada linha no grafo em que linhas com a mesma KEY_VENC ou a mesma KEY_APL
+    estão ligadas (códigos 0..n-1). Linhas de componentes diferentes nunca são conciliadas entre si,
+    nem entram na mesma checagem de duplicidade: cada componente pode ser conciliado separadamente.
+    """
+    codes, uniques = pd.factorize(np.concatenate([venc, apl]))
+    a, b = codes[:len(venc)], codes[len(venc):]
+    # Cada chave recebe o menor rótulo do seu componente: propagação pelas arestas com salto de ponteiros
+    labels = np.arange(len(uniques))
+    while True:
+        menor = np.minimum(labels[a], labels[b])
+        novos = labels.copy()
+        np.minimum.at(novos, a, menor)
+        np.minimum.at(novos, b, menor)
+        novos = novos[novos]
+        if np.array_equal(novos, labels):
+            return pd.factorize(labels[a])[0]
+        labels = novos
+
+
+def encode_asset_id_strings(asset_ids: pd.Series) -> np.ndarray:
+    """
+    Codifica chaves textuais no formato legado 'AAAAMMDD_QTD' (ou 'NULL_VENC_QTD'/'NULL_APL_QTD'),
+    para DataFrames que ainda chegam ao `ConsistencyChecker` sem as chaves int64.
+    """
+    parts = asset_ids.astype(str).str.rsplit('_', n=1, expand=True)
+    dates = pd.to_datetime(parts[0], format='%Y%m%d', errors='coerce')
+    quantities = pd.to_numeric(parts[1], errors='coerce')
+    return encode_keys(dates, quantities)
+
+
+def render_asset_ids(dates: pd.Series, quantities: pd.Series, tipo: pd.Series,
+                     null_labels: Optional[Dict[str, str]] = None) -> pd.Series:
+    """
+    Gera o ASSET_ID legível ('AAAAMMDD_QTD') apenas para as linhas informadas,
+    normalmente as que vão para os relatórios.
+    """
+    null_labels = tipo.map(null_labels or NULL_LABELS)
+    date_str = _format_distinct(
+        pd.to_datetime(dates), lambda u: u.dt.strftime('%Y%m%d'), use_na_sentinel=True
+    ).fillna(null_labels)
+    qtd_str = _format_distinct(quantities, _format_quantities, use_na_sentinel=False)
+    return date_str + '_' + qtd_str
+
+
+def _format_quantities(quantities: pd.Series) -> pd.Series:
+    """ Quantidades como texto, sem o '.0' final; as inteiras são formatadas direto como int64, sem regex. """
+    values = pd.to_numeric(quantities, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    with np.errstate(invalid='ignore'):
+        # Zero fica de fora para preservar o texto de -0.0
+        integral = (values == np.rint(values)) & (np.abs(values) < 1e15) & (values != 0)
+    texts = pd.Series(np.empty(len(values), dtype=object), index=quantities.index)
+    texts[integral] = values[integral].astype(np.int64).astype(str)
+    others = quantities[~integral]
+    texts[~integral] = others.astype(str).str.replace(r'\.0+$', '', regex=True).str.strip()
+    return texts
+
+
+def _format_distinct(values: pd.Series, formatter, use_na_sentinel: bool) -> pd.Series:
+    """ Formata só os valores distintos e repete o texto nas linhas; com `use_na_sentinel`, nulos ficam como None. """
+    codes, uniques = pd.factorize(values, use_na_sentinel=use_na_sentinel)
+    texts = np.append(formatter(pd.Series(uniques)).to_numpy(dtype=object), None)
+    return pd.Series(texts[codes], index=values.index)
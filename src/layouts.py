@@ -0,0 +1,154 @@
+import glob
+import hashlib
+import json
+import os
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from src.excel_reader import COLUNAS_BANCO, COLUNAS_BRITECH
+
+# Como o excel_reader, este módulo só usa a biblioteca padrão: a validação de cabeçalhos da
+# linha de comando detecta o layout sem carregar pandas ou NumPy
+
+# Layouts adicionais (um custodiante por arquivo JSON), carregados junto com os layouts embutidos
+LAYOUTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'layouts')
+
+# Colunas que cada tipo de extrato precisa entregar à preparação (`prepare_banco_data`/`prepare_britech_data`)
+COLUNAS_CANONICAS = {'banco': COLUNAS_BANCO, 'britech': COLUNAS_BRITECH}
+
+
+class StatementLayout(NamedTuple):
+    """
+    Layout de cabeçalho de um extrato. `columns` associa cada coluna canônica (o nome usado na
+    preparação) aos apelidos aceitos no arquivo; o próprio nome canônico é sempre aceito.
+    `kind` indica a preparação aplicada ('banco' ou 'britech'), ou None para layouts avulsos.
+    """
+    name: str
+    kind: Optional[str]
+    columns: Dict[str, Tuple[str, ...]]
+
+
+class HeaderMatch(NamedTuple):
+    """ Cabeçalho detectado: índice da linha, layout e mapeamento coluna do arquivo -> coluna canônica. """
+    row: int
+    layout: StatementLayout
+    mapping: Dict[str, str]
+
+
+BUILTIN_LAYOUTS = [
+    StatementLayout('banco', 'banco', {
+        'Aplicação': ('Data Aplicação', 'Data de Aplicação', 'Dt. Aplicação'),
+        'Qtd.': ('Qtde.', 'Qtde', 'Quantidade'),
+        'PU Atual': ('PU', 'P.U. Atual', 'Preço Unitário'),
+        'Código': ('Cód.', 'Código do Ativo'),
+        'Vcto.': ('Vencimento', 'Data Vencimento', 'Dt. Vencimento'),
+        'Valor Bruto': ('Saldo Bruto', 'Valor Bruto Atual'),
+    }),
+    StatementLayout('britech', 'britech', {
+        'DATA OPERAÇÃO': ('DATA DA OPERAÇÃO', 'DT OPERAÇÃO'),
+        'VALOR BRUTO': ('SALDO BRUTO',),
+        'QUANTIDADE': ('QTDE', 'QTD'),
+        'DESCRIÇÃO': ('DESCRIÇÃO DO ATIVO',),
+        'DATA VENCIMENTO': ('DATA DE VENCIMENTO', 'DT VENCIMENTO'),
+    }),
+]
+
+
+def normalize_header(value) -> str:
+    """ Forma de comparação de um texto do cabeçalho: sem acentos, sem diferença de caixa e com espaços simples. """
+    text = unicodedata.normalize('NFKD', str(value))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())
+
+
+def load_layouts(path: str) -> List[StatementLayout]:
+    """
+    Lê layouts de um arquivo JSON, com um objeto ou uma lista de objetos no formato
+    {"nome": ..., "extrato": "banco" | "britech", "colunas": {coluna canônica: [apelidos]}}.
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    layouts = []
+    for item in data if isinstance(data, list) else [data]:
+        kind = item.get('extrato')
+        if kind not in COLUNAS_CANONICAS:
+            raise ValueError(f"Layout '{item.get('nome')}' em {path}: extrato inválido '{kind}'. Use um de {list(COLUNAS_CANONICAS)}.")
+        columns = {col: tuple([aliases] if isinstance(aliases, str) else aliases) for col, aliases in item.get('colunas', {}).items()}
+        layouts.append(_validated(StatementLayout(item['nome'], kind, columns), path))
+    return layouts
+
+
+def _validated(layout: StatementLayout, origem: str) -> StatementLayout:
+    esperadas = COLUNAS_CANONICAS[layout.kind]
+    if sorted(layout.columns) != sorted(esperadas):
+        raise ValueError(f"Layout '{layout.name}' em {origem}: as colunas devem ser exatamente {esperadas}.")
+
+    # Um mesmo texto não pode atender a duas colunas do layout
+    vistos = {}
+    for col, aliases in layout.columns.items():
+        for alias in (col,) + tuple(aliases):
+            anterior = vistos.setdefault(normalize_header(alias), col)
+            if anterior != col:
+                raise ValueError(f"Layout '{layout.name}' em {origem}: o apelido '{alias}' aparece em '{anterior}' e '{col}'.")
+    return layout
+
+
+def layout_registry(layouts_dir: str = LAYOUTS_DIR) -> List[StatementLayout]:
+    """ Layouts embutidos seguidos dos layouts dos arquivos JSON de `layouts_dir` (em ordem alfabética). """
+    layouts = list(BUILTIN_LAYOUTS)
+    for path in sorted(glob.glob(os.path.join(layouts_dir, '*.json'))):
+        layouts.extend(load_layouts(path))
+    return layouts
+
+
+def layouts_for(required_columns: Sequence[str], registry: Optional[List[StatementLayout]] = None) -> List[StatementLayout]:
+    """
+    Layouts do registro que entregam todas as `required_columns`. Sem nenhum, as próprias colunas
+    formam um layout avulso, sem apelidos.
+    """
+    registry = layout_registry() if registry is None else registry
+    required = [col.strip() for col in required_columns]
+    layouts = [layout for layout in registry if all(col in layout.columns for col in required)]
+    return layouts or [StatementLayout('personalizado', None, {col: () for col in required})]
+
+
+def layouts_signature(layouts: Sequence[StatementLayout]) -> str:
+    """ Hash curto dos layouts, para invalidar dados preparados quando o registro muda. """
+    payload = json.dumps([[layout.name, layout.kind, sorted(layout.columns.items())] for layout in layouts], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def detect_header(preview: Sequence[Sequence], layouts: Sequence[StatementLayout]) -> Optional[HeaderMatch]:
+    """
+    Localiza o cabeçalho testando todos os layouts de uma vez. Cada célula de texto é normalizada
+    e consultada uma única vez em um índice apelido -> (layout, coluna), acumulando a cobertura de
+    cada layout por linha; o custo é proporcional ao número de células, e não a linhas x colunas x
+    layouts. Retorna a primeira linha que cobre todas as colunas de algum layout (com empate, o
+    layout com mais colunas e, depois, o primeiro do registro), ou None.
+    """
+    index: Dict[str, List[Tuple[int, str]]] = {}
+    for l, layout in enumerate(layouts):
+        for col, aliases in layout.columns.items():
+            for alias in dict.fromkeys(normalize_header(a) for a in (col,) + tuple(aliases)):
+                index.setdefault(alias, []).append((l, col))
+
+    # Os textos se repetem entre as linhas (células vazias, rótulos de seção): cada um é normalizado uma vez
+    hits: Dict[str, List[Tuple[int, str]]] = {}
+    for i, row in enumerate(preview):
+        found: Dict[int, Dict[str, str]] = {}
+        for value in row:
+            if not isinstance(value, str) or not value:
+                continue
+            cell_hits = hits.get(value)
+            if cell_hits is None:
+                cell_hits = hits[value] = index.get(normalize_header(value), [])
+            for l, col in cell_hits:
+                found.setdefault(l, {}).setdefault(col, value.strip())
+
+        complete = [l for l, cols in found.items() if len(cols) == len(layouts[l].columns)]
+        if complete:
+            best = min(complete, key=lambda l: (-len(layouts[l].columns), l))
+            mapping = {header: col for col, header in found[best].items()}
+            return HeaderMatch(i, layouts[best], mapping)
+    return None
@@ -0,0 +1,216 @@
+import atexit
+import contextvars
+import copy
+import glob
+import json
+import logging
+import os
+import queue
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Como o settings, este módulo só usa a biblioteca padrão: é configurado antes de qualquer
+# subcomando, inclusive os que não carregam pandas
+
+LOG_FILE_PREFIX = 'execucao_'
+LOG_FILE_SUFFIX = '.jsonl'
+# Arquivos de log mantidos: os das últimas execuções; cada arquivo é rotacionado por tamanho
+# (serviço e lotes longos), com até LOG_BACKUP_COUNT partes anteriores
+DEFAULT_KEEP_RUNS = 30
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Registros de fim de etapa (`src/profiling.stage`): vão para o arquivo JSON, mas não para o console
+STAGE_EVENT = 'etapa'
+# Campos estruturados gravados no JSON quando presentes no registro (`extra`, `stage` ou `log_context`)
+STRUCTURED_FIELDS = ('evento', 'etapa', 'arquivo', 'carteira', 'linhas_entrada', 'linhas_saida', 'duracao_s', 'cpu_s')
+
+_context: contextvars.ContextVar[Dict] = contextvars.ContextVar('log_context', default={})
+_run_id: Optional[str] = None
+_queue_handler: Optional[logging.Handler] = None
+_handlers: List[logging.Handler] = []
+_listeners: List[QueueListener] = []
+_process_queue = None
+_atexit_registered = False
+
+
+def new_run_id() -> str:
+    """ Identificador da execução: data e hora de início e um sufixo aleatório (ordena como as execuções). """
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+
+def current_run_id() -> Optional[str]:
+    return _run_id
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    """ Acrescenta `fields` (arquivo, carteira...) a todos os registros emitidos dentro do bloco, nesta thread. """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """ Anexa o run id e o contexto corrente ao registro, na thread que o emitiu. """
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = _run_id
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """ Um objeto JSON por linha, com a mensagem já formatada e os campos estruturados presentes. """
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'momento': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'run_id': getattr(record, 'run_id', None),
+            'processo': record.processName,
+            'mensagem': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info:
+            payload['excecao'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _ConsoleFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        return getattr(record, 'evento', None) != STAGE_EVENT
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler para a fila em memória do próprio processo. A mensagem (`msg % args`) é montada
+    aqui, na thread que emitiu o registro: os argumentos podem ser objetos mutáveis (DataFrames,
+    dicionários de resumo) alterados logo depois, e a thread do QueueListener veria o valor novo.
+    Como `prepare` só roda para registros que passaram pelo nível do logger, mensagens desligadas
+    continuam sem formatação. Ao contrário do QueueHandler padrão, a formatação da linha (JSON ou
+    console) e da exceção fica para o QueueListener, e os campos estruturados seguem no registro.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _prune_runs(log_dir: str, keep: int):
+    """ Remove os arquivos das execuções mais antigas, deixando espaço para a execução que começa. """
+    runs: Dict[str, List[str]] = {}
+    for path in glob.glob(os.path.join(log_dir, f'{LOG_FILE_PREFIX}*{LOG_FILE_SUFFIX}*')):
+        run_id = os.path.basename(path)[len(LOG_FILE_PREFIX):].split(LOG_FILE_SUFFIX)[0]
+        runs.setdefault(run_id, []).append(path)
+    for run_id in sorted(runs)[:max(len(runs) - keep + 1, 0)]:
+        for path in runs[run_id]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def configure_logging(log_dir: Optional[str] = None, level: int = logging.INFO, keep: int = DEFAULT_KEEP_RUNS,
+                      run_id: Optional[str] = None) -> Optional[str]:
+    """
+    Logging assíncrono da execução: os registros entram em uma fila e são gravados por uma thread
+    (QueueListener) no console e, com `log_dir`, em um arquivo JSON por execução
+    (`execucao_<run id>.jsonl`), mantendo os arquivos das `keep` últimas execuções. Retorna o
+    caminho do arquivo da execução, ou None.
+    """
+    global _run_id, _queue_handler, _atexit_registered
+    shutdown_logging()
+    _run_id = run_id or new_run_id()
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    console.addFilter(_ConsoleFilter())
+    _handlers[:] = [console]
+
+    log_path = None
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        _prune_runs(log_dir, keep)
+        log_path = os.path.join(log_dir, f'{LOG_FILE_PREFIX}{_run_id}{LOG_FILE_SUFFIX}')
+        arquivo = RotatingFileHandler(log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+        arquivo.setFormatter(JsonFormatter())
+        _handlers.append(arquivo)
+
+    fila: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler = _DeferredQueueHandler(fila)
+    _queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(fila, *_handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    if not _atexit_registered:
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
+    return log_path
+
+
+def shutdown_logging():
+    """ Grava os registros pendentes na fila e fecha os arquivos (também chamado na saída do processo). """
+    global _queue_handler, _process_queue
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    while _listeners:
+        _listeners.pop().stop()
+    if _process_queue is not None:
+        _process_queue.close()
+        _process_queue = None
+    for handler in _handlers:
+        handler.close()
+    _handlers.clear()
+
+
+def process_logging_args() -> Tuple:
+    """
+    Argumentos de `init_process_logging` para os pools de processos (`initargs`). Os registros dos
+    processos filhos chegam por uma fila do multiprocessing aos mesmos destinos do processo principal.
+    Sem logging configurado, os processos filhos mantêm a configuração herdada.
+    """
+    global _process_queue
+    if _queue_handler is None:
+        return None, None, logging.getLogger().level
+    if _process_queue is None:
+        import multiprocessing
+
+        _process_queue = multiprocessing.Queue()
+        listener = QueueListener(_process_queue, *_handlers, respect_handler_level=True)
+        listener.start()
+        # Parado antes do listener local: o fim da fila dos filhos ainda passa pelos handlers abertos
+        _listeners.insert(1, listener)
+    return _process_queue, _run_id, logging.getLogger().level
+
+
+def init_process_logging(log_queue, run_id: Optional[str], level: int):
+    """ Inicializador dos processos filhos: envia os registros à fila do processo principal, com o mesmo run id. """
+    global _run_id
+    if log_queue is None:
+        return
+    _run_id = run_id
+    root = logging.getLogger()
+    # O handler herdado (fork) aponta para a fila em memória do processo pai, que aqui não tem leitor
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = QueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    root.addHandler(handler)
+    root.setLevel(level)
@@ -0,0 +1,338 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import logging
+
+from src.schema import FIXED_COLUMNS, QTD_FIXED_DECIMALS, VALUE_FIXED_DECIMALS, as_fixed
+
+logger = logging.getLogger(__name__)
+
+
+class KeyStrategy(NamedTuple):
+    """ Estratégia de conciliação: nome usado em TIPO_ID_USADO, coluna de chave e data do Banco usada no ASSET_ID. """
+    name: str
+    key_column: str
+    date_column: str
+    null_label: str
+
+
+class NearestStrategy(NamedTuple):
+    """ Estratégia de conciliação aproximada: nome usado em TIPO_ID_USADO e as datas comparadas em cada lado. """
+    name: str
+    date_column: str
+    britech_date_column: str
+    null_label: str
+
+
+# Ordem de prioridade das chaves: Vencimento primeiro, Aplicação como fallback
+DEFAULT_STRATEGIES = [
+    KeyStrategy('VENCIMENTO', 'KEY_VENC', 'VENCIMENTO_DATA_BANCO', 'NULL_VENC'),
+    KeyStrategy('APLICACAO', 'KEY_APL', 'APLICACAO_DATA_BANCO', 'NULL_APL'),
+]
+DEFAULT_NEAREST_STRATEGIES = [
+    NearestStrategy('APROX_VENCIMENTO', 'VENCIMENTO_DATA_BANCO', 'VENCIMENTO_DATA_BRITECH', 'NULL_VENC'),
+    NearestStrategy('APROX_APLICACAO', 'APLICACAO_DATA_BANCO', 'OPERACAO_DATA_BRITECH', 'NULL_APL'),
+]
+# Limite de rodadas da conciliação aproximada; cada rodada concilia ao menos um par
+MAX_NEAREST_ROUNDS = 20
+# Atributos (coluna do Banco, coluna da Britech, escala) usados, em ordem, para desempatar chaves
+# duplicadas. Os códigos não entram: o código do Banco e a descrição da Britech não são comparáveis.
+# Os valores brutos são comparados em centavos.
+SECONDARY_ATTRIBUTES = [
+    ('APLICACAO_DATA_BANCO', 'OPERACAO_DATA_BRITECH', 1),
+    ('VENCIMENTO_DATA_BANCO', 'VENCIMENTO_DATA_BRITECH', 1),
+    ('VALOR_BRUTO_BANCO', 'VALOR_BRUTO_BRITECH', 10 ** (VALUE_FIXED_DECIMALS - 2)),
+]
+
+
+class SuccessiveMatcher:
+    """
+    Conciliação sucessiva por índice hash.
+
+    Os índices sobre as chaves da Britech são construídos uma única vez; cada linha do Banco é
+    resolvida pela lista de estratégias em ordem, e as linhas da Britech já usadas por uma
+    estratégia deixam de estar disponíveis para as seguintes. Equivale a um `pd.merge` por
+    estratégia sobre as linhas pendentes; cada linha da Britech entra em no máximo um par, e as
+    chaves iguais em estratégias diferentes (por exemplo, duas datas nulas com a mesma quantidade)
+    não se descartam entre si.
+    """
+    def __init__(self, df_britech: pd.DataFrame, strategies: Optional[List[KeyStrategy]] = None):
+        self.strategies = list(strategies or DEFAULT_STRATEGIES)
+        self.size = len(df_britech)
+        self.indexes: Dict[str, pd.Index] = {
+            s.key_column: pd.Index(df_britech[s.key_column].to_numpy())
+            for s in self.strategies
+        }
+
+    def match(self, df_banco: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Retorna, para cada par conciliado, a posição no Banco, a posição na Britech,
+        o índice da estratégia usada e a chave que gerou o match.
+        """
+        banco_pending = np.ones(len(df_banco), dtype=bool)
+        britech_available = np.ones(self.size, dtype=bool)
+        banco_parts, britech_parts, strategy_parts, key_parts = [], [], [], []
+
+        for i, strategy in enumerate(self.strategies):
+            keys = df_banco[strategy.key_column].to_numpy()
+            positions = self.indexes[strategy.key_column].get_indexer(keys)
+
+            found = banco_pending & (positions >= 0)
+            found[found] = britech_available[positions[found]]
+
+            banco_pos = np.flatnonzero(found)
+            britech_pos = positions[banco_pos]
+            banco_pending[banco_pos] = False
+            britech_available[britech_pos] = False
+
+            banco_parts.append(banco_pos)
+            britech_parts.append(britech_pos)
+            strategy_parts.append(np.full(len(banco_pos), i))
+            key_parts.append(keys[banco_pos])
+            logger.debug("[Conciliação] Estratégia %s: %d pares conciliados", strategy.name, len(banco_pos))
+
+        banco_pos = np.concatenate(banco_parts)
+        britech_pos = np.concatenate(britech_parts)
+        strategy_idx = np.concatenate(strategy_parts)
+        match_keys = np.concatenate(key_parts)
+
+        # Linhas do Banco com a mesma chave caem na mesma linha da Britech: mantém o primeiro match.
+        # A deduplicação é pela posição, e não pela chave, que se repete entre estratégias
+        _, first = np.unique(britech_pos, return_index=True)
+        keep = np.sort(first)
+        return banco_pos[keep], britech_pos[keep], strategy_idx[keep], match_keys[keep]
+
+
+class MultiSourceMatcher:
+    """
+    Conciliação sucessiva do Banco contra várias fontes internas, com o índice hash construído
+    uma única vez sobre as chaves do Banco.
+
+    As linhas de todas as fontes são concatenadas e resolvidas por uma única consulta ao índice
+    por estratégia; a disponibilidade das linhas do Banco é controlada por fonte. Com chaves únicas
+    nos dois lados, os pares de cada fonte são os mesmos do `SuccessiveMatcher` sobre essa fonte.
+    """
+    def __init__(self, df_banco: pd.DataFrame, strategies: Optional[List[KeyStrategy]] = None):
+        self.strategies = list(strategies or DEFAULT_STRATEGIES)
+        self.size = len(df_banco)
+        self.indexes: Dict[str, pd.Index] = {
+            s.key_column: pd.Index(df_banco[s.key_column].to_numpy())
+            for s in self.strategies
+        }
+
+    def match(self, sources: List[pd.DataFrame]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Retorna, para cada par conciliado, a posição no Banco, a posição da linha na concatenação
+        das fontes, o índice da fonte e o índice da estratégia usada. Os pares ficam ordenados por
+        fonte, estratégia e posição no Banco, como no `SuccessiveMatcher`.
+        """
+        sizes = [len(df) for df in sources]
+        source_id = np.repeat(np.arange(len(sources)), sizes)
+        # Uma faixa de `size` posições do Banco por fonte: slot = fonte * size + posição no Banco
+        slots_total = len(sources) * self.size
+        banco_pending = np.ones(slots_total, dtype=bool)
+        source_available = np.ones(len(source_id), dtype=bool)
+        # Para cada estratégia, a linha da fonte conciliada em cada slot (-1 = sem par)
+        pairs_by_strategy: List[np.ndarray] = []
+
+        for i, strategy in enumerate(self.strategies):
+            keys = np.concatenate([df[strategy.key_column].to_numpy() for df in sources]) if sources else np.array([], dtype=np.int64)
+            positions = self.indexes[strategy.key_column].get_indexer(keys)
+            slots = source_id * self.size + positions
+
+            found = source_available & (positions >= 0)
+            found[found] = banco_pending[slots[found]]
+
+            source_pos = np.flatnonzero(found)
+            banco_pending[slots[source_pos]] = False
+            source_available[source_pos] = False
+            # Linhas da fonte com a mesma chave caem no mesmo slot: mantém a primeira, como no SuccessiveMatcher
+            _, first = np.unique(slots[source_pos], return_index=True)
+            source_pos = source_pos[first]
+            pairs = np.full(slots_total, -1, dtype=np.int64)
+            pairs[slots[source_pos]] = source_pos
+
+            pairs_by_strategy.append(pairs)
+            logger.debug("[Conciliação] Estratégia %s: %d pares conciliados em %d fontes", strategy.name, len(source_pos), len(sources))
+
+        banco_parts, source_parts, id_parts, strategy_parts = [], [], [], []
+        for k in range(len(sources)):
+            for i, pairs in enumerate(pairs_by_strategy):
+                faixa = pairs[k * self.size:(k + 1) * self.size]
+                banco_pos = np.flatnonzero(faixa >= 0)
+                banco_parts.append(banco_pos)
+                source_parts.append(faixa[banco_pos])
+                id_parts.append(np.full(len(banco_pos), k))
+                strategy_parts.append(np.full(len(banco_pos), i))
+
+        vazio = [np.array([], dtype=np.int64)]
+        return (np.concatenate(banco_parts or vazio), np.concatenate(source_parts or vazio),
+                np.concatenate(id_parts or vazio), np.concatenate(strategy_parts or vazio))
+
+
+class NearestMatcher:
+    """
+    Conciliação aproximada das linhas que sobraram da conciliação exata: para cada linha do Banco,
+    o vizinho mais próximo na Britech em (data, quantidade), com até `max_days` dias e `max_qty`
+    unidades de diferença. Datas em código de dias e quantidades em ponto fixo (esquema compacto).
+
+    Cada deslocamento de data é um `merge_asof` pela quantidade, com a data exata como grupo, sobre
+    arrays ordenados: O(n log n) por deslocamento, sem comparar todos os pares. Entre os candidatos,
+    vence a menor diferença de data e depois a de quantidade; os pares são aceitos um para um, e as
+    linhas que perderam a disputa tentam de novo na rodada seguinte, contra as que sobraram.
+    """
+    def __init__(self, max_days: int = 0, max_qty: float = 0.0, strategies: Optional[List[NearestStrategy]] = None):
+        if max_days < 0 or max_qty < 0:
+            raise ValueError("As tolerâncias da conciliação aproximada não podem ser negativas.")
+        self.max_days = int(max_days)
+        self.max_qty = max_qty
+        self.strategies = list(strategies or DEFAULT_NEAREST_STRATEGIES)
+        self._qty_tolerance = int(round(max_qty * 10 ** QTD_FIXED_DECIMALS))
+
+    def match(self, df_banco: pd.DataFrame, df_britech: pd.DataFrame, banco_pending: np.ndarray,
+              britech_available: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Retorna, para cada par conciliado, a posição no Banco, a posição na Britech, o índice da
+        estratégia usada e as distâncias em dias e em quantidade (ponto fixo). As máscaras de linhas
+        pendentes e disponíveis são atualizadas no lugar.
+        """
+        qtd_banco, qtd_banco_ok = self._fixed_quantities(df_banco['QTD_BANCO'])
+        qtd_britech, qtd_britech_ok = self._fixed_quantities(df_britech['QTD_BRITECH'])
+        parts = []
+
+        for i, strategy in enumerate(self.strategies):
+            datas_banco = df_banco[strategy.date_column].to_numpy(dtype=np.int64)
+            datas_britech = df_britech[strategy.britech_date_column].to_numpy(dtype=np.int64)
+            # Código de dias 0 = data nula, sem vizinho possível
+            banco_ok = qtd_banco_ok & (datas_banco != 0)
+            britech_ok = qtd_britech_ok & (datas_britech != 0)
+
+            for _ in range(MAX_NEAREST_ROUNDS):
+                banco_pos = np.flatnonzero(banco_pending & banco_ok)
+                britech_pos = np.flatnonzero(britech_available & britech_ok)
+                if not len(banco_pos) or not len(britech_pos):
+                    break
+
+                pares = self._best_pairs(
+                    banco_pos, datas_banco[banco_pos], qtd_banco[banco_pos],
+                    britech_pos, datas_britech[britech_pos], qtd_britech[britech_pos],
+                )
+                if pares.empty:
+                    break
+                banco_pending[pares['pos_banco'].to_numpy()] = False
+                britech_available[pares['pos_britech'].to_numpy()] = False
+                parts.append(pares.assign(estrategia=i))
+
+            n_pares = sum(len(p) for p in parts if p['estrategia'].iat[0] == i)
+            logger.debug("[Conciliação] Estratégia %s: %d pares conciliados", strategy.name, n_pares)
+
+        if not parts:
+            vazio = np.array([], dtype=np.int64)
+            return vazio, vazio, vazio, vazio, vazio
+        pares = pd.concat(parts, ignore_index=True)
+        return tuple(pares[col].to_numpy(dtype=np.int64) for col in ('pos_banco', 'pos_britech', 'estrategia', 'dias', 'qtd'))
+
+    @staticmethod
+    def _fixed_quantities(quantities: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+        # Quantidades fora do limite do ponto fixo ficam de fora, como as nulas
+        quantities = as_fixed(quantities, QTD_FIXED_DECIMALS)
+        return quantities.to_numpy(dtype=np.int64, na_value=0), quantities.notna().to_numpy()
+
+    def _best_pairs(self, banco_pos, banco_datas, banco_qtd, britech_pos, britech_datas, britech_qtd) -> pd.DataFrame:
+        """ Melhor candidato de cada linha do Banco, resolvido um para um pela menor distância. """
+        right = pd.DataFrame({'qtd': britech_qtd, 'data': britech_datas, 'pos_britech': britech_pos})
+        right = right.sort_values('qtd', kind='stable')
+        candidatos = []
+        for deslocamento in range(-self.max_days, self.max_days + 1):
+            left = pd.DataFrame({'qtd': banco_qtd, 'data': banco_datas + deslocamento, 'pos_banco': banco_pos})
+            vizinhos = pd.merge_asof(
+                left.sort_values('qtd', kind='stable'), right, on='qtd', by='data',
+                tolerance=self._qty_tolerance, direction='nearest',
+            ).dropna(subset=['pos_britech'])
+            candidatos.append(vizinhos.assign(dias=abs(deslocamento)))
+
+        pares = pd.concat(candidatos, ignore_index=True)
+        pares['pos_britech'] = pares['pos_britech'].astype(np.int64)
+        # A quantidade da Britech é buscada pela posição (britech_pos é crescente), sem passar por float
+        pares['qtd'] = np.abs(pares['qtd'].to_numpy() - britech_qtd[np.searchsorted(britech_pos, pares['pos_britech'].to_numpy())])
+        pares = pares.sort_values(['dias', 'qtd', 'pos_banco', 'pos_britech'], kind='stable')
+        pares = pares.drop_duplicates('pos_banco').drop_duplicates('pos_britech')
+        return pares[['pos_banco', 'pos_britech', 'dias', 'qtd']]
+
+
+class DuplicateGroupMatcher:
+    """
+    Conciliação das linhas com chaves duplicadas (por exemplo, dois lotes com o mesmo vencimento e
+    a mesma quantidade), que ficam fora do índice hash do `SuccessiveMatcher`.
+
+    Para cada estratégia, as linhas são agrupadas pela chave e os grupos são refinados, nível a
+    nível, pelos atributos secundários (data de aplicação, vencimento e valor bruto). Em cada nível,
+    os subgrupos com exatamente uma linha de cada lado formam um par. As linhas que sobram em grupos
+    com linhas dos dois lados continuam ambíguas e vão para a quarentena.
+    """
+    def __init__(self, strategies: Optional[List[KeyStrategy]] = None, secondary: Optional[List[tuple]] = None):
+        self.strategies = list(strategies or DEFAULT_STRATEGIES)
+        self.secondary = list(SECONDARY_ATTRIBUTES if secondary is None else secondary)
+
+    def match(self, df_banco: pd.DataFrame, df_britech: pd.DataFrame, banco_pending: np.ndarray,
+              britech_available: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Retorna, para cada par conciliado, a posição no Banco, a posição na Britech e o índice da
+        estratégia usada, seguidos das posições em quarentena de cada lado. Só as linhas marcadas em
+        `banco_pending` e `britech_available` participam; as máscaras são atualizadas no lugar.
+        """
+        atributos_banco = [self._attribute(df_banco, col, escala) for col, _, escala in self.secondary]
+        atributos_britech = [self._attribute(df_britech, col, escala) for _, col, escala in self.secondary]
+        parts = []
+
+        for i, strategy in enumerate(self.strategies):
+            chaves_banco = df_banco[strategy.key_column].to_numpy()
+            chaves_britech = df_britech[strategy.key_column].to_numpy()
+            for nivel in range(len(self.secondary) + 1):
+                banco_pos, britech_pos = np.flatnonzero(banco_pending), np.flatnonzero(britech_available)
+                if not len(banco_pos) or not len(britech_pos):
+                    break
+                colunas = ['chave'] + [f'atributo_{j}' for j in range(nivel)]
+                left = self._group_frame(banco_pos, chaves_banco, atributos_banco[:nivel], 'pos_banco')
+                right = self._group_frame(britech_pos, chaves_britech, atributos_britech[:nivel], 'pos_britech')
+                # Só os subgrupos com uma única linha de cada lado formam par
+                pares = left[~left.duplicated(colunas, keep=False)].merge(right[~right.duplicated(colunas, keep=False)], on=colunas)
+                banco_pending[pares['pos_banco'].to_numpy()] = False
+                britech_available[pares['pos_britech'].to_numpy()] = False
+                parts.append(pares[['pos_banco', 'pos_britech']].assign(estrategia=i))
+
+            n_pares = sum(len(p) for p in parts if len(p) and p['estrategia'].iat[0] == i)
+            logger.debug("[Conciliação] Estratégia %s (chaves duplicadas): %d pares conciliados", strategy.name, n_pares)
+
+        quarentena_banco = np.zeros(len(banco_pending), dtype=bool)
+        quarentena_britech = np.zeros(len(britech_available), dtype=bool)
+        for strategy in self.strategies:
+            chaves_banco = df_banco[strategy.key_column].to_numpy()
+            chaves_britech = df_britech[strategy.key_column].to_numpy()
+            ambiguas = np.intersect1d(chaves_banco[banco_pending], chaves_britech[britech_available])
+            quarentena_banco |= banco_pending & np.isin(chaves_banco, ambiguas)
+            quarentena_britech |= britech_available & np.isin(chaves_britech, ambiguas)
+
+        if parts:
+            pares = pd.concat(parts, ignore_index=True)
+            banco_pos, britech_pos, strategy_idx = (pares[col].to_numpy(dtype=np.int64) for col in ('pos_banco', 'pos_britech', 'estrategia'))
+        else:
+            banco_pos = britech_pos = strategy_idx = np.array([], dtype=np.int64)
+        return banco_pos, britech_pos, strategy_idx, np.flatnonzero(quarentena_banco), np.flatnonzero(quarentena_britech)
+
+    @staticmethod
+    def _attribute(df: pd.DataFrame, column: str, escala: int) -> np.ndarray:
+        """ Atributo como int64 (datas em código de dias, valores em ponto fixo), com nulos iguais entre si. """
+        nulo = np.iinfo(np.int64).min
+        serie = as_fixed(df[column], FIXED_COLUMNS[column]) if column in FIXED_COLUMNS else df[column]
+        valores = serie.to_numpy(dtype=np.int64, na_value=nulo)
+        if escala == 1:
+            return valores
+        return np.where(valores == nulo, nulo, (valores + escala // 2) // escala)
+
+    @staticmethod
+    def _group_frame(positions: np.ndarray, keys: np.ndarray, attributes: List[np.ndarray], pos_column: str) -> pd.DataFrame:
+        data = {'chave': keys[positions]}
+        data.update({f'atributo_{j}': valores[positions] for j, valores in enumerate(attributes)})
+        data[pos_column] = positions
+        return pd.DataFrame(data)
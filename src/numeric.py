@@ -0,0 +1,193 @@
+import logging
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Linhas de texto processadas por vez (limita as matrizes de caracteres em memória)
+BLOCK_ROWS = 65536
+# Máximo de dígitos da conversão vetorizada. Até 15 dígitos, a mantissa (< 2^53) e a potência de 10
+# são exatas em float64, e a única divisão é corretamente arredondada: o resultado é igual ao de
+# `float()`. Com mais dígitos, a mantissa seria arredondada antes da divisão.
+MAX_DIGITS = 15
+# Quantidade de linhas inválidas citadas no log
+MAX_REPORTED_CELLS = 20
+
+_POW10_FLOAT = 10.0 ** np.arange(MAX_DIGITS + 1)
+
+# Classes de caractere usadas pelo autômato de leitura (code points acima de 255 são inválidos)
+_INVALID, _DIGIT, _SPACE, _PREFIX, _MINUS, _LPAR, _RPAR, _COMMA, _DOT = range(9)
+_CHAR_CLASS = np.full(257, _INVALID, dtype=np.uint8)
+_CHAR_CLASS[ord('0'):ord('9') + 1] = _DIGIT
+# Preenchimento do buffer (\0) e espaços, inclusive o não separável, são ignorados
+_CHAR_CLASS[[0, ord(' '), ord('\t'), 0xA0]] = _SPACE
+# 'R$' e o sinal de mais só podem aparecer antes dos dígitos
+_CHAR_CLASS[[ord('R'), ord('$'), ord('+')]] = _PREFIX
+_CHAR_CLASS[ord('-')] = _MINUS
+_CHAR_CLASS[ord('(')] = _LPAR
+_CHAR_CLASS[ord(')')] = _RPAR
+_CHAR_CLASS[ord(',')] = _COMMA
+_CHAR_CLASS[ord('.')] = _DOT
+# Fator e parcela de cada caractere na mantissa (regra de Horner: mantissa * 10 + dígito)
+_HORNER_FACTOR = np.where(_CHAR_CLASS == _DIGIT, 10, 1).astype(np.int64)
+_HORNER_TERM = np.where(_CHAR_CLASS == _DIGIT, np.arange(257) - ord('0'), 0).astype(np.int64)
+
+
+def _parse_block(text: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Converte um bloco de textos no padrão brasileiro diretamente sobre o buffer UCS-4 do array,
+    sem criar strings intermediárias. O buffer é visto como uma matriz caracteres x linhas e
+    percorrido uma posição de caractere por vez, com todas as linhas avançando juntas.
+
+    - Com vírgula, ela é o separador decimal e os pontos são separadores de milhar ('1.234,56').
+    - Sem vírgula, um único ponto é decimal ('1234.56'); vários pontos são de milhar ('1.234.567').
+    - Sinal de menos ou parênteses indicam valor negativo; 'R$' e espaços são ignorados.
+
+    Retorna os valores e as máscaras das linhas válidas, em branco e com mais de `MAX_DIGITS`
+    dígitos (estas não seriam exatas e são convertidas individualmente pelo chamador, com `float()`).
+    """
+    n = len(text)
+    width = text.dtype.itemsize // 4
+    codes = text.view(np.uint32).reshape(n, width) if width else np.zeros((n, 0), np.uint32)
+    # Uma linha da matriz por posição de caractere, contígua em memória
+    lookup = np.ascontiguousarray(np.minimum(codes, 256).T)
+    classes = _CHAR_CLASS[lookup]
+
+    mantissa = np.zeros(n, dtype=np.int64)
+    n_digits = np.zeros(n, dtype=np.int64)
+    after_comma = np.zeros(n, dtype=np.int64)
+    after_dot = np.zeros(n, dtype=np.int64)
+    n_commas = np.zeros(n, dtype=np.int64)
+    n_dots = np.zeros(n, dtype=np.int64)
+    n_signs = np.zeros(n, dtype=np.int64)
+    bad = np.zeros(n, dtype=bool)
+    open_par = np.zeros(n, dtype=bool)
+    closed = np.zeros(n, dtype=bool)
+    pending_sep = np.zeros(n, dtype=bool)
+    only_spaces = np.ones(n, dtype=bool)
+
+    for idx, cls in zip(lookup, classes):
+        digit = cls == _DIGIT
+        only_spaces &= cls == _SPACE
+        seen_digit = n_digits > 0
+
+        mantissa *= _HORNER_FACTOR[idx]
+        mantissa += _HORNER_TERM[idx]
+        n_digits += digit
+        after_comma += digit & (n_commas > 0)
+        after_dot += digit
+
+        comma, dot = cls == _COMMA, cls == _DOT
+        sep = comma | dot
+        after_dot[dot] = 0
+        bad |= (cls == _INVALID) | (sep & (~seen_digit | pending_sep)) | (dot & (n_commas > 0)) | (comma & (n_commas > 0))
+        bad |= ((cls == _PREFIX) | (cls == _MINUS) | (cls == _LPAR)) & seen_digit
+        bad |= closed & (digit | sep)
+        n_commas += comma
+        n_dots += dot
+        pending_sep = sep | (pending_sep & ~digit)
+
+        n_signs += (cls == _MINUS) | (cls == _LPAR)
+        open_par |= cls == _LPAR
+        rpar = cls == _RPAR
+        bad |= rpar & (~open_par | ~seen_digit | closed)
+        closed |= rpar
+
+    bad |= (n_digits == 0) | pending_sep | (n_signs > 1) | (open_par != closed)
+    too_long = n_digits > MAX_DIGITS
+    ok = ~bad & ~too_long
+
+    # A mantissa tem todos os dígitos; o valor é a mantissa dividida por 10^(casas decimais)
+    decimals = np.where(n_commas > 0, after_comma, np.where(n_dots == 1, after_dot, 0))
+    values = mantissa / _POW10_FLOAT[np.minimum(decimals, MAX_DIGITS)]
+    values = np.where(n_signs > 0, -values, values)
+    values[~ok] = np.nan
+    return values, ok, only_spaces, too_long & ~bad
+
+
+def _parse_text_fallback(value: str) -> float:
+    """ Conversão individual com `float()`, para textos com dígitos demais para a conversão exata vetorizada. """
+    cleaned = value.replace('R$', '').replace('\xa0', '').replace(' ', '').strip()
+    negative = cleaned.startswith('-') or (cleaned.startswith('(') and cleaned.endswith(')'))
+    cleaned = cleaned.strip('-()+')
+    if ',' in cleaned:
+        cleaned = cleaned.replace('.', '').replace(',', '.')
+    elif cleaned.count('.') > 1:
+        cleaned = cleaned.replace('.', '')
+    number = float(cleaned)
+    return -number if negative else number
+
+
+def _classify_types(raw: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Máscaras das células de texto e das numéricas (booleanos não contam como número). A checagem
+    é feita uma vez por tipo distinto, e não por célula, o que importa nas colunas mistas grandes.
+    """
+    codes, types = pd.factorize(np.fromiter(map(type, raw), dtype=object, count=len(raw)))
+    text_types = np.array([issubclass(t, str) for t in types], dtype=bool)
+    number_types = np.array(
+        [issubclass(t, (int, float, np.number)) and not issubclass(t, (bool, np.bool_)) for t in types], dtype=bool
+    )
+    return text_types[codes], number_types[codes]
+
+
+def parse_br_numbers(values: pd.Series) -> Tuple[pd.Series, pd.Index]:
+    """
+    Converte uma coluna de dinheiro ou quantidade no padrão brasileiro para float64.
+
+    Colunas já numéricas passam direto. Em colunas mistas, as células numéricas são mantidas
+    como estão e só os textos são convertidos. Retorna os valores (NaN nas células vazias ou
+    inválidas) e o índice das células preenchidas que não puderam ser convertidas.
+    """
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.astype('float64'), values.index[:0]
+
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind in ('floating', 'integer', 'mixed-integer-float', 'empty'):
+        return values.astype('float64'), values.index[:0]
+
+    raw = values.to_numpy(dtype=object)
+    result = np.full(len(raw), np.nan)
+    invalid = np.zeros(len(raw), dtype=bool)
+
+    present = ~pd.isna(raw)
+    if kind == 'string':
+        is_text, is_number = present, np.zeros(len(raw), dtype=bool)
+    else:
+        is_text, is_number = _classify_types(raw)
+    is_other = present & ~is_text
+
+    if is_other.any():
+        others, is_number = raw[is_other], is_number[is_other]
+        converted = np.full(len(others), np.nan)
+        converted[is_number] = others[is_number].astype(np.float64)
+        result[is_other] = converted
+        invalid[np.flatnonzero(is_other)[~is_number]] = True
+
+    text_rows = np.flatnonzero(is_text)
+    for start in range(0, len(text_rows), BLOCK_ROWS):
+        rows = text_rows[start:start + BLOCK_ROWS]
+        text = raw[rows].astype(str)
+        parsed, ok, blank, too_long = _parse_block(text)
+        result[rows] = parsed
+        invalid[rows[~ok & ~blank & ~too_long]] = True
+
+        for row in rows[too_long]:
+            try:
+                result[row] = _parse_text_fallback(raw[row])
+            except ValueError:
+                invalid[row] = True
+
+    return pd.Series(result, index=values.index, name=values.name), values.index[invalid]
+
+
+def to_numeric_br(values: pd.Series, context: str = '') -> pd.Series:
+    """ `parse_br_numbers` com registro no log das células inválidas (índice das linhas). """
+    parsed, invalid = parse_br_numbers(values)
+    if len(invalid):
+        rows = ', '.join(str(i) for i in invalid[:MAX_REPORTED_CELLS])
+        more = f' (e mais {len(invalid) - MAX_REPORTED_CELLS})' if len(invalid) > MAX_REPORTED_CELLS else ''
+        logger.warning("[%s] %d células não numéricas em '%s', linhas: %s%s", context, len(invalid), values.name, rows, more)
+    return parsed
@@ -0,0 +1,158 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.core.arrays.masked import BaseMaskedArray
+
+try:
+    import pyarrow as pa
+except ImportError:  # sem pyarrow, não há colunas do Arrow a exportar
+    pa = None
+
+from src.cache import PreparedFrameCache
+from src.data_processor import COLUNAS_BANCO, COLUNAS_BRITECH, DataCleaner
+from src.logging_setup import init_process_logging, process_logging_args
+
+logger = logging.getLogger(__name__)
+
+# Alinhamento dos buffers de cada coluna dentro do bloco de memória compartilhada
+_ALIGNMENT = 64
+
+
+def _column_buffers(values) -> Optional[Tuple[str, List[np.ndarray], Dict]]:
+    """
+    Decompõe uma coluna em buffers NumPy de tipo fixo e nos metadados para remontá-la: arrays NumPy,
+    arrays com máscara (Int64, Float64, boolean: `_data` e `_mask`), categorias (os códigos; as
+    categorias, pequenas, seguem nos metadados) e arrays do Arrow sem filhos (textos: validade,
+    offsets e dados). Retorna None para os demais tipos, que seguem via pickle.
+    """
+    if isinstance(values, pd.arrays.NumpyExtensionArray):
+        values = values.to_numpy()
+    if isinstance(values.dtype, np.dtype):
+        values = np.asarray(values)
+        return ('numpy', [values], {}) if values.dtype != object else None
+    if isinstance(values, BaseMaskedArray):
+        return 'mascara', [values._data, values._mask], {'dtype': values.dtype}
+    if isinstance(values, pd.Categorical):
+        return 'categoria', [values.codes], {'dtype': values.dtype}
+    if pa is not None and isinstance(values, pd.arrays.ArrowExtensionArray):
+        array = values.__arrow_array__().combine_chunks()
+        if array.type.num_fields or pa.types.is_dictionary(array.type):
+            return None
+        buffers = array.buffers()
+        info = {'classe': type(values), 'tipo': array.type, 'tamanho': len(array), 'offset': array.offset,
+                'nulos': array.null_count, 'presentes': [b is not None for b in buffers]}
+        return 'arrow', [np.frombuffer(b, dtype=np.uint8) for b in buffers if b is not None], info
+    return None
+
+
+def _rebuild_column(kind: str, buffers: List[np.ndarray], info: Dict):
+    if kind == 'numpy':
+        return buffers[0]
+    if kind == 'mascara':
+        return info['dtype'].construct_array_type()(buffers[0], buffers[1])
+    if kind == 'categoria':
+        return pd.Categorical.from_codes(buffers[0], dtype=info['dtype'])
+    disponiveis = iter(buffers)
+    arrow_buffers = [pa.py_buffer(next(disponiveis)) if presente else None for presente in info['presentes']]
+    array = pa.Array.from_buffers(info['tipo'], info['tamanho'], arrow_buffers,
+                                  null_count=info['nulos'], offset=info['offset'])
+    return info['classe'](array)
+
+
+def export_frame(df: pd.DataFrame) -> Dict:
+    """
+    Copia os buffers das colunas e do índice para um único bloco de memória compartilhada: colunas
+    NumPy de tipo fixo, arrays com máscara (Int64), categorias e textos do Arrow (o esquema compacto
+    de `src/schema.py`). Só as colunas de objetos Python e de outros tipos seguem no próprio retorno,
+    via pickle. Retorna os metadados necessários para `import_frame` reconstruir o DataFrame.
+    """
+    sources = [('__index__', df.index.array)] + [(col, df[col].array) for col in df.columns]
+    fixed, layout, objects, offset = [], [], {}, 0
+    for name, source in sources:
+        partes = _column_buffers(source)
+        if partes is None:
+            objects[name] = source
+            continue
+        kind, buffers, info = partes
+        posicoes = []
+        for values in buffers:
+            fixed.append(values)
+            posicoes.append((values.dtype.str, len(values), offset))
+            offset += -(-values.nbytes // _ALIGNMENT) * _ALIGNMENT
+        layout.append((name, kind, posicoes, info))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    # O bloco passa a pertencer ao processo que chamar `import_frame`, responsável pelo unlink;
+    # sem isso o resource_tracker deste processo tentaria removê-lo novamente ao final
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    try:
+        for values, (dtype, length, start) in zip(fixed, (p for _, _, posicoes, _ in layout for p in posicoes)):
+            np.ndarray((length,), dtype=dtype, buffer=shm.buf, offset=start)[:] = values
+    finally:
+        shm.close()
+
+    return {
+        'shm_name': shm.name,
+        'columns': list(df.columns),
+        'layout': layout,
+        'objects': objects,
+    }
+
+
+def import_frame(meta: Dict) -> pd.DataFrame:
+    """ Reconstrói o DataFrame exportado por `export_frame` e libera o bloco de memória compartilhada. """
+    shm = shared_memory.SharedMemory(name=meta['shm_name'])
+    try:
+        data = {
+            name: _rebuild_column(kind, [
+                np.ndarray((length,), dtype=dtype, buffer=shm.buf, offset=start).copy()
+                for dtype, length, start in posicoes
+            ], info)
+            for name, kind, posicoes, info in meta['layout']
+        }
+    finally:
+        shm.close()
+        shm.unlink()
+
+    data.update(meta['objects'])
+    index = pd.Index(data.pop('__index__'))
+    return pd.DataFrame({col: data[col] for col in meta['columns']}, index=index, columns=meta['columns'])
+
+
+def _prepare_shared(file_path: str, required_columns: List[str], kind: str,
+                    cache: Optional[PreparedFrameCache]) -> Dict:
+    cleaner = DataCleaner(file_path, required_columns, cache=cache)
+    df = cleaner.prepare_banco_data() if kind == 'banco' else cleaner.prepare_britech_data()
+    return export_frame(df)
+
+
+def load_prepared_concurrently(banco_file: str, britech_file: str,
+                               cache: Optional[PreparedFrameCache] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Carrega e prepara os extratos do Banco e da Britech ao mesmo tempo, em dois processos
+    (a leitura do openpyxl segura o GIL). Os DataFrames preparados voltam ao processo principal
+    por memória compartilhada, sem serializar as colunas do esquema compacto.
+    """
+    with ProcessPoolExecutor(max_workers=2, initializer=init_process_logging, initargs=process_logging_args()) as executor:
+        futures = [
+            executor.submit(_prepare_shared, banco_file, COLUNAS_BANCO, 'banco', cache),
+            executor.submit(_prepare_shared, britech_file, COLUNAS_BRITECH, 'britech', cache),
+        ]
+        metas, errors = [], []
+        for future in futures:
+            try:
+                metas.append(future.result())
+            except Exception as e:
+                errors.append(e)
+
+    if errors:
+        # Libera o bloco de memória do lado que terminou antes de propagar o erro
+        for meta in metas:
+            import_frame(meta)
+        raise errors[0]
+
+    return import_frame(metas[0]), import_frame(metas[1])
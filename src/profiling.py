@@ -0,0 +1,187 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from src.logging_setup import STAGE_EVENT, log_context
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de funções (cProfile) e de linhas de alocação (tracemalloc) incluídas no relatório
+PROFILE_TOP_FUNCTIONS = 25
+PROFILE_TOP_ALLOCATIONS = 15
+
+_MB = 1024 * 1024
+_active: Optional['RunProfiler'] = None
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """ Pico de memória residente do processo (em MB), quando o sistema oferece essa medida. """
+    if resource is None:
+        return None
+    # No Linux, ru_maxrss é dado em KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RunProfiler:
+    """
+    Registra as etapas do pipeline: tempo de relógio, tempo de CPU, linhas de entrada e de saída
+    e memória. Sem tracemalloc, o sistema só informa o pico de RSS do processo inteiro: cada etapa
+    registra esse pico acumulado ao terminar (`pico_rss_processo_mb`, que repete o de etapas
+    anteriores mais pesadas) e quanto ele cresceu durante a etapa (`aumento_pico_rss_mb`). Com
+    `deep=True`, a execução também roda sob o cProfile e o tracemalloc, e cada etapa registra o
+    pico alocado pelo Python durante ela (`pico_memoria_mb`).
+    """
+    def __init__(self, deep: bool = False):
+        self.deep = deep
+        self.stages: List[Dict] = []
+        self._stack: List[Dict] = []
+        self._profile: Optional[cProfile.Profile] = None
+        self._allocations: List[Dict] = []
+        self._started_at = datetime.now()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._wall_total: Optional[float] = None
+        self._cpu_total: Optional[float] = None
+
+    def start(self):
+        global _active
+        _active = self
+        if self.deep:
+            tracemalloc.start()
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self):
+        global _active
+        if _active is self:
+            _active = None
+        self._wall_total = time.perf_counter() - self._wall_start
+        self._cpu_total = time.process_time() - self._cpu_start
+        if self._profile is not None:
+            self._profile.disable()
+        if self.deep and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            self._allocations = [
+                {'local': str(stat.traceback), 'tamanho_mb': stat.size / _MB, 'blocos': stat.count}
+                for stat in snapshot.statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]
+            ]
+            tracemalloc.stop()
+
+    def __enter__(self) -> 'RunProfiler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None, **info) -> Iterator[Dict]:
+        record = {'etapa': name, 'nivel': len(self._stack), 'linhas_entrada': rows_in, 'linhas_saida': None, **info}
+        if tracemalloc.is_tracing():
+            # O reset do pico abaixo apagaria o pico das etapas externas; ele é repassado antes
+            peak = tracemalloc.get_traced_memory()[1]
+            for parent in self._stack:
+                parent['_pico'] = max(parent['_pico'], peak)
+            tracemalloc.reset_peak()
+        record['_pico'] = 0
+        rss_inicio = None if tracemalloc.is_tracing() else _peak_rss_mb()
+        self._stack.append(record)
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall
+            record['cpu_s'] = time.process_time() - cpu
+            self._stack.pop()
+
+            pico = record.pop('_pico')
+            if tracemalloc.is_tracing():
+                record['pico_memoria_mb'] = max(pico, tracemalloc.get_traced_memory()[1]) / _MB
+            else:
+                record['pico_rss_processo_mb'] = _peak_rss_mb()
+                if rss_inicio is not None:
+                    record['aumento_pico_rss_mb'] = record['pico_rss_processo_mb'] - rss_inicio
+
+            rows = record['linhas_entrada'] if record['linhas_entrada'] is not None else record['linhas_saida']
+            record['linhas_por_s'] = rows / record['wall_s'] if rows and record['wall_s'] > 0 else None
+            self.stages.append(record)
+            logger.info(
+                "[Perfil] %s: %.3fs (CPU %.3fs), linhas %s -> %s",
+                name, record['wall_s'], record['cpu_s'], record['linhas_entrada'], record['linhas_saida'],
+                extra={'duracao_s': record['wall_s'], 'cpu_s': record['cpu_s'],
+                       'linhas_entrada': record['linhas_entrada'], 'linhas_saida': record['linhas_saida']},
+            )
+
+    def _top_functions(self) -> List[Dict]:
+        if self._profile is None:
+            return []
+        stats = pstats.Stats(self._profile, stream=io.StringIO()).sort_stats('cumulative')
+        top = []
+        for func in stats.fcn_list[:PROFILE_TOP_FUNCTIONS]:
+            _, ncalls, tottime, cumtime, _ = stats.stats[func]
+            file_name, line, func_name = func
+            top.append({'funcao': f'{file_name}:{line}({func_name})', 'chamadas': ncalls,
+                        'tempo_proprio_s': tottime, 'tempo_acumulado_s': cumtime})
+        return top
+
+    def report(self) -> Dict:
+        """ Relatório da execução; as etapas aparecem na ordem em que terminaram. """
+        return {
+            'inicio': self._started_at.isoformat(timespec='seconds'),
+            'duracao_s': self._wall_total,
+            'cpu_s': self._cpu_total,
+            'pico_rss_mb': _peak_rss_mb(),
+            'etapas': self.stages,
+            'perfil_cpu': self._top_functions(),
+            'perfil_memoria': self._allocations,
+        }
+
+    def save(self, report_path: str, profile_path: Optional[str] = None):
+        """ Grava o relatório em JSON e, no modo `deep`, as estatísticas brutas do cProfile (para pstats/snakeviz). """
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2, default=str)
+        logger.info("[Perfil] Relatório de execução salvo: %s", report_path)
+        if self._profile is not None and profile_path:
+            self._profile.dump_stats(profile_path)
+            logger.info("[Perfil] Estatísticas do cProfile salvas: %s", profile_path)
+
+
+@contextmanager
+def stage(name: str, rows_in: Optional[int] = None, **info) -> Iterator[Dict]:
+    """
+    Marca uma etapa do pipeline. Os registros de log emitidos dentro dela levam o nome da etapa
+    (e `info`, como o arquivo) nos campos estruturados. Com profiler ativo, a etapa é medida por
+    ele; sem profiler, só o tempo de relógio é medido, e apenas se o nível INFO estiver ativo,
+    para um registro de fim de etapa no log estruturado. O dicionário devolvido pode receber
+    `linhas_saida` (e outras informações) de qualquer forma.
+    """
+    with log_context(etapa=name, **info):
+        if _active is not None:
+            with _active.stage(name, rows_in, **info) as record:
+                yield record
+            return
+        record: Dict = {}
+        if not logger.isEnabledFor(logging.INFO):
+            yield record
+            return
+        wall = time.perf_counter()
+        yield record
+        duracao = time.perf_counter() - wall
+        logger.info(
+            "[Etapa] %s: %.3fs, linhas %s -> %s", name, duracao, rows_in, record.get('linhas_saida'),
+            extra={'evento': STAGE_EVENT, 'duracao_s': duracao,
+                   'linhas_entrada': rows_in, 'linhas_saida': record.get('linhas_saida')},
+        )
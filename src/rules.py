@@ -0,0 +1,145 @@
+import hashlib
+import json
+from typing import List, Mapping, NamedTuple, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# Nome da regra usada sem arquivo de regras: a tolerância global sobre a diferença absoluta de PU
+TOLERANCE_RULE = 'tolerancia_pu'
+
+# Colunas numéricas do relatório de comparação que as condições podem usar
+RULE_COLUMNS = [
+    'PU_BANCO', 'PU_BRITECH', 'PU_DIFF', 'PU_DIFF_VALOR', 'PU_DIFF_PERC', 'VALOR_DIF_REAL',
+    'VALOR_BRUTO_BANCO', 'VALOR_BRUTO_BRITECH', 'QTD_BANCO', 'QTD_BRITECH', 'DIST_DIAS', 'DIST_QTD',
+]
+
+# Coluna de onde sai a classe do ativo (a descrição da Britech, como 'CDB Banco X - Vcto: ...')
+CLASS_SOURCE_COLUMN = 'CODIGO_BRITECH'
+
+
+class InconsistencyRule(NamedTuple):
+    """
+    Critério de inconsistência. `condition` é uma expressão do `pd.eval` sobre as colunas de
+    RULE_COLUMNS (ex.: 'PU_DIFF_PERC > 0.0001 or VALOR_DIF_REAL > 50'). `classes` restringe a regra
+    a essas classes de ativo; as regras sem classes valem para as classes que não têm regra própria.
+    """
+    name: str
+    condition: str
+    classes: Tuple[str, ...] = ()
+
+
+def asset_classes(codes: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Classe de cada ativo: a primeira palavra da descrição, em maiúsculas ('CDB', 'LCA', 'DEBENTURE').
+    Retorna o código de cada linha (-1 para descrições nulas) e a classe de cada descrição distinta:
+    o texto é tratado uma vez por descrição, e não uma vez por linha.
+    """
+    codigos, distintos = pd.factorize(codes.astype(object))
+    classes = pd.Series(distintos, dtype=object).str.split(n=1).str[0].str.upper()
+    return codigos, classes.to_numpy(dtype=object)
+
+
+def _evaluate(condition: str, columns: Mapping):
+    """ Avalia a condição só com as colunas de RULE_COLUMNS, sem montar resolvedores para o relatório inteiro. """
+    return pd.eval(condition, resolvers=(columns,))
+
+
+def _as_mask(result, n_rows: int) -> np.ndarray:
+    """ Resultado do `eval` como máscara booleana; nulos não disparam a regra e constantes valem para todas as linhas. """
+    if isinstance(result, pd.Series):
+        return result.to_numpy(dtype=bool, na_value=False)
+    if isinstance(result, np.ndarray):
+        return result.astype(bool, copy=False)
+    return np.full(n_rows, bool(result))
+
+
+class RuleEngine:
+    """
+    Avalia os critérios de inconsistência sobre o relatório de comparação, de forma vetorizada.
+
+    Cada condição é validada na criação e avaliada com `pd.eval` sobre todas as linhas de uma
+    vez; a aplicabilidade por classe de ativo sai de uma tabela por descrição distinta indexada
+    pelo código de cada linha. O resultado de todas as regras forma uma matriz regras x linhas, da
+    qual saem, em uma passada, o status de cada linha e a primeira regra (na ordem do arquivo) que
+    disparou. O custo é linear no número de linhas.
+    """
+    def __init__(self, rules: Sequence[InconsistencyRule], origin: str = 'regras'):
+        if not rules:
+            raise ValueError(f"{origin}: informe ao menos uma regra de inconsistência.")
+        nomes = [rule.name for rule in rules]
+        repetidos = sorted({nome for nome in nomes if nomes.count(nome) > 1})
+        if repetidos:
+            raise ValueError(f"{origin}: nomes de regra repetidos {repetidos}.")
+
+        modelo = {col: np.array([], dtype=np.float64) for col in RULE_COLUMNS}
+        for rule in rules:
+            try:
+                resultado = _evaluate(rule.condition, modelo)
+            except Exception as e:
+                raise ValueError(f"Regra '{rule.name}' em {origin}: condição inválida '{rule.condition}' ({e}).") from e
+            if isinstance(resultado, np.ndarray) and resultado.dtype != bool:
+                raise ValueError(f"Regra '{rule.name}' em {origin}: a condição '{rule.condition}' não é uma comparação.")
+
+        self.rules = [rule._replace(classes=tuple(c.upper() for c in rule.classes)) for rule in rules]
+        self.names = np.array(nomes + [None], dtype=object)
+        self._specific = {c for rule in self.rules for c in rule.classes}
+
+    @classmethod
+    def from_tolerance(cls, tolerance: float) -> 'RuleEngine':
+        """ Critério original: diferença absoluta de PU acima da tolerância, para todas as classes. """
+        return cls([InconsistencyRule(TOLERANCE_RULE, f'PU_DIFF_VALOR > {tolerance!r}')])
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def signature(self) -> str:
+        """ Hash curto das regras, para invalidar resultados persistidos quando os critérios mudam. """
+        payload = json.dumps([list(rule) for rule in self.rules], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def evaluate(self, df: Union[pd.DataFrame, Mapping[str, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Status de inconsistência de cada linha e o nome da primeira regra que disparou (None se nenhuma).
+        `df` é o relatório de comparação ou um dicionário com as suas colunas (antes de montar o DataFrame).
+        """
+        n_rows = len(df) if isinstance(df, pd.DataFrame) else len(next(iter(df.values())))
+        colunas = {col: df[col] for col in RULE_COLUMNS if col in df}
+        disparou = np.zeros((len(self.rules), n_rows), dtype=bool)
+        if self._specific:
+            codigos, classes = asset_classes(df[CLASS_SOURCE_COLUMN])
+            # Uma posição extra no fim atende o código -1 (descrição nula), que não pertence a nenhuma classe
+            classes = np.append(classes, None)
+            com_regra_propria = np.array([c in self._specific for c in classes])[codigos]
+
+        for i, rule in enumerate(self.rules):
+            mask = _as_mask(_evaluate(rule.condition, colunas), n_rows)
+            if rule.classes:
+                mask &= np.array([c in rule.classes for c in classes])[codigos]
+            elif self._specific:
+                mask &= ~com_regra_propria
+            disparou[i] = mask
+
+        status = disparou.any(axis=0)
+        # argmax devolve a primeira regra verdadeira; as linhas sem regra apontam para o None do fim
+        primeira = np.where(status, disparou.argmax(axis=0), len(self.rules))
+        return status, self.names[primeira]
+
+
+def load_rules(path: str) -> RuleEngine:
+    """
+    Lê as regras de um arquivo JSON: uma lista, na ordem de prioridade, de objetos no formato
+    {"nome": ..., "condicao": "<expressão>", "classes": ["CDB", "LCA"]} (`classes` é opcional).
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: o arquivo de regras deve conter uma lista de regras.")
+
+    rules: List[InconsistencyRule] = []
+    for item in data:
+        if 'nome' not in item or 'condicao' not in item:
+            raise ValueError(f"{path}: toda regra precisa de 'nome' e 'condicao' ({item}).")
+        classes = item.get('classes', [])
+        rules.append(InconsistencyRule(item['nome'], item['condicao'], tuple([classes] if isinstance(classes, str) else classes)))
+    return RuleEngine(rules, origin=path)
@@ -0,0 +1,187 @@
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow é opcional: sem ele, os textos continuam como object
+    pa = None
+
+from src.keys import date_codes, dates_from_codes
+
+logger = logging.getLogger(__name__)
+
+# --- ESQUEMA COMPACTO DOS DADOS PREPARADOS E CONCILIADOS ---
+#
+# Os DataFrames preparados e o `merged_df` usam tipos compactos; a conversão de volta para
+# datas, floats e textos acontece só na geração do relatório de comparação (`expand_frame`).
+#   datas       -> int32 com o código de dias de `keys.date_codes` (0 representa data nula)
+#   quantidades -> Int64 em ponto fixo com QTD_FIXED_DECIMALS casas decimais
+#   valores     -> Int64 em ponto fixo com VALUE_FIXED_DECIMALS casas decimais
+#   textos      -> strings do Arrow (pd.ArrowDtype), quando o pyarrow está instalado
+#   TIPO_ID_USADO -> category
+# Os PUs continuam em float64: a comparação com a tolerância precisa da precisão completa.
+# Uma coluna com valores fora do limite do ponto fixo (int64) fica em float64 no DataFrame em que
+# aparece: `from_fixed` e `abs_difference` aceitam os dois formatos. As chaves dessas linhas já
+# vêm do caminho de hash de `keys.encode_keys`, calculado sobre os valores originais.
+
+QTD_FIXED_DECIMALS = 8
+VALUE_FIXED_DECIMALS = 6
+
+DATE_COLUMNS = ['APLICACAO_DATA_BANCO', 'VENCIMENTO_DATA_BANCO', 'OPERACAO_DATA_BRITECH', 'VENCIMENTO_DATA_BRITECH']
+FIXED_COLUMNS = {
+    'QTD_BANCO': QTD_FIXED_DECIMALS,
+    'QTD_BRITECH': QTD_FIXED_DECIMALS,
+    'VALOR_BRUTO_BANCO': VALUE_FIXED_DECIMALS,
+    'VALOR_BRUTO_BRITECH': VALUE_FIXED_DECIMALS,
+    'DIST_QTD': QTD_FIXED_DECIMALS,
+}
+TEXT_COLUMNS = ['ASSET_ID', 'CODIGO_BANCO', 'CODIGO_BRITECH']
+CATEGORY_COLUMNS = ['TIPO_ID_USADO']
+_COMPACT_COLUMNS = DATE_COLUMNS + list(FIXED_COLUMNS) + TEXT_COLUMNS + CATEGORY_COLUMNS
+
+
+def to_day_codes(dates: pd.Series) -> np.ndarray:
+    return date_codes(dates).astype(np.int32)
+
+
+def from_day_codes(codes: pd.Series) -> pd.Series:
+    return pd.Series(dates_from_codes(codes.to_numpy()), index=codes.index, name=codes.name)
+
+
+def _scaled(values: pd.Series, decimals: int):
+    floats = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    mask = np.isnan(floats)
+    scaled = np.rint(np.where(mask, 0.0, floats) * 10.0 ** decimals)
+    return floats, scaled, mask, np.abs(scaled) >= 2.0 ** 63
+
+
+def to_fixed(values: pd.Series, decimals: int) -> pd.Series:
+    """
+    Converte para inteiros em ponto fixo (Int64); valores nulos viram <NA>. Se algum valor excede o
+    limite do ponto fixo, a coluna segue em float64, com um aviso, em vez de interromper a execução.
+    """
+    floats, scaled, mask, overflow = _scaled(values, decimals)
+    if overflow.any():
+        logger.warning("[Esquema] %d valores de '%s' excedem o limite do ponto fixo com %d casas decimais; "
+                       "a coluna segue em float64.", int(overflow.sum()), values.name, decimals)
+        return pd.Series(floats, index=values.index, name=values.name)
+    return pd.Series(pd.arrays.IntegerArray(scaled.astype(np.int64), mask), index=values.index, name=values.name)
+
+
+def is_fixed(values: pd.Series) -> bool:
+    return values.dtype == 'Int64'
+
+
+def as_fixed(values: pd.Series, decimals: int) -> pd.Series:
+    """ Coluna em ponto fixo para os cálculos inteiros; numa coluna em float64, os valores fora do limite viram <NA>. """
+    if is_fixed(values):
+        return values
+    _, scaled, mask, overflow = _scaled(values, decimals)
+    mask |= overflow
+    integers = np.where(mask, 0, scaled).astype(np.int64)
+    return pd.Series(pd.arrays.IntegerArray(integers, mask), index=values.index, name=values.name)
+
+
+def from_fixed(values: pd.Series, decimals: int) -> pd.Series:
+    """ Volta do ponto fixo para float64; a divisão por uma potência de 10 exata é corretamente arredondada. """
+    if not is_fixed(values):
+        # Coluna que ficou em float64 por exceder o ponto fixo: já está na unidade original
+        return pd.Series(values.to_numpy(dtype=np.float64, na_value=np.nan), index=values.index, name=values.name)
+    integers = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.Series(integers / 10.0 ** decimals, index=values.index, name=values.name)
+
+
+def abs_difference(a: pd.Series, b: pd.Series, decimals: int) -> pd.Series:
+    """ |a - b| em float64: exata em ponto fixo quando as duas colunas estão nesse formato. """
+    if is_fixed(a) and is_fixed(b):
+        return from_fixed((a - b).abs(), decimals)
+    return (from_fixed(a, decimals) - from_fixed(b, decimals)).abs()
+
+
+def text_dtype():
+    """ Tipo compacto das colunas de texto; None quando o pyarrow não está disponível. """
+    return pd.ArrowDtype(pa.string()) if pa is not None else None
+
+
+def _is_compact(series: pd.Series, column: str) -> bool:
+    if column in DATE_COLUMNS:
+        return series.dtype == np.int32
+    if column in FIXED_COLUMNS:
+        return series.dtype == 'Int64'
+    if column in TEXT_COLUMNS:
+        return isinstance(series.dtype, pd.ArrowDtype)
+    return isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """ Aplica o esquema compacto às colunas presentes; colunas já compactas não são alteradas. """
+    converted = {}
+    for column in df.columns.intersection(_COMPACT_COLUMNS):
+        series = df[column]
+        if _is_compact(series, column):
+            continue
+        if column in DATE_COLUMNS:
+            converted[column] = to_day_codes(series)
+        elif column in FIXED_COLUMNS:
+            converted[column] = to_fixed(series, FIXED_COLUMNS[column])
+        elif column in TEXT_COLUMNS:
+            # Só colunas inteiramente textuais: códigos numéricos vindos do Excel seguem como estão
+            if pa is not None and pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+                converted[column] = series.astype(text_dtype())
+        else:
+            converted[column] = series.astype('category')
+    return df.assign(**converted) if converted else df
+
+
+def concat_frames(frames: List[pd.DataFrame], **kwargs) -> pd.DataFrame:
+    """
+    Concatena DataFrames compactos. Uma coluna em ponto fixo que ficou em float64 em algum deles
+    volta para float64 em todos, para não misturar as duas escalas.
+    """
+    em_float = {col for df in frames for col in df.columns.intersection(list(FIXED_COLUMNS)) if not is_fixed(df[col])}
+    if em_float:
+        frames = [df.assign(**{col: from_fixed(df[col], FIXED_COLUMNS[col]) for col in em_float if col in df.columns})
+                  for df in frames]
+    return pd.concat(frames, **kwargs)
+
+
+def expand_column(series: pd.Series) -> np.ndarray:
+    """ Valores de uma coluna compacta (pelo nome da coluna) nos tipos dos relatórios: datas, float64 e textos (object). """
+    if series.name in DATE_COLUMNS:
+        return dates_from_codes(series.to_numpy())
+    if series.name in FIXED_COLUMNS:
+        return from_fixed(series, FIXED_COLUMNS[series.name]).to_numpy()
+    return series.to_numpy(dtype=object, na_value=np.nan)
+
+
+def expand_columns(df: pd.DataFrame, columns: Optional[List[str]] = None,
+                   values: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+    """
+    Colunas de `df` nos tipos dos relatórios, na ordem de `columns` (as ausentes ficam nulas, como
+    no `reindex`); `values` traz colunas já calculadas, usadas como estão.
+    """
+    values = values or {}
+    data = {}
+    for column in (df.columns if columns is None else columns):
+        if column in values:
+            data[column] = values[column]
+        elif column not in df.columns:
+            data[column] = np.full(len(df), np.nan)
+        elif column in _COMPACT_COLUMNS and _is_compact(df[column], column):
+            data[column] = expand_column(df[column])
+        else:
+            data[column] = df[column].array
+    return data
+
+
+def expand_frame(df: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Converte as colunas compactas de volta para datas, float64 e textos (object), para os relatórios.
+    Com `columns`, seleciona e ordena as colunas como o `reindex`. O resultado é montado de uma vez,
+    sem cópias intermediárias do DataFrame.
+    """
+    data = expand_columns(df, columns)
+    return pd.DataFrame(data, index=df.index, columns=list(data))
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from src.batch import write_checker_reports
+from src.cache import PreparedFrameCache
+from src.data_processor import COLUNAS_BANCO, COLUNAS_BRITECH, ConsistencyChecker, DataCleaner
+from src.matcher import DEFAULT_STRATEGIES, NearestMatcher, SuccessiveMatcher
+from src.rules import RuleEngine
+from src.settings import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_SERVICE_ROOT
+
+logger = logging.getLogger(__name__)
+
+# Linhas inconsistentes devolvidas na resposta quando os relatórios não são gravados em disco
+MAX_RESPONSE_ROWS = 1000
+
+
+class BritechSnapshot:
+    """
+    Extrato da Britech preparado e indexado, mantido em memória entre as requisições.
+
+    A assinatura do arquivo (mtime e tamanho) é verificada a cada acesso e o extrato só é
+    recarregado quando ela muda. A recarga troca a referência inteira: requisições em andamento
+    continuam com a versão anterior, que nunca é alterada.
+    """
+    def __init__(self, file_path: str, cache: Optional[PreparedFrameCache] = None):
+        self.file_path = file_path
+        self.cache = cache
+        self.loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._state: Optional[Tuple[pd.DataFrame, SuccessiveMatcher]] = None
+
+    def _file_signature(self) -> Tuple[int, int]:
+        info = os.stat(self.file_path)
+        return info.st_mtime_ns, info.st_size
+
+    def get(self) -> Tuple[pd.DataFrame, SuccessiveMatcher]:
+        """ DataFrame preparado da Britech e o índice hash sobre ele, recarregados se o arquivo mudou. """
+        signature = self._file_signature()
+        with self._lock:
+            if signature != self._signature:
+                self._load(signature)
+            return self._state
+
+    def _load(self, signature: Tuple[int, int]):
+        inicio = time.perf_counter()
+        # Normalizado uma única vez, como o ConsistencyChecker faria: as posições do índice hash coincidem
+        # e cada requisição usa o DataFrame como está
+        df_britech = ConsistencyChecker.normalize_input(DataCleaner(self.file_path, COLUNAS_BRITECH, cache=self.cache).prepare_britech_data())
+        matcher = SuccessiveMatcher(df_britech, DEFAULT_STRATEGIES)
+        # As tabelas hash do pandas são construídas no primeiro acesso: aqui, e não na primeira requisição
+        for index in matcher.indexes.values():
+            index.is_unique
+        self._state = (df_britech, matcher)
+        self._signature = signature
+        self.loaded_at = time.time()
+        logger.info("[Serviço] Britech carregada: %d linhas em %.2fs (%s)", len(df_britech), time.perf_counter() - inicio, self.file_path)
+
+
+class ReconciliationService:
+    """
+    Concilia extratos do Banco sob demanda contra o extrato da Britech mantido em memória
+    (`BritechSnapshot`). O custo de cada requisição fica restrito à preparação do Banco e à conciliação.
+    Os caminhos recebidos pelo HTTP são resolvidos sob `root_dir` (`resolve_path`).
+    """
+    def __init__(self, britech_file: str, cache: Optional[PreparedFrameCache] = None, nearest: Optional[NearestMatcher] = None,
+                 duplicates: str = 'raise', formats: Sequence[str] = ('excel',), rules: Optional[RuleEngine] = None,
+                 root_dir: str = DEFAULT_SERVICE_ROOT):
+        self.snapshot = BritechSnapshot(britech_file, cache)
+        self.root_dir = os.path.realpath(root_dir)
+        self.cache = cache
+        self.nearest = nearest
+        self.duplicates = duplicates
+        self.rules = rules
+        self.formats = list(formats)
+
+    def resolve_path(self, path: str) -> str:
+        """
+        Caminho absoluto de `path` (relativo a `root_dir`), já sem links simbólicos. Caminhos que
+        saem de `root_dir` (absolutos, com '..' ou por links) geram PermissionError.
+        """
+        resolved = os.path.realpath(os.path.join(self.root_dir, path))
+        if os.path.commonpath([self.root_dir, resolved]) != self.root_dir:
+            raise PermissionError(f"Caminho fora do diretório permitido ({self.root_dir}): {path}")
+        return resolved
+
+    def reconcile(self, banco_file: str, output_dir: Optional[str] = None, formats: Optional[Sequence[str]] = None,
+                  top_n: int = MAX_RESPONSE_ROWS) -> Dict:
+        """
+        Concilia um extrato do Banco. Com `output_dir`, grava os relatórios como no modo lote e retorna
+        as contagens; sem ele, retorna as contagens e as `top_n` maiores inconsistências.
+        """
+        if not os.path.exists(banco_file):
+            raise FileNotFoundError(f"Extrato do Banco não encontrado: {banco_file}")
+        inicio = time.perf_counter()
+        df_britech, matcher = self.snapshot.get()
+        df_banco = DataCleaner(banco_file, COLUNAS_BANCO, cache=self.cache).prepare_banco_data()
+        checker = ConsistencyChecker(df_banco, df_britech, nearest=self.nearest, duplicates=self.duplicates,
+                                     britech_matcher=matcher, rules=self.rules)
+
+        resposta = {'LINHAS_BANCO': len(df_banco), 'LINHAS_BRITECH': len(df_britech)}
+        if output_dir:
+            resposta.update(write_checker_reports(checker, output_dir, formats or self.formats))
+            resposta['RELATORIOS'] = os.path.abspath(output_dir)
+        else:
+            df_inconsistencias = checker.get_inconsistent_dataframe()
+            resposta.update({
+                'CONCILIADOS': len(checker.merged_df),
+                'INCONSISTENCIAS': len(df_inconsistencias),
+                'SOMENTE_BANCO': len(checker.banco_only_pos),
+                'SOMENTE_BRITECH': len(checker.britech_only_pos),
+                'QUARENTENA': len(checker.quarantine_banco_pos) + len(checker.quarantine_britech_pos),
+                # to_json converte datas, NaN e tipos do NumPy para JSON
+                'LINHAS_INCONSISTENTES': json.loads(df_inconsistencias.head(top_n).to_json(orient='records', date_format='iso')),
+            })
+        resposta['DURACAO_S'] = time.perf_counter() - inicio
+        logger.info("[Serviço] %s: %s pares em %.3fs", banco_file, resposta.get('CONCILIADOS', 0), resposta['DURACAO_S'])
+        return resposta
+
+    def status(self) -> Dict:
+        return {'BRITECH': self.snapshot.file_path, 'CARREGADA_EM': self.snapshot.loaded_at}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /status    -> extrato da Britech em memória
+    POST /conciliar -> JSON {"banco": caminho, "output_dir": opcional, "formats": opcional, "top_n": opcional}
+
+    Os caminhos `banco` e `output_dir` precisam ficar sob o diretório raiz do serviço.
+    """
+    def do_GET(self):
+        if self.path != '/status':
+            self._send_json(404, {'ERRO': f'Rota desconhecida: {self.path}'})
+            return
+        self._send_json(200, self.server.service.status())
+
+    def do_POST(self):
+        if self.path != '/conciliar':
+            self._send_json(404, {'ERRO': f'Rota desconhecida: {self.path}'})
+            return
+        try:
+            corpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            banco_file, output_dir = corpo['banco'], corpo.get('output_dir')
+            if not isinstance(banco_file, str) or not isinstance(output_dir, (str, type(None))):
+                raise TypeError(corpo)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self._send_json(400, {'ERRO': "Corpo inválido: informe um JSON com o caminho do extrato em 'banco' "
+                                          "(e, opcionalmente, o diretório dos relatórios em 'output_dir')."})
+            return
+        try:
+            top_n = int(corpo.get('top_n', MAX_RESPONSE_ROWS))
+            if top_n < 0:
+                raise ValueError(top_n)
+        except (ValueError, TypeError):
+            self._send_json(400, {'ERRO': f"'top_n' inválido: {corpo.get('top_n')!r} (informe um inteiro não negativo)."})
+            return
+
+        service = self.server.service
+        try:
+            banco_file = service.resolve_path(banco_file)
+            if output_dir:
+                output_dir = service.resolve_path(output_dir)
+            resposta = service.reconcile(banco_file, output_dir, corpo.get('formats'), top_n)
+        except PermissionError as e:
+            self._send_json(403, {'ERRO': str(e)})
+        except FileNotFoundError as e:
+            self._send_json(404, {'ERRO': str(e)})
+        except ValueError as e:
+            # Chaves duplicadas no modo padrão, formatos de saída desconhecidos
+            self._send_json(422, {'ERRO': str(e)})
+        except Exception as e:
+            logger.error("[Serviço] Falha ao conciliar %s: %s", banco_file, e, exc_info=True)
+            self._send_json(500, {'ERRO': str(e)})
+        else:
+            self._send_json(200, resposta)
+
+    def _send_json(self, status: int, payload: Dict):
+        corpo = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args):
+        # O endereço do cliente não existe em sockets Unix; as requisições vão para o log da aplicação
+        logger.debug("[Serviço] " + format, *args)
+
+
+class _PooledServerMixin:
+    """ Atende as conexões em um pool fixo de threads (o ThreadingMixIn criaria uma thread por conexão). """
+    def __init__(self, *args, workers: Optional[int] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='conciliacao')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_in_pool, request, client_address)
+
+    def _process_in_pool(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+class PooledHTTPServer(_PooledServerMixin, HTTPServer):
+    pass
+
+
+class PooledUnixHTTPServer(_PooledServerMixin, socketserver.UnixStreamServer):
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def make_server(service: ReconciliationService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                socket_path: Optional[str] = None, workers: Optional[int] = None) -> socketserver.BaseServer:
+    """ Servidor HTTP (TCP ou, com `socket_path`, socket Unix) com o serviço anexado. """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = PooledUnixHTTPServer(socket_path, _RequestHandler, workers=workers)
+    else:
+        server = PooledHTTPServer((host, port), _RequestHandler, workers=workers)
+    server.service = service
+    return server
+
+
+def serve(service: ReconciliationService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+          socket_path: Optional[str] = None, workers: Optional[int] = None):
+    """ Carrega a Britech e atende requisições até ser interrompido (Ctrl+C). """
+    server = make_server(service, host, port, socket_path, workers)
+    service.snapshot.get()
+    endereco = socket_path or f'http://{host}:{server.server_address[1]}'
+    logger.info("[Serviço] Aguardando requisições em %s", endereco)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("[Serviço] Encerrando...")
+    finally:
+        server.server_close()
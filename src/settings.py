@@ -0,0 +1,18 @@
+# --- CONSTANTES COMPARTILHADAS COM A LINHA DE COMANDO ---
+#
+# Só a biblioteca padrão pode ser importada aqui: o main.py monta os argumentos com estes valores
+# sem carregar pandas, NumPy ou openpyxl. Os módulos de processamento importam os valores daqui.
+
+# Limite padrão de tamanho do cache em disco (em bytes)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Orçamento de memória padrão do modo streaming (em bytes)
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+# Formatos dos relatórios (chaves de `utils.utils.SINKS`)
+OUTPUT_FORMATS = ['excel', 'csv', 'parquet', 'arrow']
+# Tratamento das chaves duplicadas: 'raise' interrompe a conciliação; 'group' concilia dentro dos grupos
+DUPLICATE_MODES = ('raise', 'group')
+# Endereço padrão do modo serviço
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Diretório sob o qual ficam os caminhos recebidos pelo modo serviço (extratos e relatórios)
+DEFAULT_SERVICE_ROOT = '.'
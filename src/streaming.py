@@ -0,0 +1,221 @@
+import logging
+import os
+import pickle
+import tempfile
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.data_processor import COLUNAS_SOMENTE_BANCO, COLUNAS_SOMENTE_BRITECH, ConsistencyChecker, DataCleaner
+from src.keys import key_components, quantity_buckets
+from src.rules import RuleEngine
+from src.schema import concat_frames
+from src.settings import DEFAULT_MEMORY_BUDGET
+from utils.utils import CsvSink
+
+logger = logging.getLogger(__name__)
+
+# Número de partições gravadas em disco; são agrupadas na conciliação conforme o orçamento
+DEFAULT_BUCKETS = 256
+# Fator entre o tamanho em disco de uma partição e a memória usada para conciliá-la
+# (DataFrames preparados, merge e colunas de comparação)
+PARTITION_MEMORY_FACTOR = 6
+
+_SIDES = {
+    'banco': 'QTD_BANCO',
+    'britech': 'QTD_BRITECH',
+}
+_UNMATCHED_COLUMNS = {'banco': COLUNAS_SOMENTE_BANCO, 'britech': COLUNAS_SOMENTE_BRITECH}
+
+
+class StreamingReconciler:
+    """
+    Conciliação em modo streaming, para extratos que não cabem em memória.
+
+    Os dois arquivos são lidos em blocos de linhas, preparados bloco a bloco e distribuídos em
+    partições gravadas em disco pelo hash da quantidade (presente em todas as chaves). Uma partição
+    que sozinha excede o orçamento (muitas posições com a mesma quantidade) é dividida de novo pelos
+    componentes das chaves (`keys.key_components`). Em seguida, as partições são conciliadas em grupos
+    que cabem no orçamento de memória e os resultados são acrescentados aos arquivos CSV de saída à
+    medida que ficam prontos.
+
+    Como cada grupo de partições é processado separadamente, o relatório fica ordenado por
+    VALOR_DIF_REAL dentro de cada grupo, e não globalmente.
+    """
+    def __init__(self, banco_file: str, banco_columns: List[str], britech_file: str, britech_columns: List[str],
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET, n_buckets: int = DEFAULT_BUCKETS,
+                 spill_dir: Optional[str] = None, rules: Optional[RuleEngine] = None):
+        self.inputs = {
+            'banco': DataCleaner(banco_file, banco_columns, lazy=True),
+            'britech': DataCleaner(britech_file, britech_columns, lazy=True),
+        }
+        self.memory_budget = memory_budget
+        self.n_buckets = n_buckets
+        self.spill_dir = spill_dir
+        self.rules = rules
+        self._sink = CsvSink()
+        # DataFrames vazios com o esquema de cada lado, para partições sem linhas de um dos lados
+        self._templates: Dict[str, pd.DataFrame] = {}
+
+    def _spill_path(self, tmp_dir: str, kind: str, bucket: int) -> str:
+        return os.path.join(tmp_dir, f'{kind}_{bucket:04d}.pkl')
+
+    def _spill(self, tmp_dir: str, kind: str) -> int:
+        """ Lê um dos arquivos em blocos e acrescenta cada bloco preparado às partições em disco. """
+        cleaner = self.inputs[kind]
+        chunk_bytes = self.memory_budget // 4
+        total = 0
+
+        for chunk in cleaner.iter_prepared_chunks(kind, chunk_bytes):
+            self._templates.setdefault(kind, chunk.iloc[:0])
+            total += len(chunk)
+            buckets = quantity_buckets(chunk[_SIDES[kind]], self.n_buckets)
+            for bucket, part in chunk.groupby(buckets, sort=False):
+                with open(self._spill_path(tmp_dir, kind, bucket), 'ab') as f:
+                    pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        logger.info("[Streaming] %s: %d linhas preparadas gravadas em partições", kind, total)
+        return total
+
+    def _iter_parts(self, tmp_dir: str, kind: str, bucket: int) -> Iterator[pd.DataFrame]:
+        """ Blocos gravados em uma partição, na ordem de gravação. """
+        path = self._spill_path(tmp_dir, kind, bucket)
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def _read_partition(self, tmp_dir: str, kind: str, buckets: List[int]) -> pd.DataFrame:
+        parts = [part for bucket in buckets for part in self._iter_parts(tmp_dir, kind, bucket)]
+        return concat_frames(parts) if parts else self._templates[kind]
+
+    def _partition_bytes(self, tmp_dir: str, bucket: int, kinds: Sequence[str] = tuple(_SIDES)) -> int:
+        """ Memória estimada para conciliar a partição (0 quando ela não tem linhas). """
+        paths = [self._spill_path(tmp_dir, kind, bucket) for kind in kinds]
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path)) * PARTITION_MEMORY_FACTOR
+
+    def _split_partition(self, tmp_dir: str, bucket: int, size: int, first_id: int) -> List[int]:
+        """
+        Divide uma partição grande demais em partições menores, com identificadores a partir de
+        `first_id`. Só as chaves são lidas para montar os componentes (`keys.key_components`); as
+        linhas são regravadas bloco a bloco, com os componentes distribuídos entre as novas partições.
+        """
+        chaves = [part[['KEY_VENC', 'KEY_APL']].to_numpy() for kind in _SIDES for part in self._iter_parts(tmp_dir, kind, bucket)]
+        chaves = np.concatenate(chaves)
+        componentes = key_components(chaves[:, 0], chaves[:, 1])
+
+        # Componentes inteiros são acumulados em cada nova partição até a cota de linhas
+        n_partes = -(-size // self.memory_budget)
+        linhas = np.bincount(componentes)
+        cota = -(-len(componentes) // n_partes)
+        parte_do_componente = (np.cumsum(linhas) - linhas) // cota
+        if parte_do_componente[-1] == 0:
+            # Um único componente: as posições compartilham chaves e precisam ser conciliadas juntas
+            return [bucket]
+
+        partes = parte_do_componente[componentes] + first_id
+        inicio = 0
+        for kind in _SIDES:
+            for part in self._iter_parts(tmp_dir, kind, bucket):
+                destino = partes[inicio:inicio + len(part)]
+                inicio += len(part)
+                for novo, sub in part.groupby(destino, sort=False):
+                    with open(self._spill_path(tmp_dir, kind, novo), 'ab') as f:
+                        pickle.dump(sub, f, protocol=pickle.HIGHEST_PROTOCOL)
+            if os.path.exists(self._spill_path(tmp_dir, kind, bucket)):
+                os.remove(self._spill_path(tmp_dir, kind, bucket))
+
+        novas = sorted(set(partes.tolist()))
+        logger.info("[Streaming] Partição %s (%d bytes estimados) dividida em %d partições", bucket, size, len(novas))
+        return novas
+
+    def _iter_partitions(self, tmp_dir: str, kinds: Sequence[str] = tuple(_SIDES)) -> Iterator[int]:
+        """ Partições com linhas de algum dos lados `kinds`; as que excedem o orçamento são divididas antes. """
+        next_id = self.n_buckets
+        for bucket in range(self.n_buckets):
+            size = self._partition_bytes(tmp_dir, bucket, kinds)
+            if not size:
+                continue
+            if size <= self.memory_budget:
+                yield bucket
+                continue
+            novas = self._split_partition(tmp_dir, bucket, size, next_id)
+            next_id = max(next_id, max(novas) + 1)
+            yield from novas
+
+    def _iter_bucket_groups(self, tmp_dir: str, kinds: Sequence[str] = tuple(_SIDES)) -> Iterator[List[int]]:
+        """ Agrupa partições consecutivas enquanto a memória estimada couber no orçamento. """
+        group, group_bytes = [], 0
+        for bucket in self._iter_partitions(tmp_dir, kinds):
+            size = self._partition_bytes(tmp_dir, bucket, kinds)
+            if group and group_bytes + size > self.memory_budget:
+                yield group
+                group, group_bytes = [], 0
+            if size > self.memory_budget:
+                logger.warning("[Streaming] Partição %s excede o orçamento de memória sozinha (%d bytes estimados); "
+                               "as posições compartilham chaves e não podem ser separadas", bucket, size)
+            group.append(bucket)
+            group_bytes += size
+
+        if group:
+            yield group
+
+    def run(self, output_total: str, output_inconsistent: str, output_banco_only: Optional[str] = None,
+            output_britech_only: Optional[str] = None) -> Dict[str, int]:
+        """
+        Executa a conciliação completa e grava os relatórios em CSV de forma incremental, pelo
+        `CsvSink.append`; as saídas são nomes base, aos quais o sink acrescenta '.csv'. Como as
+        chaves incluem a quantidade, uma posição sem par na sua partição não tem par em nenhuma
+        outra: as posições somente no Banco e somente na Britech também são gravadas por grupo.
+        """
+        summary = {'linhas_banco': 0, 'linhas_britech': 0, 'conciliados': 0, 'inconsistentes': 0,
+                   'somente_banco': 0, 'somente_britech': 0}
+        for base_name in (output_total, output_inconsistent, output_banco_only, output_britech_only):
+            if base_name and os.path.exists(self._sink.path_for(base_name)):
+                os.remove(self._sink.path_for(base_name))
+
+        with tempfile.TemporaryDirectory(prefix='pu_streaming_', dir=self.spill_dir) as tmp_dir:
+            summary['linhas_banco'] = self._spill(tmp_dir, 'banco')
+            summary['linhas_britech'] = self._spill(tmp_dir, 'britech')
+            if len(self._templates) < len(_SIDES):
+                # Sem linhas de um dos lados, todas as posições do outro ficam sem par
+                logger.warning("[Streaming] Um dos arquivos não tem linhas válidas; nada a conciliar.")
+                for kind, base_name in (('banco', output_banco_only), ('britech', output_britech_only)):
+                    summary[f'somente_{kind}'] = self._write_unmatched(tmp_dir, kind, base_name)
+                return summary
+
+            for group in self._iter_bucket_groups(tmp_dir):
+                df_banco, df_britech = (self._read_partition(tmp_dir, kind, group) for kind in _SIDES)
+                checker = ConsistencyChecker(df_banco, df_britech, rules=self.rules)
+                df_completo, df_inconsistencias = checker.get_comparison_dataframe(), checker.get_inconsistent_dataframe()
+
+                self._sink.append(df_completo, output_total)
+                self._sink.append(df_inconsistencias, output_inconsistent)
+                summary['conciliados'] += len(df_completo)
+                summary['inconsistentes'] += len(df_inconsistencias)
+                summary['somente_banco'] += len(checker.banco_only_pos)
+                summary['somente_britech'] += len(checker.britech_only_pos)
+                if output_banco_only:
+                    self._sink.append(checker.get_banco_only_dataframe(), output_banco_only)
+                if output_britech_only:
+                    self._sink.append(checker.get_britech_only_dataframe(), output_britech_only)
+
+        logger.info("[Streaming] Conciliação concluída: %s", summary)
+        return summary
+
+    def _write_unmatched(self, tmp_dir: str, kind: str, base_name: Optional[str]) -> int:
+        """ Grava todas as linhas de um lado como posições sem par, grupo a grupo; retorna a quantidade. """
+        if kind not in self._templates:
+            return 0
+        total = 0
+        for group in self._iter_bucket_groups(tmp_dir, (kind,)):
+            df = self._read_partition(tmp_dir, kind, group)
+            total += len(df)
+            if base_name:
+                self._sink.append(ConsistencyChecker._unmatched(df, np.arange(len(df)), _UNMATCHED_COLUMNS[kind]), base_name)
+        return total
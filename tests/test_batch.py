@@ -0,0 +1,41 @@
+# tests/test_batch.py
+
+import os
+import shutil
+from src.batch import SUMMARY_FILE, discover_pairs, read_manifest, run_batch
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def _copy_statements(dest_dir, britech=True):
+    os.makedirs(dest_dir, exist_ok=True)
+    shutil.copy(os.path.join(DATA_DIR, 'Extrato_Banco.xlsx'), dest_dir)
+    if britech:
+        shutil.copy(os.path.join(DATA_DIR, 'Extrato_Britech.xlsx'), dest_dir)
+
+
+def test_discover_pairs_and_manifest(tmp_path):
+    _copy_statements(tmp_path / 'fundo_a')
+    _copy_statements(tmp_path / 'grupo' / 'fundo_b')
+    _copy_statements(tmp_path / 'incompleto', britech=False)
+
+    pairs = discover_pairs(str(tmp_path))
+    assert [p.carteira for p in pairs] == ['fundo_a', os.path.join('grupo', 'fundo_b')]
+
+    manifest = tmp_path / 'manifesto.csv'
+    manifest.write_text("carteira,banco,britech\nfundo_a,fundo_a/Extrato_Banco.xlsx,fundo_a/Extrato_Britech.xlsx\n")
+    assert read_manifest(str(manifest)) == pairs[:1]
+
+
+def test_run_batch_isolates_failures(tmp_path):
+    _copy_statements(tmp_path / 'in' / 'fundo_a')
+    _copy_statements(tmp_path / 'in' / 'fundo_quebrado', britech=False)
+    (tmp_path / 'in' / 'fundo_quebrado' / 'Extrato_Britech.xlsx').write_text('arquivo inválido')
+
+    resumo = run_batch(discover_pairs(str(tmp_path / 'in')), str(tmp_path / 'out'), workers=2)
+
+    status = dict(zip(resumo['CARTEIRA'], resumo['STATUS']))
+    assert status == {'fundo_a': 'OK', 'fundo_quebrado': 'ERRO'}
+    assert resumo.set_index('CARTEIRA').loc['fundo_a', 'TAXA_CONCILIACAO'] == 1.0
+    assert (tmp_path / 'out' / 'fundo_a' / 'relatorio_comparacao_completa.xlsx').exists()
+    assert (tmp_path / 'out' / SUMMARY_FILE).exists()
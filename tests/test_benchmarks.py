@@ -0,0 +1,52 @@
+# tests/test_benchmarks.py
+
+from benchmarks.bench import compare_with_baseline, run_benchmarks
+from benchmarks.generator import generate_statement_pair, write_statement_xlsx
+from src.data_processor import COLUNAS_BANCO, COLUNAS_BRITECH, ConsistencyChecker, DataCleaner
+
+
+def test_generated_statements_reconcile_at_configured_rate(tmp_path):
+    raw_banco, raw_britech = generate_statement_pair(
+        2000, match_rate=0.8, nat_rate=0.1, text_value_rate=0.0, inconsistency_rate=0.05, seed=1
+    )
+    banco_xlsx, britech_xlsx = tmp_path / 'Extrato_Banco.xlsx', tmp_path / 'Extrato_Britech.xlsx'
+    write_statement_xlsx(raw_banco, str(banco_xlsx))
+    write_statement_xlsx(raw_britech, str(britech_xlsx))
+
+    df_banco = DataCleaner(str(banco_xlsx), COLUNAS_BANCO).prepare_banco_data()
+    df_britech = DataCleaner(str(britech_xlsx), COLUNAS_BRITECH).prepare_britech_data()
+    df_completo = ConsistencyChecker(df_banco, df_britech).get_comparison_dataframe()
+
+    assert len(df_banco) == 2000 and len(df_britech) == 2000
+    assert len(df_completo) == 1600
+    assert set(df_completo['TIPO_ID_USADO']) == {'VENCIMENTO', 'APLICACAO'}
+    assert 0 < df_completo['STATUS_INCONSISTENCIA'].sum() < 200
+
+
+def test_generator_injects_duplicates_and_text_values():
+    raw_banco, _ = generate_statement_pair(1000, duplicate_rate=0.05, text_value_rate=0.1, subtotal_rate=0.0)
+
+    assert raw_banco.duplicated(subset=['Vcto.', 'Qtd.']).sum() > 0
+    assert raw_banco['Valor Bruto'].map(lambda v: isinstance(v, str) and v.startswith('R$ ')).sum() > 0
+
+
+def test_compare_with_baseline_flags_only_slow_stages():
+    baseline = {'merge@10': {'segundos': 1.0}, 'chaves@10': {'segundos': 1.0}}
+    resultados = {
+        'merge@10': {'segundos': 1.5},
+        'chaves@10': {'segundos': 1.1},
+        'comparacao@10': {'segundos': 9.0},
+    }
+
+    regressoes = compare_with_baseline(resultados, baseline, threshold=0.25)
+
+    assert len(regressoes) == 1 and regressoes[0].startswith('merge@10')
+
+
+def test_run_benchmarks_measures_every_stage():
+    resultados = run_benchmarks([300], repeat=1)
+
+    etapas = {nome.split('@')[0] for nome in resultados}
+    assert etapas == {'carga_excel', 'preparacao_banco', 'preparacao_britech', 'chaves',
+                      'merge', 'comparacao', 'relatorio_csv', 'relatorio_excel'}
+    assert all(medida['segundos'] > 0 for medida in resultados.values())
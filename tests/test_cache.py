@@ -0,0 +1,49 @@
+# tests/test_cache.py
+
+import os
+import pandas as pd
+import src.data_processor as data_processor
+from src.cache import PreparedFrameCache
+from src.data_processor import DataCleaner
+
+COLUNAS_BANCO = ['Código', 'Aplicação', 'Qtd.', 'PU Atual', 'Vcto.', 'Valor Bruto']
+
+
+def test_cache_roundtrip_preserves_frame(mock_banco_df, tmp_path):
+    cache = PreparedFrameCache(str(tmp_path / "cache"))
+    df = mock_banco_df.set_index(mock_banco_df.index + 10)
+
+    cache.put("chave", df)
+
+    pd.testing.assert_frame_equal(cache.get("chave"), df)
+    assert cache.get("outra_chave") is None
+
+
+def test_warm_run_skips_excel_loading(mock_raw_data_header_test, tmp_path, monkeypatch):
+    mock_file = tmp_path / "banco.xlsx"
+    mock_raw_data_header_test.to_excel(mock_file, index=False, header=False)
+    cache = PreparedFrameCache(str(tmp_path / "cache"))
+
+    df_frio = DataCleaner(str(mock_file), COLUNAS_BANCO, cache=cache).prepare_banco_data()
+
+    def _falha(*args, **kwargs):
+        raise AssertionError("O Excel não deveria ser lido com o cache quente")
+
+    monkeypatch.setattr(data_processor, "open_sheet_rows", _falha)
+    df_quente = DataCleaner(str(mock_file), COLUNAS_BANCO, cache=cache).prepare_banco_data()
+
+    pd.testing.assert_frame_equal(df_quente, df_frio)
+
+
+def test_cache_eviction_by_size(mock_banco_df, tmp_path):
+    cache = PreparedFrameCache(str(tmp_path / "cache"), max_bytes=10 ** 9)
+    cache.put("antiga", mock_banco_df)
+    cache.put("recente", mock_banco_df)
+    os.utime(tmp_path / "cache" / "antiga" / "meta.json", (0, 0))
+
+    entry_size = sum(e.stat().st_size for e in os.scandir(tmp_path / "cache" / "recente"))
+    cache.max_bytes = entry_size
+    cache.evict()
+
+    assert cache.get("antiga") is None
+    assert cache.get("recente") is not None
@@ -0,0 +1,64 @@
+# tests/test_cli.py
+
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+from main import BANCO_FILE, BRITECH_FILE, parse_args
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Orçamento de inicialização do `validate-headers` (interpretador + leitura dos dois cabeçalhos), com folga para CI
+STARTUP_BUDGET_S = 1.5
+
+_CHECK_IMPORTS = (
+    "import sys, main; rc = main.main(['validate-headers'] + sys.argv[1:]); "
+    "pesados = [m for m in ('pandas', 'numpy', 'openpyxl') if m in sys.modules]; "
+    "print(','.join(pesados)); sys.exit(rc)"
+)
+
+
+def _run_cli(tmp_path, *args):
+    return subprocess.run([sys.executable, '-c', _CHECK_IMPORTS, *args], cwd=tmp_path, capture_output=True, text=True,
+                          env={**os.environ, 'PYTHONPATH': ROOT_DIR})
+
+
+def test_validate_headers_within_startup_budget_without_heavy_imports(tmp_path):
+    inicio = time.perf_counter()
+    resultado = _run_cli(tmp_path, BANCO_FILE, BRITECH_FILE)
+    duracao = time.perf_counter() - inicio
+
+    assert resultado.returncode == 0, resultado.stderr
+    assert resultado.stdout.strip() == ''
+    assert "'banco' na linha 23" in resultado.stderr and "'britech' na linha 5" in resultado.stderr
+    assert duracao < STARTUP_BUDGET_S
+    assert not (tmp_path / 'log.log').exists()
+
+
+def test_validate_headers_fails_on_unknown_layout(tmp_path):
+    arquivo = tmp_path / 'Extrato_Outro.xlsx'
+    pd.DataFrame({'Ativo': ['CDB'], 'Quantidade': [1.0]}).to_excel(arquivo, index=False)
+
+    assert _run_cli(tmp_path, str(arquivo)).returncode == 1
+    assert _run_cli(tmp_path, '--layout', 'banco', BRITECH_FILE).returncode == 1
+    assert _run_cli(tmp_path, str(tmp_path / 'inexistente.xlsx')).returncode == 1
+
+
+def test_options_without_subcommand_default_to_run():
+    args = parse_args(['--no-cache', '--duplicates', 'group'])
+
+    assert args.command == 'run' and args.no_cache and args.duplicates == 'group'
+    assert parse_args(['batch', '--manifest', 'lote.csv']).manifest == 'lote.csv'
+
+
+@pytest.mark.parametrize('fontes', [['RISCO=a.xlsx', 'risco=b.xlsx'], ['britech=c.xlsx']])
+def test_source_names_must_be_unique_and_not_reserved(fontes, capsys):
+    with pytest.raises(SystemExit):
+        parse_args(['--fontes', *fontes])
+
+    assert '--fontes' in capsys.readouterr().err
+    assert parse_args(['--fontes', 'RISCO=a.xlsx', 'TESOURARIA=b.xlsx']).fontes == [('RISCO', 'a.xlsx'), ('TESOURARIA', 'b.xlsx')]
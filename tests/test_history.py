@@ -0,0 +1,84 @@
+# tests/test_history.py
+
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data_processor import ConsistencyChecker
+from src.history import PUHistoryStore
+
+
+def _run(asset_ids, pu_diff, fonte=None):
+    df = pd.DataFrame({
+        'ASSET_ID': asset_ids, 'TIPO_ID_USADO': 'VENCIMENTO', 'CODIGO_BANCO': 'CDB',
+        'PU_BANCO': 100.0 + np.asarray(pu_diff), 'PU_BRITECH': 100.0, 'PU_DIFF': pu_diff,
+        'PU_DIFF_PERC': np.abs(pu_diff) / 100.0, 'VALOR_DIF_REAL': 0.0, 'STATUS_INCONSISTENCIA': np.abs(pu_diff) > 1e-6,
+    })
+    if fonte is not None:
+        df.insert(0, 'FONTE', fonte)
+    return df
+
+
+def test_append_comparison_and_query_asset_history(mock_banco_df, mock_britech_df, tmp_path):
+    df_completo = ConsistencyChecker(mock_banco_df, mock_britech_df).get_comparison_dataframe()
+
+    with PUHistoryStore(str(tmp_path / 'historico.sqlite')) as store:
+        assert store.append(df_completo, '2024-01-02') == len(df_completo)
+        with pytest.raises(ValueError, match='ordem cronológica'):
+            store.append(df_completo, date(2024, 1, 2))
+
+        inconsistente = df_completo[df_completo['CODIGO_BANCO'] == 'DB_INCONSISTENTE'].iloc[0]
+        historico = store.asset_history(inconsistente['ASSET_ID'])
+
+    assert historico['DATA_EXECUCAO'].tolist() == [pd.Timestamp('2024-01-02')]
+    assert historico['PU_DIFF'].iloc[0] == pytest.approx(inconsistente['PU_DIFF'])
+    assert historico['STATUS_INCONSISTENCIA'].tolist() == [True]
+
+
+def test_top_drift_and_rolling_stats_over_windows(tmp_path):
+    inicio = date(2024, 1, 1)
+    dias = [inicio + timedelta(days=k) for k in range(0, 60, 2)]
+    deriva = np.array([k * 1e-4 for k in range(len(dias))])
+
+    with PUHistoryStore(str(tmp_path / 'historico.sqlite')) as store:
+        for k, dia in enumerate(dias):
+            # O ativo 'B' repete no relatório (lotes agrupados) e 'C' some depois da primeira metade
+            ids = ['A', 'B', 'B'] + (['C'] if k < 15 else [])
+            store.append(_run(ids, [deriva[k], 1e-3, 1e-3, -2 * deriva[k]][:len(ids)]), dia)
+
+        todos = store.top_drift(days=60, n=10)
+        recentes = store.top_drift(days=20, n=10)
+        moveis = store.rolling_stats('A', window=3)
+
+        assert len(store.run_dates()) == len(dias)
+        assert store.asset_history('inexistente').empty
+
+    x = np.array([(dia - inicio).days for dia in dias])
+    assert todos['ASSET_ID'].tolist() == ['C', 'A', 'B']
+    assert todos.set_index('ASSET_ID')['TENDENCIA_DIA']['A'] == pytest.approx(np.polyfit(x, deriva, 1)[0])
+    assert todos.set_index('ASSET_ID')['TENDENCIA_DIA']['B'] == pytest.approx(0.0, abs=1e-12)
+    assert todos.set_index('ASSET_ID')['EXECUCOES'].to_dict() == {'C': 15, 'A': 30, 'B': 60}
+
+    # Na janela de 20 dias, 'C' já não tem execuções
+    assert recentes['ASSET_ID'].tolist() == ['A', 'B']
+    assert recentes['EXECUCOES'].tolist() == [10, 20]
+    assert recentes['PU_DIFF_MEDIO'].iloc[0] == pytest.approx(deriva[-10:].mean())
+    assert recentes['PU_DIFF_ULTIMO'].iloc[0] == pytest.approx(deriva[-1])
+
+    assert moveis['PU_DIFF_MEDIA'].to_numpy() == pytest.approx(pd.Series(deriva).rolling(3, min_periods=1).mean().to_numpy())
+    assert moveis['PU_DIFF_MAX'].iloc[-1] == pytest.approx(deriva[-1])
+
+
+def test_multi_source_frames_are_stored_per_source(tmp_path):
+    df = pd.concat([_run(['A'], [1e-3], 'BRITECH'), _run(['A'], [5e-3], 'RISCO')], ignore_index=True)
+
+    with PUHistoryStore(str(tmp_path / 'historico.sqlite')) as store:
+        store.append(df, '2024-01-02')
+        # Cada fonte tem a sua sequência de datas
+        store.append(_run(['A'], [2e-3], 'RISCO'), '2024-01-03')
+
+        assert store.asset_history('A')['PU_DIFF'].tolist() == pytest.approx([1e-3])
+        assert store.asset_history('A', fonte='RISCO')['PU_DIFF'].tolist() == pytest.approx([5e-3, 2e-3])
+        assert store.top_drift(days=5, fonte='RISCO')['TENDENCIA_DIA'].iloc[0] == pytest.approx(-3e-3)
@@ -0,0 +1,82 @@
+# tests/test_incremental.py
+
+from datetime import datetime
+
+import pandas as pd
+
+from src.data_processor import ConsistencyChecker
+from src.incremental import IncrementalReconciler
+from src.keys import encode_keys
+
+
+def _sorted(df):
+    return df.sort_values('ASSET_ID').reset_index(drop=True)
+
+
+def test_first_run_reports_all_inconsistencies_as_new(mock_banco_df, mock_britech_df, tmp_path):
+    df_completo, df_delta = IncrementalReconciler(str(tmp_path)).run(mock_banco_df, mock_britech_df)
+
+    assert len(df_completo) == 4
+    assert df_delta['DELTA'].tolist() == ['NOVA']
+    assert df_delta['CODIGO_BANCO'].tolist() == ['DB_INCONSISTENTE']
+
+
+def test_second_run_only_rechecks_changed_rows(mock_banco_df, mock_britech_df, tmp_path, caplog):
+    reconciler = IncrementalReconciler(str(tmp_path))
+    reconciler.run(mock_banco_df, mock_britech_df)
+
+    # Corrige o PU inconsistente e cria uma nova divergência em outro ativo
+    dia_seguinte = mock_banco_df.copy()
+    dia_seguinte.loc[dia_seguinte['CODIGO_BANCO'] == 'DB_INCONSISTENTE', 'PU_BANCO'] = 100.0
+    dia_seguinte.loc[dia_seguinte['CODIGO_BANCO'] == 'CDB_MATCH_VENC', 'PU_BANCO'] = 10.5
+
+    with caplog.at_level('INFO'):
+        df_completo, df_delta = reconciler.run(dia_seguinte, mock_britech_df)
+
+    esperado = ConsistencyChecker(dia_seguinte, mock_britech_df).get_comparison_dataframe()
+    assert _sorted(df_completo).equals(_sorted(esperado))
+
+    delta = dict(zip(df_delta['CODIGO_BANCO'], df_delta['DELTA']))
+    assert delta == {'CDB_MATCH_VENC': 'NOVA', 'DB_INCONSISTENTE': 'RESOLVIDA'}
+    assert 'pares reaproveitados: 2' in caplog.text
+
+
+def test_pairs_with_quantities_beyond_fixed_point_are_not_duplicated(tmp_path):
+    # Quantidades com mais de 8 casas decimais não voltam iguais do ponto fixo do esquema compacto
+    quantidades = [100.123456789, 0.1 + 0.2]
+    datas = [datetime(2025, 1, 1), datetime(2026, 1, 1)]
+    banco = pd.DataFrame({
+        'CODIGO_BANCO': ['X', 'Y'], 'APLICACAO_DATA_BANCO': [datetime(2024, 1, 1)] * 2, 'VENCIMENTO_DATA_BANCO': datas,
+        'QTD_BANCO': quantidades, 'PU_BANCO': [10.0, 5.0], 'VALOR_BRUTO_BANCO': [1000.0, 250.0],
+    })
+    britech = pd.DataFrame({
+        'CODIGO_BRITECH': ['X', 'Y'], 'OPERACAO_DATA_BRITECH': [datetime(2024, 1, 1)] * 2, 'VENCIMENTO_DATA_BRITECH': datas,
+        'QTD_BRITECH': quantidades, 'PU_BRITECH': [10.0, 5.0], 'VALOR_BRUTO_BRITECH': [1000.0, 250.0],
+    })
+    for df, aplicacao, vencimento, qtd in ((banco, 'APLICACAO_DATA_BANCO', 'VENCIMENTO_DATA_BANCO', 'QTD_BANCO'),
+                                           (britech, 'OPERACAO_DATA_BRITECH', 'VENCIMENTO_DATA_BRITECH', 'QTD_BRITECH')):
+        df['KEY_VENC'] = encode_keys(df[vencimento], df[qtd])
+        df['KEY_APL'] = encode_keys(df[aplicacao], df[qtd])
+
+    reconciler = IncrementalReconciler(str(tmp_path))
+    reconciler.run(banco, britech)
+    dia_seguinte = banco.copy()
+    dia_seguinte.loc[0, 'PU_BANCO'] = 11.0
+    df_completo, df_delta = reconciler.run(dia_seguinte, britech)
+
+    assert sorted(df_completo['CODIGO_BANCO']) == ['X', 'Y']
+    assert df_delta['CODIGO_BANCO'].tolist() == ['X']
+
+
+def test_delta_tells_apart_pairs_sharing_an_asset_id():
+    # Dois pares com o mesmo ASSET_ID (mesmo vencimento e quantidade), mas de ativos diferentes
+    pares = pd.DataFrame({
+        'ASSET_ID': ['20250101_100', '20250101_100'], 'CODIGO_BANCO': ['A', 'B'], 'CODIGO_BRITECH': ['A', 'B'],
+        'KEY_VENC': [1, 1], 'KEY_APL': [2, 3],
+    })
+    anterior = pares.assign(STATUS_INCONSISTENCIA=[True, False])
+    atual = pares.assign(STATUS_INCONSISTENCIA=[False, True])
+
+    delta = IncrementalReconciler._delta(anterior, atual)
+
+    assert dict(zip(delta['CODIGO_BANCO'], delta['DELTA'])) == {'A': 'RESOLVIDA', 'B': 'NOVA'}
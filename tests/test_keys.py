@@ -0,0 +1,47 @@
+# tests/test_keys.py
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from src.keys import encode_asset_id_strings, encode_keys, key_components, render_asset_ids
+
+
+def test_encode_keys_matches_legacy_string_keys():
+    datas = pd.Series([datetime(2025, 1, 1), pd.NaT, datetime(2026, 1, 1)])
+    qtds = pd.Series([100.0, 50.0, 2.5])
+
+    chaves = encode_keys(datas, qtds)
+    legado = encode_asset_id_strings(pd.Series(['20250101_100', 'NULL_VENC_50', '20260101_2.5']))
+
+    assert chaves.dtype == np.int64
+    np.testing.assert_array_equal(chaves, legado)
+
+
+def test_encode_keys_is_exact_for_unpackable_quantities():
+    datas = pd.Series([datetime(2025, 1, 1)] * 5)
+    qtds = pd.Series([1.00001, 1.00002, -3.0, np.nan, np.nan])
+
+    chaves = encode_keys(datas, qtds)
+
+    assert len(set(chaves[:3])) == 3
+    assert (chaves[:3] < 0).all()
+    assert chaves[3] == chaves[4]
+
+
+def test_render_asset_ids():
+    datas = pd.Series([datetime(2025, 1, 1), pd.NaT, pd.NaT])
+    qtds = pd.Series([100.0, 50.0, 2.5])
+    tipos = pd.Series(['VENCIMENTO', 'VENCIMENTO', 'APLICACAO'])
+
+    ids = render_asset_ids(datas, qtds, tipos)
+
+    assert ids.tolist() == ['20250101_100', 'NULL_VENC_50', 'NULL_APL_2.5']
+
+
+def test_key_components_join_rows_sharing_either_key():
+    venc = np.array([1, 1, 5, 7, 9, 11])
+    apl = np.array([2, 3, 3, 8, 2, 12])
+
+    componentes = key_components(venc, apl)
+
+    assert componentes.tolist() == [0, 0, 0, 1, 0, 2]
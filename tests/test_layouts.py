@@ -0,0 +1,73 @@
+# tests/test_layouts.py
+
+import json
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from src.data_processor import COLUNAS_BANCO, DataCleaner
+from src.layouts import detect_header, layout_registry, layouts_for, load_layouts
+
+
+def test_detect_header_accepts_aliases_and_returns_mapping():
+    preview = [
+        ('Relatório XPTO', None),
+        ('Código', 'Aplicação', 'Qtd.'),
+        ('', 'CÓD.', 'data aplicacao', 'Quantidade', 'PU', 'Vencimento', '  Saldo   Bruto ', 'Emitente'),
+        ('CDB100', 45000, 100.0, 1.5, 46000, 150.0, 'XPTO'),
+    ]
+
+    match = detect_header(preview, layout_registry())
+
+    assert match.row == 2
+    assert match.layout.name == 'banco'
+    assert match.mapping == {
+        'CÓD.': 'Código', 'data aplicacao': 'Aplicação', 'Quantidade': 'Qtd.',
+        'PU': 'PU Atual', 'Vencimento': 'Vcto.', 'Saldo   Bruto': 'Valor Bruto',
+    }
+    assert detect_header(preview[:2], layout_registry()) is None
+
+
+def test_custodian_layout_from_json_is_loaded_without_code_changes(tmp_path):
+    layouts_dir = tmp_path / 'layouts'
+    layouts_dir.mkdir()
+    (layouts_dir / 'custodiante_x.json').write_text(json.dumps({
+        'nome': 'custodiante_x',
+        'extrato': 'banco',
+        'colunas': {
+            'Código': ['Papel'], 'Aplicação': ['Data Compra'], 'Qtd.': ['Qtde Total'],
+            'PU Atual': ['Preço Mercado'], 'Vcto.': ['Data Resgate'], 'Valor Bruto': ['Posição'],
+        },
+    }), encoding='utf-8')
+
+    raw = pd.DataFrame([
+        ['Custodiante X', None, None, None, None, None],
+        ['Papel', 'Data Compra', 'Qtde Total', 'Preço Mercado', 'Data Resgate', 'Posição'],
+        ['CDB100', datetime(2023, 1, 1), 100.0, 1.5, datetime(2025, 1, 1), 150.0],
+    ])
+    arquivo = tmp_path / 'Extrato_Custodiante.xlsx'
+    raw.to_excel(arquivo, index=False, header=False)
+
+    cleaner = DataCleaner(str(arquivo), COLUNAS_BANCO, layouts=layouts_for(COLUNAS_BANCO, layout_registry(str(layouts_dir))))
+    df = cleaner.prepare_banco_data()
+
+    assert cleaner.header_match.layout.name == 'custodiante_x'
+    assert cleaner.header_match.mapping['Preço Mercado'] == 'PU Atual'
+    assert list(df['CODIGO_BANCO']) == ['CDB100']
+    assert df['PU_BANCO'].iloc[0] == pytest.approx(1.5)
+
+
+def test_load_layouts_rejects_incomplete_or_ambiguous_layouts(tmp_path):
+    incompleto = tmp_path / 'incompleto.json'
+    incompleto.write_text(json.dumps({'nome': 'x', 'extrato': 'britech', 'colunas': {'QUANTIDADE': ['QTD']}}), encoding='utf-8')
+    with pytest.raises(ValueError, match="as colunas devem ser exatamente"):
+        load_layouts(str(incompleto))
+
+    colunas = {col: [] for col in COLUNAS_BANCO}
+    colunas['Vcto.'] = ['Data']
+    colunas['Aplicação'] = ['DATA']
+    ambiguo = tmp_path / 'ambiguo.json'
+    ambiguo.write_text(json.dumps([{'nome': 'y', 'extrato': 'banco', 'colunas': colunas}]), encoding='utf-8')
+    with pytest.raises(ValueError, match="aparece em 'Aplicação' e 'Vcto.'"):
+        load_layouts(str(ambiguo))
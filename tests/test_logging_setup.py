@@ -0,0 +1,86 @@
+# tests/test_logging_setup.py
+
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from src.logging_setup import (configure_logging, init_process_logging, log_context, process_logging_args,
+                               shutdown_logging)
+from src.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def restore_root_level():
+    level = logging.getLogger().level
+    yield
+    shutdown_logging()
+    logging.getLogger().setLevel(level)
+
+
+def _records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def _log_in_worker(carteira):
+    with log_context(carteira=carteira):
+        logger.warning("processo da carteira %s", carteira)
+
+
+def test_structured_records_carry_run_id_stage_and_context(tmp_path, restore_root_level):
+    log_path = configure_logging(str(tmp_path), run_id='20240102-090000-abc123')
+    with log_context(arquivo='Extrato_Banco.xlsx'):
+        with stage('preparacao.banco', rows_in=10) as etapa:
+            logger.info("linhas válidas: %d", 8)
+            etapa['linhas_saida'] = 8
+    try:
+        raise ValueError('falhou')
+    except ValueError:
+        logger.error("erro fora da etapa", exc_info=True)
+    shutdown_logging()
+
+    mensagem, fim_etapa, erro = _records(log_path)
+    assert mensagem['mensagem'] == 'linhas válidas: 8'
+    assert (mensagem['run_id'], mensagem['etapa'], mensagem['arquivo']) == ('20240102-090000-abc123', 'preparacao.banco', 'Extrato_Banco.xlsx')
+    assert fim_etapa['evento'] == 'etapa'
+    assert (fim_etapa['linhas_entrada'], fim_etapa['linhas_saida']) == (10, 8)
+    assert fim_etapa['duracao_s'] >= 0
+    assert 'etapa' not in erro and 'ValueError: falhou' in erro['excecao']
+
+
+
+def test_message_keeps_the_arguments_as_they_were_when_logged(tmp_path, restore_root_level):
+    log_path = configure_logging(str(tmp_path), run_id='20240102-090000-abc123')
+    resumo = {'conciliados': 1}
+    logger.info("resumo: %s", resumo)
+    resumo['conciliados'] = 2
+    shutdown_logging()
+
+    registro, = _records(log_path)
+    assert registro['mensagem'] == "resumo: {'conciliados': 1}"
+
+def test_old_runs_are_pruned_and_disabled_levels_skip_stage_records(tmp_path, restore_root_level):
+    for k in range(4):
+        configure_logging(str(tmp_path), keep=2, run_id=f'20240102-09000{k}-abc123')
+    log_path = configure_logging(str(tmp_path), level=logging.WARNING, keep=2, run_id='20240102-090009-abc123')
+    with stage('conciliacao.merge', rows_in=5) as etapa:
+        etapa['linhas_saida'] = 5
+    shutdown_logging()
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['execucao_20240102-090003-abc123.jsonl', 'execucao_20240102-090009-abc123.jsonl']
+    assert _records(log_path) == []
+
+
+def test_worker_process_records_reach_the_run_file(tmp_path, restore_root_level):
+    log_path = configure_logging(str(tmp_path), run_id='20240102-090000-abc123')
+    with ProcessPoolExecutor(max_workers=2, initializer=init_process_logging, initargs=process_logging_args()) as executor:
+        list(executor.map(_log_in_worker, ['A', 'B']))
+    shutdown_logging()
+
+    registros = _records(log_path)
+    assert sorted(r['carteira'] for r in registros) == ['A', 'B']
+    assert {r['run_id'] for r in registros} == {'20240102-090000-abc123'}
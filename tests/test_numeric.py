@@ -0,0 +1,53 @@
+# tests/test_numeric.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from src.numeric import parse_br_numbers
+
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('R$ 1.234,56', 1234.56),
+    ('R$\xa0-1.234.567,89', -1234567.89),
+    ('(1.234,56)', -1234.56),
+    ('1234,56', 1234.56),
+    ('1234.56', 1234.56),
+    ('1.234.567', 1234567.0),
+    ('  42  ', 42.0),
+    ('123456789012345678901234,5', 123456789012345678901234.5),
+])
+def test_parse_brazilian_text(texto, esperado):
+    valores, invalidas = parse_br_numbers(pd.Series([texto], dtype=object))
+
+    assert valores.iloc[0] == esperado
+    assert invalidas.empty
+
+
+def test_invalid_cells_are_reported_by_row_index():
+    coluna = pd.Series(['R$ 10,00', 'abc', '', None, '1,2,3', 7.5, '5 R$', True], index=range(10, 18), dtype=object)
+
+    valores, invalidas = parse_br_numbers(coluna)
+
+    assert list(invalidas) == [11, 14, 16, 17]
+    assert valores[10] == 10.0 and valores[15] == 7.5
+    assert valores[[11, 12, 13, 14, 16, 17]].isna().all()
+
+
+def test_numeric_cells_pass_through_unchanged():
+    valores = np.random.default_rng(0).uniform(0, 1e7, 1000)
+    coluna = pd.Series(list(valores[:500]) + [f"{v:.17g}".replace('.', ',') for v in valores[500:]], dtype=object)
+
+    convertidos, invalidas = parse_br_numbers(coluna)
+
+    np.testing.assert_array_equal(convertidos.to_numpy()[:500], valores[:500])
+    np.testing.assert_array_equal(convertidos.to_numpy()[500:], valores[500:])
+    assert invalidas.empty
+
+
+def test_text_matches_float_exactly_for_every_length():
+    rng = np.random.default_rng(1)
+    textos = [f"{v:.{casas}f}" for casas in range(0, 12) for v in rng.uniform(0, 10 ** rng.integers(1, 10), 200)]
+
+    convertidos, _ = parse_br_numbers(pd.Series(textos, dtype=object))
+
+    np.testing.assert_array_equal(convertidos.to_numpy(), [float(t) for t in textos])
@@ -0,0 +1,39 @@
+# tests/test_parallel_load.py
+
+import os
+import pandas as pd
+import pytest
+from src.data_processor import COLUNAS_BANCO, COLUNAS_BRITECH, ConsistencyChecker, DataCleaner
+from src.parallel_load import export_frame, import_frame, load_prepared_concurrently
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+BANCO_FILE = os.path.join(DATA_DIR, 'Extrato_Banco.xlsx')
+BRITECH_FILE = os.path.join(DATA_DIR, 'Extrato_Britech.xlsx')
+
+
+def test_shared_memory_roundtrip(mock_britech_df):
+    df = mock_britech_df.set_index(mock_britech_df.index * 3).astype({'TIPO_ID_USADO': 'category'})
+
+    pd.testing.assert_frame_equal(import_frame(export_frame(df)), df)
+    pd.testing.assert_frame_equal(import_frame(export_frame(df.iloc[:0])), df.iloc[:0])
+
+
+def test_compact_columns_travel_through_shared_memory(mock_britech_df):
+    """Int64 (com nulos), textos do Arrow (com nulos e fatiados), categorias e datas não passam por pickle."""
+    pytest.importorskip('pyarrow')
+    df = ConsistencyChecker.normalize_input(mock_britech_df).drop(columns=['ASSET_ID_VENC', 'ASSET_ID_APL'])
+    df['QTD_BRITECH'] = df['QTD_BRITECH'].astype('Int64').mask(df.index == 1)
+    df['CODIGO_BRITECH'] = df['CODIGO_BRITECH'].mask(df.index == 2)
+    df['DATA'] = pd.to_datetime(['2024-01-01', None, '2024-01-03', '2024-01-04', '2024-01-05'])
+    df = df.iloc[1:]
+
+    meta = export_frame(df)
+    assert meta['objects'] == {}
+    pd.testing.assert_frame_equal(import_frame(meta), df)
+
+
+def test_concurrent_load_matches_sequential():
+    df_banco, df_britech = load_prepared_concurrently(BANCO_FILE, BRITECH_FILE)
+
+    pd.testing.assert_frame_equal(df_banco, DataCleaner(BANCO_FILE, COLUNAS_BANCO).prepare_banco_data())
+    pd.testing.assert_frame_equal(df_britech, DataCleaner(BRITECH_FILE, COLUNAS_BRITECH).prepare_britech_data())
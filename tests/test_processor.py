@@ -1,7 +1,11 @@
 # tests/test_processor.py
 
+import numpy as np
 import pytest
-from src.data_processor import DataCleaner, ConsistencyChecker
+import pandas as pd
+from src.data_processor import DataCleaner, ConsistencyChecker, MultiSourceChecker
+from src.matcher import DEFAULT_STRATEGIES, KeyStrategy, NearestMatcher
+from src.schema import compact_frame
 
 
 class MockDataCleaner(DataCleaner):
@@ -27,6 +31,26 @@ def test_find_header_row_success(mock_raw_data_header_test, tmp_path):
     assert header_index == 2
 
 
+def test_load_data_single_pass_matches_read_excel(mock_raw_data_header_test, tmp_path):
+    mock_file = tmp_path / "temp_load_test.xlsx"
+    mock_raw_data_header_test.to_excel(mock_file, index=False, header=False)
+
+    required_cols = ['Código', 'Aplicação', 'Qtd.', 'PU Atual', 'Vcto.', 'Valor Bruto']
+    cleaner = DataCleaner(str(mock_file), required_columns=required_cols)
+
+    expected = pd.read_excel(mock_file, header=2)
+    expected.columns = expected.columns.str.strip()
+    pd.testing.assert_frame_equal(cleaner.df, expected, check_dtype=False)
+
+
+def test_load_data_header_not_found(mock_raw_data_header_test, tmp_path):
+    mock_file = tmp_path / "temp_no_header.xlsx"
+    mock_raw_data_header_test.to_excel(mock_file, index=False, header=False)
+
+    with pytest.raises(Exception, match="A linha de cabeçalho não foi encontrada"):
+        DataCleaner(str(mock_file), required_columns=['Coluna Inexistente'])
+
+
 # ---------- ConsistencyChecker ----------
 
 def test_merge_priority_vencimento_first(mock_banco_df, mock_britech_df):
@@ -74,6 +98,43 @@ def test_asset_without_vencimento_is_matched_by_aplicacao(
     assert tipo_usado == 'APLICACAO'
 
 
+def test_null_date_keys_do_not_collide_across_strategies():
+    """
+    Uma chave de vencimento nulo e uma de aplicação nula com a mesma quantidade têm o mesmo
+    código; os dois pares devem ser mantidos, como no merge por estratégia do legado.
+    """
+    nulo = pd.NaT
+    df_banco = pd.DataFrame({
+        'index_BANCO': [0, 1],
+        'CODIGO_BANCO': ['A', 'B'],
+        'APLICACAO_DATA_BANCO': pd.to_datetime(['2024-01-01', nulo]),
+        'VENCIMENTO_DATA_BANCO': pd.to_datetime([nulo, '2025-01-01']),
+        'QTD_BANCO': [100.0, 100.0],
+        'PU_BANCO': [10.0, 10.0],
+        'VALOR_BRUTO_BANCO': [1000.0, 1000.0],
+        'ASSET_ID_VENC': ['NULL_VENC_100', '20250101_100'],
+        'ASSET_ID_APL': ['20240101_100', 'NULL_APL_100'],
+    })
+    df_britech = pd.DataFrame({
+        'index_BRITECH': [0, 1],
+        'CODIGO_BRITECH': ['X', 'Y'],
+        'OPERACAO_DATA_BRITECH': pd.to_datetime(['2023-06-01', nulo]),
+        'VENCIMENTO_DATA_BRITECH': pd.to_datetime([nulo, '2026-01-01']),
+        'QTD_BRITECH': [100.0, 100.0],
+        'VALOR_BRUTO_BRITECH': [1000.0, 1000.0],
+        'PU_BRITECH': [10.0, 10.0],
+        'ASSET_ID_VENC': ['NULL_VENC_100', '20260101_100'],
+        'ASSET_ID_APL': ['20230601_100', 'NULL_APL_100'],
+    })
+
+    df_merged = ConsistencyChecker(df_banco, df_britech).merged_df
+    pares = dict(zip(df_merged['CODIGO_BANCO'], zip(df_merged['CODIGO_BRITECH'], df_merged['TIPO_ID_USADO'])))
+    assert pares == {'A': ('X', 'VENCIMENTO'), 'B': ('Y', 'APLICACAO')}
+
+    df_multi = MultiSourceChecker(df_banco, {'BRITECH': df_britech}).get_comparison_dataframe(sort=False)
+    assert set(zip(df_multi['CODIGO_BANCO'], df_multi['CODIGO_BRITECH'])) == {('A', 'X'), ('B', 'Y')}
+
+
 def test_inconsistent_dataframe_only_inconsistent_items(
     mock_banco_df, mock_britech_df, tolerance
 ):
@@ -88,7 +149,201 @@ def test_inconsistent_dataframe_only_inconsistent_items(
     assert pu_diff == pytest.approx(0.00001, rel=1e-10)
 
 
+def test_comparison_is_cached_until_tolerance_changes(mock_banco_df, mock_britech_df):
+    checker = ConsistencyChecker(mock_banco_df, mock_britech_df)
+    df_completo = checker.get_comparison_dataframe()
+
+    assert checker.get_comparison_dataframe() is df_completo
+    assert len(checker.get_inconsistent_dataframe()) == 1
+
+    checker.tolerance = 1.0
+    assert checker.get_comparison_dataframe() is not df_completo
+    assert checker.get_inconsistent_dataframe().empty
+
+
+def test_top_n_matches_sorted_head(mock_banco_df, mock_britech_df):
+    checker = ConsistencyChecker(mock_banco_df, mock_britech_df)
+    top = checker.get_comparison_dataframe(top_n=1)
+
+    ordenado = ConsistencyChecker(mock_banco_df, mock_britech_df).get_comparison_dataframe()
+    pd.testing.assert_frame_equal(top, ordenado.head(1))
+
+
 def test_duplicate_keys_raise_error(mock_duplicate_keys_df, mock_britech_df):
     """Duplicidade de chave deve ser detectada."""
     with pytest.raises(ValueError):
         ConsistencyChecker(mock_duplicate_keys_df, mock_britech_df)
+
+
+def test_duplicate_keys_grouped_by_application_date(mock_duplicate_keys_df, mock_britech_df):
+    """No modo 'group', a chave duplicada é desempatada pela data de aplicação e a conciliação continua."""
+    checker = ConsistencyChecker(mock_duplicate_keys_df, mock_britech_df, duplicates='group')
+    df_merged = checker.merged_df.set_index('CODIGO_BANCO')
+
+    assert df_merged.loc['CDB_MATCH_VENC', 'CODIGO_BRITECH'] == 'CDB_MATCH_VENC_B'
+    assert df_merged.loc['LCA_MATCH_APL', 'CODIGO_BRITECH'] == 'LCA_MATCH_APL_B'
+    assert df_merged.loc['LCA_MATCH_APL', 'TIPO_ID_USADO'] == 'APLICACAO'
+    assert checker.get_quarantine_dataframe().empty
+
+
+def _lots(prefixo, datas_aplicacao, valores):
+    """Lotes com o mesmo vencimento e a mesma quantidade (chaves de vencimento iguais)."""
+    n = len(valores)
+    return pd.DataFrame({
+        f'CODIGO_{prefixo}': [f'LOTE_{prefixo}_{i}' for i in range(n)],
+        'DATA_APLICACAO': pd.to_datetime(datas_aplicacao),
+        'DATA_VENCIMENTO': [pd.Timestamp(2029, 1, 1)] * n,
+        'QTD': [300.0] * n,
+        'VALOR_BRUTO': valores,
+        'PU': [v / 300.0 for v in valores],
+        'ASSET_ID_VENC': ['20290101_300'] * n,
+        'ASSET_ID_APL': [f'{pd.Timestamp(d):%Y%m%d}_300' for d in datas_aplicacao],
+    })
+
+
+def test_ambiguous_duplicate_lots_go_to_quarantine(mock_banco_df, mock_britech_df):
+    """Lotes desempatados pelo valor formam par; os idênticos dos dois lados ficam em quarentena."""
+    colunas_banco = ['CODIGO_BANCO', 'APLICACAO_DATA_BANCO', 'VENCIMENTO_DATA_BANCO', 'QTD_BANCO', 'VALOR_BRUTO_BANCO', 'PU_BANCO']
+    colunas_britech = ['CODIGO_BRITECH', 'OPERACAO_DATA_BRITECH', 'VENCIMENTO_DATA_BRITECH', 'QTD_BRITECH', 'VALOR_BRUTO_BRITECH', 'PU_BRITECH']
+    datas = ['2024-05-01'] * 4
+    lotes_banco = _lots('BANCO', datas, [3000.0, 3100.0, 3200.0, 3200.0])
+    lotes_britech = _lots('BRITECH', datas, [3100.001, 3000.0, 3200.0, 3200.0])
+    df_banco = pd.concat([mock_banco_df, lotes_banco.set_axis(colunas_banco + ['ASSET_ID_VENC', 'ASSET_ID_APL'], axis=1)], ignore_index=True)
+    df_britech = pd.concat([mock_britech_df, lotes_britech.set_axis(colunas_britech + ['ASSET_ID_VENC', 'ASSET_ID_APL'], axis=1)], ignore_index=True)
+
+    with pytest.raises(ValueError):
+        ConsistencyChecker(df_banco, df_britech)
+    checker = ConsistencyChecker(df_banco, df_britech, duplicates='group')
+    pares = dict(zip(checker.merged_df['CODIGO_BANCO'], checker.merged_df['CODIGO_BRITECH']))
+    quarentena = checker.get_quarantine_dataframe()
+
+    assert pares['LOTE_BANCO_0'] == 'LOTE_BRITECH_1'
+    assert pares['LOTE_BANCO_1'] == 'LOTE_BRITECH_0'
+    assert pares['CDB_MATCH_VENC'] == 'CDB_MATCH_VENC_B'
+    assert sorted(quarentena['CODIGO']) == ['LOTE_BANCO_2', 'LOTE_BANCO_3', 'LOTE_BRITECH_2', 'LOTE_BRITECH_3']
+    assert quarentena['LADO'].value_counts().to_dict() == {'BANCO': 2, 'BRITECH': 2}
+    assert 'LOTE_BANCO_2' not in set(checker.get_banco_only_dataframe()['CODIGO_BANCO'])
+
+
+def test_invalid_duplicate_mode(mock_banco_df, mock_britech_df):
+    with pytest.raises(ValueError):
+        ConsistencyChecker(mock_banco_df, mock_britech_df, duplicates='ignorar')
+
+
+def test_custom_strategy_order(mock_banco_df, mock_britech_df):
+    """A lista de estratégias define a prioridade das chaves."""
+    estrategias = list(reversed(DEFAULT_STRATEGIES))
+    checker = ConsistencyChecker(mock_banco_df, mock_britech_df, strategies=estrategias)
+    df_merged = checker.merged_df
+
+    linha = df_merged.loc[df_merged['CODIGO_BANCO'] == 'CDB_MATCH_VENC'].iloc[0]
+    assert linha['TIPO_ID_USADO'] == 'APLICACAO'
+    assert linha['ASSET_ID'] == '20240101_100'
+
+
+def test_extra_fallback_strategy(mock_banco_df, mock_britech_df):
+    """Uma estratégia extra só concilia linhas que sobraram das anteriores."""
+    mock_banco_df['KEY_CODIGO'] = [1, 2, 3, 4]
+    mock_britech_df['KEY_CODIGO'] = [1, 2, 3, 5, 4]
+    estrategias = DEFAULT_STRATEGIES[:1] + [
+        KeyStrategy('CODIGO', 'KEY_CODIGO', 'VENCIMENTO_DATA_BANCO', 'NULL_COD')
+    ]
+
+    checker = ConsistencyChecker(mock_banco_df, mock_britech_df, strategies=estrategias)
+    df_merged = checker.merged_df.set_index('CODIGO_BANCO')
+
+    assert df_merged.loc['CDB_MATCH_VENC', 'TIPO_ID_USADO'] == 'VENCIMENTO'
+    assert df_merged.loc['ATIVO_SEM_MATCH_B', 'TIPO_ID_USADO'] == 'CODIGO'
+    assert df_merged.loc['ATIVO_SEM_MATCH_B', 'CODIGO_BRITECH'] == 'OUTRO_APL'
+
+
+@pytest.fixture
+def drifted_inputs(mock_banco_df, mock_britech_df):
+    """Quantidade com desvio na 5ª casa decimal e vencimento com um dia de diferença."""
+    mock_britech_df.loc[0, ['QTD_BRITECH', 'ASSET_ID_VENC', 'ASSET_ID_APL']] = [100.00001, '20250101_100.00001', '20240101_100.00001']
+    mock_banco_df.loc[3, ['APLICACAO_DATA_BANCO', 'ASSET_ID_APL']] = [pd.Timestamp(2024, 4, 5), '20240405_500']
+    return mock_banco_df, mock_britech_df
+
+
+def test_nearest_matches_drifted_rows_and_records_distance(drifted_inputs):
+    df_banco, df_britech = drifted_inputs
+    assert len(ConsistencyChecker(df_banco, df_britech).merged_df) == 2
+
+    checker = ConsistencyChecker(df_banco, df_britech, nearest=NearestMatcher(max_days=3, max_qty=1e-4))
+    df = checker.get_comparison_dataframe().set_index('CODIGO_BANCO')
+
+    assert df.loc['CDB_MATCH_VENC', 'TIPO_ID_USADO'] == 'APROX_VENCIMENTO'
+    assert df.loc['CDB_MATCH_VENC', 'DIST_DIAS'] == 0
+    assert df.loc['CDB_MATCH_VENC', 'DIST_QTD'] == pytest.approx(1e-5)
+    assert df.loc['ATIVO_SEM_MATCH_B', 'CODIGO_BRITECH'] == 'ATIVO_SEM_MATCH_BT'
+    assert df.loc['ATIVO_SEM_MATCH_B', 'DIST_DIAS'] == 1
+    assert df.loc['DB_INCONSISTENTE', 'DIST_DIAS'] == 0
+
+
+def test_nearest_respects_tolerances(drifted_inputs):
+    df_banco, df_britech = drifted_inputs
+    checker = ConsistencyChecker(df_banco, df_britech, nearest=NearestMatcher(max_days=0, max_qty=1e-6))
+
+    assert set(checker.merged_df['CODIGO_BANCO']) == {'LCA_MATCH_APL', 'DB_INCONSISTENTE'}
+
+
+def test_nearest_pairs_are_one_to_one():
+    """Duas linhas do Banco disputam o mesmo vizinho: a mais próxima fica com ele e a outra, com o seguinte."""
+    data = pd.Timestamp(2025, 1, 1)
+    df_banco = compact_frame(pd.DataFrame({
+        'VENCIMENTO_DATA_BANCO': [data, data], 'APLICACAO_DATA_BANCO': [pd.NaT, pd.NaT], 'QTD_BANCO': [10.0, 10.04],
+    }))
+    df_britech = compact_frame(pd.DataFrame({
+        'VENCIMENTO_DATA_BRITECH': [data, data], 'OPERACAO_DATA_BRITECH': [pd.NaT, pd.NaT], 'QTD_BRITECH': [10.05, 10.3],
+    }))
+
+    banco_pos, britech_pos, _, _, dist_qtd = NearestMatcher(max_qty=0.5).match(
+        df_banco, df_britech, np.ones(2, dtype=bool), np.ones(2, dtype=bool)
+    )
+
+    assert dict(zip(banco_pos, britech_pos)) == {1: 0, 0: 1}
+    assert sorted(dist_qtd / 1e8) == pytest.approx([0.01, 0.3])
+
+
+def test_unmatched_rows_are_reported_per_side(drifted_inputs):
+    checker = ConsistencyChecker(*drifted_inputs)
+
+    somente_banco = checker.get_banco_only_dataframe()
+    somente_britech = checker.get_britech_only_dataframe()
+
+    assert set(somente_banco['CODIGO_BANCO']) == {'CDB_MATCH_VENC', 'ATIVO_SEM_MATCH_B'}
+    assert set(somente_britech['CODIGO_BRITECH']) == {'CDB_MATCH_VENC_B', 'ATIVO_SEM_MATCH_BT', 'OUTRO_APL'}
+    assert somente_banco['VALOR_BRUTO_BANCO'].is_monotonic_decreasing
+    assert len(checker.merged_df) + len(somente_banco) == len(checker.df_banco)
+
+
+# ---------- MultiSourceChecker ----------
+
+def test_multi_source_matches_pairwise_checkers(mock_banco_df, mock_britech_df):
+    """Cada fonte tem os mesmos pares e diferenças de um ConsistencyChecker só com ela."""
+    risco = mock_britech_df.iloc[[0, 2, 4]].copy()
+    risco['PU_BRITECH'] = [10.0, 100.00001, 10.0]
+    fontes = {'BRITECH': mock_britech_df, 'RISCO': risco}
+
+    checker = MultiSourceChecker(mock_banco_df, fontes)
+    df_completo = checker.get_comparison_dataframe(sort=False)
+
+    for nome, df_fonte in fontes.items():
+        esperado = ConsistencyChecker(mock_banco_df, df_fonte).get_comparison_dataframe(sort=False)
+        obtido = df_completo[df_completo['FONTE'] == nome].drop(columns='FONTE').reset_index(drop=True)
+        pd.testing.assert_frame_equal(obtido, esperado, check_categorical=False)
+
+    somente_banco = checker.get_banco_only_dataframe()
+    assert set(somente_banco.loc[somente_banco['FONTE'] == 'RISCO', 'CODIGO_BANCO']) == {'LCA_MATCH_APL', 'ATIVO_SEM_MATCH_B'}
+    assert set(checker.get_source_only_dataframe()['FONTE']) == {'BRITECH', 'RISCO'}
+
+    df_pu = checker.get_pu_by_source_dataframe().set_index('CODIGO_BANCO')
+    assert np.isnan(df_pu.loc['LCA_MATCH_APL', 'PU_RISCO'])
+    assert df_pu.loc['DB_INCONSISTENTE', 'FONTES_INCONSISTENTES'] == 1
+
+
+def test_multi_source_rejects_duplicate_keys_in_any_source(mock_banco_df, mock_britech_df):
+    duplicada = pd.concat([mock_britech_df, mock_britech_df.iloc[[0]]], ignore_index=True)
+
+    with pytest.raises(ValueError, match="fonte RISCO"):
+        MultiSourceChecker(mock_banco_df, {'BRITECH': mock_britech_df, 'RISCO': duplicada})
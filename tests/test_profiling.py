@@ -0,0 +1,61 @@
+# tests/test_profiling.py
+
+import json
+import pytest
+from src.data_processor import ConsistencyChecker
+from src.profiling import RunProfiler, stage
+
+
+def test_stages_are_recorded_only_with_active_profiler(mock_banco_df, mock_britech_df):
+    ConsistencyChecker(mock_banco_df, mock_britech_df).get_comparison_dataframe()
+
+    with RunProfiler() as profiler:
+        checker = ConsistencyChecker(mock_banco_df, mock_britech_df)
+        checker.get_comparison_dataframe()
+
+    with stage('fora_do_profiler') as etapa:
+        etapa['linhas_saida'] = 1
+
+    etapas = {e['etapa']: e for e in profiler.stages}
+    assert list(etapas) == ['conciliacao.validacao', 'conciliacao.merge', 'conciliacao.comparacao', 'conciliacao.ordenacao']
+    assert etapas['conciliacao.merge']['linhas_entrada'] == len(mock_banco_df) + len(mock_britech_df)
+    assert etapas['conciliacao.merge']['linhas_saida'] == len(checker.merged_df)
+    assert all(e['wall_s'] >= 0 and e['cpu_s'] >= 0 for e in profiler.stages)
+
+
+def test_rss_peak_is_reported_as_cumulative_with_its_growth():
+    """Sem tracemalloc, o pico de RSS é o do processo: a etapa leve repete o pico da pesada, sem aumento."""
+    with RunProfiler() as profiler:
+        with stage('pesada'):
+            dados = bytearray(50 * 1024 * 1024)
+            dados[::4096] = b'x' * len(dados[::4096])
+        del dados
+        with stage('leve'):
+            pass
+
+    pesada, leve = profiler.stages
+    if pesada['pico_rss_processo_mb'] is None:
+        pytest.skip("pico de RSS indisponível neste sistema")
+    assert 'pico_memoria_mb' not in pesada
+    assert leve['pico_rss_processo_mb'] >= pesada['pico_rss_processo_mb']
+    assert pesada['aumento_pico_rss_mb'] >= 0
+    assert leve['aumento_pico_rss_mb'] == 0
+
+
+def test_deep_profile_writes_report_and_stats(tmp_path):
+    profiler = RunProfiler(deep=True)
+    with profiler:
+        with stage('externa'):
+            with stage('interna', rows_in=10):
+                dados = [0] * 100_000
+            del dados
+
+    profiler.save(str(tmp_path / 'execucao.json'), str(tmp_path / 'execucao.prof'))
+
+    relatorio = json.loads((tmp_path / 'execucao.json').read_text(encoding='utf-8'))
+    interna, externa = relatorio['etapas']
+    assert (interna['nivel'], externa['nivel']) == (1, 0)
+    # O pico da etapa externa inclui o pico da interna
+    assert externa['pico_memoria_mb'] >= interna['pico_memoria_mb'] > 0.5
+    assert relatorio['perfil_cpu']
+    assert (tmp_path / 'execucao.prof').exists()
@@ -0,0 +1,60 @@
+# tests/test_rules.py
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data_processor import ConsistencyChecker
+from src.rules import InconsistencyRule, RuleEngine, load_rules
+
+
+def test_rules_by_asset_class_with_relative_and_value_thresholds(tmp_path):
+    arquivo = tmp_path / 'regras.json'
+    arquivo.write_text(json.dumps([
+        {'nome': 'lca_cdb', 'classes': ['LCA', 'CDB'], 'condicao': 'PU_DIFF_PERC > 0.001 or VALOR_DIF_REAL > 100'},
+        {'nome': 'pu_absoluto', 'condicao': 'PU_DIFF_VALOR > 1e-6'},
+    ]), encoding='utf-8')
+    df = pd.DataFrame({
+        'CODIGO_BRITECH': ['CDB Banco A - Vcto: 01-01-2030', 'LCA Banco B', 'cdb banco c', 'DEBENTURE XYZ', 'DEBENTURE XYZ', None],
+        'PU_DIFF_VALOR': [0.05, 0.0, 0.01, 1e-5, 1e-7, 1e-5],
+        'PU_DIFF_PERC': [0.0005, 0.0001, 0.002, 0.0, 0.0, 0.0],
+        'VALOR_DIF_REAL': [10.0, 150.0, 0.0, 0.0, 0.0, np.nan],
+    })
+
+    status, regras = load_rules(str(arquivo)).evaluate(df)
+
+    # CDB e LCA seguem só a regra da classe: a diferença absoluta de 0.05 no CDB não dispara
+    assert status.tolist() == [False, True, True, True, False, True]
+    assert regras.tolist() == [None, 'lca_cdb', 'lca_cdb', 'pu_absoluto', None, 'pu_absoluto']
+
+
+def test_first_fired_rule_is_reported_and_checker_uses_rules(mock_banco_df, mock_britech_df):
+    engine = RuleEngine([
+        InconsistencyRule('valor', 'VALOR_DIF_REAL > 0.01'),
+        InconsistencyRule('pu', 'PU_DIFF_VALOR > 1e-6'),
+    ])
+
+    checker = ConsistencyChecker(mock_banco_df, mock_britech_df)
+    assert checker.get_inconsistent_dataframe()['REGRA_INCONSISTENCIA'].tolist() == ['tolerancia_pu']
+
+    checker.rules = engine
+    df_inconsistente = checker.get_inconsistent_dataframe()
+    assert df_inconsistente['CODIGO_BANCO'].tolist() == ['DB_INCONSISTENTE']
+    assert df_inconsistente['REGRA_INCONSISTENCIA'].tolist() == ['valor']
+    assert checker.get_comparison_dataframe()['REGRA_INCONSISTENCIA'].notna().sum() == 1
+
+
+def test_invalid_rules_are_rejected_when_loaded(tmp_path):
+    with pytest.raises(ValueError, match="condição inválida"):
+        RuleEngine([InconsistencyRule('x', 'PU_INEXISTENTE > 1')])
+    with pytest.raises(ValueError, match="não é uma comparação"):
+        RuleEngine([InconsistencyRule('x', 'PU_DIFF_VALOR * 2')])
+    with pytest.raises(ValueError, match="nomes de regra repetidos"):
+        RuleEngine([InconsistencyRule('x', 'PU_DIFF > 0'), InconsistencyRule('x', 'PU_DIFF < 0')])
+
+    sem_condicao = tmp_path / 'regras.json'
+    sem_condicao.write_text(json.dumps([{'nome': 'x'}]), encoding='utf-8')
+    with pytest.raises(ValueError, match="'nome' e 'condicao'"):
+        load_rules(str(sem_condicao))
@@ -0,0 +1,65 @@
+# tests/test_schema.py
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from src.cache import load_frame, save_frame
+from src.data_processor import ConsistencyChecker
+from src.schema import compact_frame, expand_frame, from_fixed, to_fixed
+
+
+def test_compact_frame_roundtrip(mock_banco_df):
+    compacto = compact_frame(mock_banco_df)
+
+    assert compacto['APLICACAO_DATA_BANCO'].dtype == np.int32
+    assert compacto['QTD_BANCO'].dtype == 'Int64'
+    assert compact_frame(compacto) is compacto
+    pd.testing.assert_frame_equal(expand_frame(compacto), mock_banco_df, check_dtype=False)
+
+
+def test_fixed_point_keeps_nulls_and_decimals():
+    valores = pd.Series([1234.56, np.nan, 1e-5, -2.5], name='QTD_BANCO')
+
+    fixo = to_fixed(valores, 8)
+
+    assert fixo.isna().tolist() == [False, True, False, False]
+    pd.testing.assert_series_equal(from_fixed(fixo, 8), valores)
+
+
+def test_compact_frame_survives_cache_roundtrip(mock_banco_df, tmp_path):
+    compacto = compact_frame(mock_banco_df)
+    compacto.loc[1, 'QTD_BANCO'] = pd.NA
+
+    save_frame(compacto, str(tmp_path / "frame"))
+
+    pd.testing.assert_frame_equal(load_frame(str(tmp_path / "frame")), compacto)
+
+
+def test_comparison_report_uses_expanded_types(mock_banco_df, mock_britech_df):
+    checker = ConsistencyChecker(mock_banco_df, mock_britech_df)
+    df_completo = checker.get_comparison_dataframe()
+
+    assert checker.merged_df['VENCIMENTO_DATA_BANCO'].dtype == np.int32
+    assert df_completo['VENCIMENTO_DATA_BANCO'].dtype == 'datetime64[ns]'
+    assert df_completo['QTD_BANCO'].dtype == np.float64
+    assert df_completo['CODIGO_BANCO'].dtype == object
+    assert df_completo['TIPO_ID_USADO'].dtype == object
+    linha = df_completo.set_index('CODIGO_BANCO').loc['CDB_MATCH_VENC']
+    assert linha['VENCIMENTO_DATA_BANCO'] == datetime(2025, 1, 1)
+
+
+def test_values_beyond_fixed_point_fall_back_to_float(mock_banco_df, mock_britech_df, caplog):
+    banco, britech = mock_banco_df.copy(), mock_britech_df.copy()
+    # 1e14 em ponto fixo com 6 casas não cabe no int64; a linha continua sendo conciliada
+    banco.loc[banco['CODIGO_BANCO'] == 'CDB_MATCH_VENC', 'VALOR_BRUTO_BANCO'] = 1e14
+
+    with caplog.at_level('WARNING'):
+        checker = ConsistencyChecker(banco, britech, duplicates='group')
+    df_completo = checker.get_comparison_dataframe()
+
+    assert 'excedem o limite do ponto fixo' in caplog.text
+    assert checker.df_banco['VALOR_BRUTO_BANCO'].dtype == np.float64
+    assert checker.df_britech['VALOR_BRUTO_BRITECH'].dtype == 'Int64'
+    linha = df_completo.set_index('CODIGO_BANCO').loc['CDB_MATCH_VENC']
+    assert linha['VALOR_DIF_REAL'] == 1e14 - 1000.0
+    assert len(df_completo) == 4
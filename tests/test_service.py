@@ -0,0 +1,80 @@
+# tests/test_service.py
+
+import json
+import os
+import shutil
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+from src.data_processor import ConsistencyChecker
+from src.service import ReconciliationService, make_server
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+@pytest.fixture
+def service(tmp_path):
+    shutil.copy(os.path.join(DATA_DIR, 'Extrato_Britech.xlsx'), tmp_path)
+    shutil.copy(os.path.join(DATA_DIR, 'Extrato_Banco.xlsx'), tmp_path)
+    return ReconciliationService(str(tmp_path / 'Extrato_Britech.xlsx'), formats=['csv'], root_dir=str(tmp_path))
+
+
+def _post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'), method='POST')
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_service_reuses_britech_until_file_changes(service):
+    banco_file = os.path.join(DATA_DIR, 'Extrato_Banco.xlsx')
+
+    primeira = service.reconcile(banco_file)
+    df_britech, _ = service.snapshot.get()
+    assert primeira['CONCILIADOS'] == primeira['LINHAS_BANCO'] == 41
+    assert service.reconcile(banco_file)['CONCILIADOS'] == 41
+    assert service.snapshot.get()[0] is df_britech
+
+    info = os.stat(service.snapshot.file_path)
+    os.utime(service.snapshot.file_path, ns=(info.st_atime_ns, info.st_mtime_ns + 1_000_000_000))
+    assert service.snapshot.get()[0] is not df_britech
+
+
+
+def test_service_does_not_normalize_britech_per_request(service, monkeypatch):
+    """A Britech do snapshot já está normalizada: cada requisição só normaliza o Banco."""
+    banco_file = os.path.join(DATA_DIR, 'Extrato_Banco.xlsx')
+    df_britech, _ = service.snapshot.get()
+    normalizados = []
+    original = ConsistencyChecker.normalize_input
+    monkeypatch.setattr(ConsistencyChecker, 'normalize_input', staticmethod(lambda df: normalizados.append(df) or original(df)))
+
+    assert service.reconcile(banco_file)['CONCILIADOS'] == 41
+    assert len(normalizados) == 1 and normalizados[0] is not df_britech
+
+def test_http_endpoint_reconciles_and_writes_reports(service, tmp_path):
+    server = make_server(service, port=0, workers=2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        status, resposta = _post(url + '/conciliar', {'banco': 'Extrato_Banco.xlsx', 'output_dir': 'out'})
+        assert status == 200
+        assert resposta['CONCILIADOS'] == 41
+        assert (tmp_path / 'out' / 'relatorio_comparacao_completa.csv').exists()
+
+        status, resposta = _post(url + '/conciliar', {'banco': str(tmp_path / 'Extrato_Banco.xlsx'), 'top_n': '2'})
+        assert status == 200 and len(resposta['LINHAS_INCONSISTENTES']) <= 2
+
+        assert _post(url + '/conciliar', {'banco': str(tmp_path / 'inexistente.xlsx')})[0] == 404
+        assert _post(url + '/conciliar', {'arquivo': 'x'})[0] == 400
+        assert _post(url + '/conciliar', {'banco': 'Extrato_Banco.xlsx', 'top_n': 'dez'})[0] == 400
+        assert _post(url + '/conciliar', {'banco': os.path.join(DATA_DIR, 'Extrato_Banco.xlsx')})[0] == 403
+        assert _post(url + '/conciliar', {'banco': 'Extrato_Banco.xlsx', 'output_dir': '../fora'})[0] == 403
+        assert not (tmp_path.parent / 'fora').exists()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,114 @@
+# tests/test_streaming.py
+
+import pandas as pd
+from datetime import datetime
+import src.data_processor as data_processor
+from src.data_processor import ConsistencyChecker, DataCleaner
+from src.streaming import StreamingReconciler
+
+COLUNAS_BANCO = ['Código', 'Aplicação', 'Qtd.', 'PU Atual', 'Vcto.', 'Valor Bruto']
+COLUNAS_BRITECH = ['DESCRIÇÃO', 'DATA OPERAÇÃO', 'VALOR BRUTO', 'QUANTIDADE', 'DATA VENCIMENTO']
+
+
+def _write_statements(tmp_path, n=30):
+    banco = pd.DataFrame({
+        'Código': [f'CDB{i}' for i in range(n)],
+        'Aplicação': [datetime(2024, 1, 1 + i % 28) for i in range(n)],
+        'Qtd.': [float(10 + i) for i in range(n)],
+        'PU Atual': [100.0 + (0.01 if i % 7 == 0 else 0.0) for i in range(n)],
+        'Vcto.': [datetime(2026, 1, 1 + i % 28) for i in range(n)],
+        'Valor Bruto': [100.0 * (10 + i) for i in range(n)],
+    })
+    britech = pd.DataFrame({
+        'DESCRIÇÃO': [f'CDB{i}_B' for i in range(n)],
+        'DATA OPERAÇÃO': [datetime(2024, 1, 1 + i % 28) for i in range(n)],
+        'VALOR BRUTO': [f'R${100.0 * (10 + i):.2f}'.replace('.', ',') for i in range(n)],
+        'QUANTIDADE': [float(10 + i) for i in range(n)],
+        'DATA VENCIMENTO': [datetime(2026, 1, 1 + i % 28) if i % 5 else pd.NaT for i in range(n)],
+    })
+    banco_file, britech_file = tmp_path / 'banco.xlsx', tmp_path / 'britech.xlsx'
+    banco.to_excel(banco_file, index=False)
+    britech.to_excel(britech_file, index=False)
+    return str(banco_file), str(britech_file)
+
+
+def test_streaming_matches_in_memory_reconciliation(tmp_path, monkeypatch):
+    banco_file, britech_file = _write_statements(tmp_path)
+    # Blocos e orçamento mínimos para forçar várias leituras e vários grupos de partições
+    monkeypatch.setattr(data_processor, 'MIN_CHUNK_ROWS', 4)
+    reconciler = StreamingReconciler(banco_file, COLUNAS_BANCO, britech_file, COLUNAS_BRITECH,
+                                     memory_budget=1, n_buckets=8, spill_dir=str(tmp_path))
+
+    summary = reconciler.run(str(tmp_path / 'total'), str(tmp_path / 'inconsistencias'))
+
+    checker = ConsistencyChecker(
+        DataCleaner(banco_file, COLUNAS_BANCO).prepare_banco_data(),
+        DataCleaner(britech_file, COLUNAS_BRITECH).prepare_britech_data(),
+    )
+    esperado = checker.get_comparison_dataframe().sort_values('ASSET_ID').reset_index(drop=True)
+    obtido = pd.read_csv(tmp_path / 'total.csv').sort_values('ASSET_ID').reset_index(drop=True)
+
+    assert summary['conciliados'] == len(esperado) == 30
+    assert obtido['ASSET_ID'].tolist() == esperado['ASSET_ID'].tolist()
+    assert obtido['TIPO_ID_USADO'].tolist() == esperado['TIPO_ID_USADO'].tolist()
+    assert summary['inconsistentes'] == int(esperado['STATUS_INCONSISTENCIA'].sum()) == 5
+    assert summary['somente_banco'] == summary['somente_britech'] == 0
+
+
+def test_streaming_reports_unmatched_rows(tmp_path):
+    banco_file, britech_file = _write_statements(tmp_path, n=10)
+    britech = pd.read_excel(britech_file)
+    britech.loc[3, 'QUANTIDADE'] = 999.0
+    britech.to_excel(britech_file, index=False)
+    reconciler = StreamingReconciler(banco_file, COLUNAS_BANCO, britech_file, COLUNAS_BRITECH,
+                                     memory_budget=1, n_buckets=4, spill_dir=str(tmp_path))
+
+    summary = reconciler.run(str(tmp_path / 'total'), str(tmp_path / 'inconsistencias'),
+                             str(tmp_path / 'somente_banco'), str(tmp_path / 'somente_britech'))
+
+    assert summary['conciliados'] == 9
+    assert pd.read_csv(tmp_path / 'somente_banco.csv')['CODIGO_BANCO'].tolist() == ['CDB3']
+    assert pd.read_csv(tmp_path / 'somente_britech.csv')['CODIGO_BRITECH'].tolist() == ['CDB3_B']
+
+
+def test_streaming_splits_a_partition_with_a_single_quantity(tmp_path, caplog):
+    banco_file, britech_file = _write_statements(tmp_path, n=20)
+    for path, coluna in ((banco_file, 'Qtd.'), (britech_file, 'QUANTIDADE')):
+        df = pd.read_excel(path)
+        df[coluna] = 10.0
+        if 'DATA VENCIMENTO' in df:
+            # Vencimentos divergentes em vez de nulos: esses pares saem pela chave de aplicação
+            df['DATA VENCIMENTO'] = [v if pd.notna(v) else datetime(2030, 1, 1 + i) for i, v in enumerate(df['DATA VENCIMENTO'])]
+        df.to_excel(path, index=False)
+    reconciler = StreamingReconciler(banco_file, COLUNAS_BANCO, britech_file, COLUNAS_BRITECH,
+                                     memory_budget=1, n_buckets=4, spill_dir=str(tmp_path))
+
+    with caplog.at_level('INFO'):
+        summary = reconciler.run(str(tmp_path / 'total'), str(tmp_path / 'inconsistencias'))
+
+    checker = ConsistencyChecker(
+        DataCleaner(banco_file, COLUNAS_BANCO).prepare_banco_data(),
+        DataCleaner(britech_file, COLUNAS_BRITECH).prepare_britech_data(),
+    )
+    esperado = checker.get_comparison_dataframe().sort_values('CODIGO_BANCO').reset_index(drop=True)
+    obtido = pd.read_csv(tmp_path / 'total.csv').sort_values('CODIGO_BANCO').reset_index(drop=True)
+
+    assert 'dividida em 20 partições' in caplog.text
+    assert summary['conciliados'] == len(esperado) == 20
+    assert obtido['CODIGO_BRITECH'].tolist() == esperado['CODIGO_BRITECH'].tolist()
+    assert obtido['TIPO_ID_USADO'].tolist() == esperado['TIPO_ID_USADO'].tolist()
+    assert 'APLICACAO' in set(esperado['TIPO_ID_USADO'])
+
+
+def test_streaming_reports_all_rows_as_unmatched_when_one_side_is_empty(tmp_path):
+    banco_file, britech_file = _write_statements(tmp_path, n=10)
+    pd.read_excel(britech_file).iloc[:0].to_excel(britech_file, index=False)
+    reconciler = StreamingReconciler(banco_file, COLUNAS_BANCO, britech_file, COLUNAS_BRITECH,
+                                     memory_budget=1, n_buckets=4, spill_dir=str(tmp_path))
+
+    summary = reconciler.run(str(tmp_path / 'total'), str(tmp_path / 'inconsistencias'),
+                             str(tmp_path / 'somente_banco'), str(tmp_path / 'somente_britech'))
+
+    assert summary['conciliados'] == 0 and summary['somente_banco'] == 10
+    assert sorted(pd.read_csv(tmp_path / 'somente_banco.csv')['CODIGO_BANCO']) == sorted(f'CDB{i}' for i in range(10))
+    assert not (tmp_path / 'somente_britech.csv').exists()
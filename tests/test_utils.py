@@ -0,0 +1,111 @@
+# tests/test_utils.py
+
+import openpyxl
+import pandas as pd
+import pytest
+from datetime import datetime
+from utils.utils import CsvSink, OutputSink, build_sinks, estimate_column_width, save_to_excel, write_report
+
+
+def test_estimate_column_width_matches_string_lengths():
+    df = pd.DataFrame({
+        'texto': ['a', 'abcdef', None],
+        'float': [1.5, 1234.0625, float('nan')],
+        'inteiro': [7, -12345, 3],
+        'data': [datetime(2024, 1, 1), pd.NaT, datetime(2025, 12, 31)],
+        'flag': [True, False, True],
+    })
+
+    for col in df.columns:
+        esperado = df[col].dropna().astype(str).str.len().max()
+        assert estimate_column_width(df[col]) == esperado
+
+
+def test_save_to_excel_keeps_formats(mock_banco_df, tmp_path):
+    arquivo = tmp_path / "relatorio.xlsx"
+    df = mock_banco_df[['CODIGO_BANCO', 'VENCIMENTO_DATA_BANCO', 'PU_BANCO', 'VALOR_BRUTO_BANCO']]
+
+    save_to_excel(df, str(arquivo), 'Aba')
+
+    ws = openpyxl.load_workbook(arquivo)['Aba']
+    assert [c.value for c in ws[1]] == list(df.columns)
+    assert ws[1][0].font.b
+    assert ws['B3'].value is None
+    assert ws['B2'].value == datetime(2025, 1, 1) and ws['B2'].number_format == 'yyyy-mm-dd'
+    assert ws['C4'].value == 100.00001
+    assert ws.column_dimensions['A'].width > len('CODIGO_BANCO')
+    assert pd.read_excel(arquivo).shape == df.shape
+
+
+def test_save_to_excel_writes_rows_in_chunks(mock_banco_df, tmp_path, monkeypatch):
+    monkeypatch.setattr('utils.utils.EXCEL_CHUNK_ROWS', 2)
+    arquivo = tmp_path / "relatorio.xlsx"
+    df = mock_banco_df[['CODIGO_BANCO', 'VENCIMENTO_DATA_BANCO', 'PU_BANCO']]
+
+    save_to_excel(df, str(arquivo), 'Aba')
+
+    pd.testing.assert_frame_equal(pd.read_excel(arquivo), df.reset_index(drop=True), check_dtype=False)
+
+
+def test_write_report_runs_all_sinks_in_one_pass(mock_banco_df, tmp_path):
+    df = mock_banco_df[['CODIGO_BANCO', 'QTD_BANCO', 'PU_BANCO']]
+    base = str(tmp_path / 'relatorio')
+
+    paths = write_report(df, base, 'Aba', build_sinks(['excel', 'csv', 'csv']))
+
+    assert paths == [base + '.xlsx', base + '.csv']
+    pd.testing.assert_frame_equal(pd.read_csv(base + '.csv'), df.reset_index(drop=True))
+    assert pd.read_excel(base + '.xlsx').shape == df.shape
+
+
+def test_csv_sink_append_writes_header_once(mock_banco_df, tmp_path):
+    df = mock_banco_df[['CODIGO_BANCO', 'QTD_BANCO']]
+    base = str(tmp_path / 'relatorio')
+    sink = CsvSink(chunk_rows=1)
+
+    sink.append(df, base)
+    sink.append(df.iloc[:0], base)
+    sink.append(df, base)
+
+    assert len(pd.read_csv(base + '.csv')) == 2 * len(df)
+
+
+
+def test_csv_sink_writes_dates_like_to_csv(mock_banco_df, tmp_path):
+    """As datas formatadas pelo NumPy geram o mesmo arquivo do `to_csv` direto, com e sem hora."""
+    df = mock_banco_df[['CODIGO_BANCO', 'APLICACAO_DATA_BANCO', 'VENCIMENTO_DATA_BANCO']].copy()
+    df['COM_HORA'] = df['APLICACAO_DATA_BANCO'] + pd.Timedelta(hours=10)
+    path = CsvSink().write(df, str(tmp_path / 'relatorio'), 'Planilha')
+
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == df.to_csv(index=False)
+    assert df['VENCIMENTO_DATA_BANCO'].dtype.kind == 'M'
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_columnar_sinks_roundtrip(mock_banco_df, tmp_path, fmt):
+    pa = pytest.importorskip('pyarrow')
+    df = mock_banco_df[['CODIGO_BANCO', 'VENCIMENTO_DATA_BANCO', 'PU_BANCO']].reset_index(drop=True)
+    base = str(tmp_path / 'relatorio')
+
+    (path,) = write_report(df, base, 'Aba', build_sinks([fmt]))
+
+    if fmt == 'parquet':
+        lido = pd.read_parquet(path)
+    else:
+        with pa.memory_map(path) as source:
+            lido = pa.ipc.open_file(source).read_all().to_pandas()
+    pd.testing.assert_frame_equal(lido, df, check_dtype=False)
+
+
+def test_build_sinks_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        build_sinks(['xls'])
+
+
+def test_output_sink_requires_write():
+    class SemWrite(OutputSink):
+        name = 'sem_write'
+
+    with pytest.raises(TypeError):
+        SemWrite()
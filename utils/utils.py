@@ -1,21 +1,87 @@
+import numpy as np
 import pandas as pd
+import xlsxwriter
 import logging
+import os
+from abc import ABC, abstractmethod
+from typing import List
+
+from src.profiling import stage
 
 logger = logging.getLogger(__name__)
 
+# Número máximo de valores amostrados por coluna na estimativa de largura
+WIDTH_SAMPLE_SIZE = 1000
+# Linhas convertidas para objetos Python de cada vez na gravação do Excel
+EXCEL_CHUNK_ROWS = 10_000
 
-def save_to_excel(df: pd.DataFrame, filename: str, sheet_name: str):
+HEADER_FORMAT = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+
+
+def _sample(values: pd.Series) -> pd.Series:
+    """ Amostra limitada da coluna: valores espaçados uniformemente, sem copiar a coluna inteira. """
+    if len(values) <= WIDTH_SAMPLE_SIZE:
+        return values
+    step = len(values) // WIDTH_SAMPLE_SIZE
+    return values.iloc[::step]
+
+
+def estimate_column_width(col: pd.Series) -> int:
+    """
+    Estima o maior comprimento textual da coluna sem converter a coluna inteira para texto:
+    datas e booleanos têm largura fixa, inteiros usam os extremos, textos usam `str.len()`
+    (que não cria cópias das strings) e os demais tipos usam uma amostra limitada.
+    """
+    values = col.dropna()
+    if values.empty:
+        return 0
+
+    if pd.api.types.is_bool_dtype(values):
+        return 5
+    if pd.api.types.is_datetime64_any_dtype(values):
+        # 'AAAA-MM-DD' quando todas as datas são meia-noite, senão 'AAAA-MM-DD HH:MM:SS'
+        return 10 if (values.dt.normalize() == values).all() else 19
+    if pd.api.types.is_integer_dtype(values):
+        return max(len(str(values.min())), len(str(values.max())))
+    if pd.api.types.is_float_dtype(values):
+        sample = pd.concat([_sample(values), values.nsmallest(1), values.nlargest(1)])
+        return max(len(repr(float(v))) for v in sample)
+
+    sample_width = max(len(str(v)) for v in _sample(values))
     try:
-        writer = pd.ExcelWriter(filename, engine='xlsxwriter', datetime_format='yyyy-mm-dd')
-        df.to_excel(writer, sheet_name=sheet_name, index=False)
+        # Em colunas mistas, str.len() devolve NaN para os valores que não são texto
+        text_width = values.str.len().max()
+    except AttributeError:
+        text_width = np.nan
+    return int(max(sample_width, 0 if pd.isna(text_width) else text_width))
+
 
-        workbook = writer.book
-        worksheet = writer.sheets[sheet_name]
+def _column_values(col: pd.Series) -> list:
+    """ Valores da coluna como objetos Python, com None no lugar de NaN/NaT (células em branco). """
+    values = col.astype(object)
+    return values.where(col.notna(), None).tolist()
+
+
+def save_to_excel(df: pd.DataFrame, filename: str, sheet_name: str):
+    """
+    Grava o relatório com o xlsxwriter em modo `constant_memory`: as linhas são escritas em ordem
+    e descarregadas em disco à medida que são gravadas. Os valores são convertidos para objetos
+    Python em blocos de EXCEL_CHUNK_ROWS linhas, e não o relatório inteiro de uma vez. As larguras
+    das colunas são estimadas por tipo e amostra, sem converter o relatório inteiro para texto.
+    """
+    try:
+        workbook = xlsxwriter.Workbook(filename, {
+            'constant_memory': True,
+            'default_date_format': 'yyyy-mm-dd',
+            'nan_inf_to_errors': True,
+        })
+        worksheet = workbook.add_worksheet(sheet_name)
 
         currency_fmt = workbook.add_format({'num_format': 'R$ #,##0.00'})
         percentage_fmt = workbook.add_format({'num_format': '0.00%'})
         pu_fmt = workbook.add_format({'num_format': '0.0000000000'})
         date_fmt = workbook.add_format({'num_format': 'dd-mm-yyyy'})
+        header_fmt = workbook.add_format(HEADER_FORMAT)
 
         COLUMN_FORMATS = {
             'VALOR_DIF_REAL': currency_fmt,
@@ -34,15 +100,164 @@ def save_to_excel(df: pd.DataFrame, filename: str, sheet_name: str):
 
         for i, col in enumerate(df.columns):
             try:
-                max_len = df[col].astype(str).str.len().max()
-                width = max(len(str(col)), max_len if not pd.isna(max_len) else 0)
+                width = max(len(str(col)), estimate_column_width(df.iloc[:, i]))
             except Exception:
                 width = len(str(col))
 
             worksheet.set_column(i, i, width + 2, COLUMN_FORMATS.get(col))
 
-        writer.close()
-        logger.info(f"Relatório salvo com sucesso: {filename}")
+        worksheet.write_row(0, 0, [str(col) for col in df.columns], header_fmt)
+        for start in range(0, len(df), EXCEL_CHUNK_ROWS):
+            chunk = df.iloc[start:start + EXCEL_CHUNK_ROWS]
+            columns = [_column_values(chunk.iloc[:, i]) for i in range(chunk.shape[1])]
+            for row_num, row in enumerate(zip(*columns), start=start + 1):
+                worksheet.write_row(row_num, 0, row)
+
+        workbook.close()
+        logger.info("Relatório salvo com sucesso: %s", filename)
 
     except Exception as e:
-        logger.error(f"Erro ao salvar Excel {filename}: {e}", exc_info=True)
\ No newline at end of file
+        logger.error("Erro ao salvar Excel %s: %s", filename, e, exc_info=True)
+
+
+# --- SAÍDAS (SINKS) DOS RELATÓRIOS ---
+
+class OutputSink(ABC):
+    """
+    Destino de gravação dos relatórios. Cada sink grava o mesmo DataFrame no seu formato,
+    com o nome base do relatório acrescido da extensão do formato.
+    """
+    name = ''
+    extension = ''
+
+    def path_for(self, base_name: str) -> str:
+        return base_name + self.extension
+
+    @abstractmethod
+    def write(self, df: pd.DataFrame, base_name: str, sheet_name: str) -> str:
+        """ Grava `df` no formato do sink e retorna o caminho do arquivo. """
+
+
+class ExcelSink(OutputSink):
+    name = 'excel'
+    extension = '.xlsx'
+
+    def write(self, df: pd.DataFrame, base_name: str, sheet_name: str) -> str:
+        path = self.path_for(base_name)
+        save_to_excel(df, path, sheet_name)
+        return path
+
+
+def _csv_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Colunas só de datas (sem hora) já como texto 'AAAA-MM-DD', formatadas pelo NumPy: o texto é o
+    mesmo que o `to_csv` gravaria, sem formatar cada data em Python. As demais colunas não mudam.
+    """
+    saida = df
+    for i in range(df.shape[1]):
+        values = df.iloc[:, i].to_numpy()
+        # Datas com fuso viram objetos no to_numpy e ficam com o to_csv
+        if values.dtype.kind != 'M':
+            continue
+        nulos = np.isnat(values)
+        dias = values.astype('datetime64[D]')
+        if (dias[~nulos] != values[~nulos]).any():
+            continue
+        texto = np.datetime_as_string(dias, unit='D').astype(object)
+        texto[nulos] = None
+        if saida is df:
+            saida = df.copy(deep=False)
+        saida.isetitem(i, texto)
+    return saida
+
+
+class CsvSink(OutputSink):
+    """ CSV gravado em blocos de linhas; `append` permite gravar o relatório de forma incremental. """
+    name = 'csv'
+    extension = '.csv'
+
+    def __init__(self, chunk_rows: int = 50_000):
+        self.chunk_rows = chunk_rows
+
+    def write(self, df: pd.DataFrame, base_name: str, sheet_name: str) -> str:
+        path = self.path_for(base_name)
+        _csv_frame(df).to_csv(path, index=False, encoding='utf-8', chunksize=self.chunk_rows)
+        logger.info("Relatório salvo com sucesso: %s", path)
+        return path
+
+    def append(self, df: pd.DataFrame, base_name: str) -> str:
+        path = self.path_for(base_name)
+        if not df.empty:
+            _csv_frame(df).to_csv(path, mode='a', header=not os.path.exists(path), index=False,
+                      encoding='utf-8', chunksize=self.chunk_rows)
+        return path
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Os formatos Parquet e Arrow exigem o pacote opcional 'pyarrow' (pip install pyarrow).")
+    return pyarrow
+
+
+class ParquetSink(OutputSink):
+    name = 'parquet'
+    extension = '.parquet'
+
+    def write(self, df: pd.DataFrame, base_name: str, sheet_name: str) -> str:
+        _require_pyarrow()
+        path = self.path_for(base_name)
+        df.to_parquet(path, index=False)
+        logger.info("Relatório salvo com sucesso: %s", path)
+        return path
+
+
+class ArrowSink(OutputSink):
+    """ Arquivo Arrow IPC, gravado em lotes de registros. """
+    name = 'arrow'
+    extension = '.arrow'
+
+    def __init__(self, batch_rows: int = 50_000):
+        self.batch_rows = batch_rows
+
+    def write(self, df: pd.DataFrame, base_name: str, sheet_name: str) -> str:
+        pa = _require_pyarrow()
+        path = self.path_for(base_name)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(path, 'wb') as f, pa.ipc.new_file(f, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=self.batch_rows):
+                writer.write_batch(batch)
+        logger.info("Relatório salvo com sucesso: %s", path)
+        return path
+
+
+SINKS = {
+    'excel': ExcelSink,
+    'csv': CsvSink,
+    'parquet': ParquetSink,
+    'arrow': ArrowSink,
+}
+
+
+def build_sinks(formats: List[str]) -> List[OutputSink]:
+    """ Instancia os sinks pelos nomes dos formatos, sem repetir formatos. """
+    unknown = [fmt for fmt in formats if fmt not in SINKS]
+    if unknown:
+        raise ValueError(f"Formato(s) de saída desconhecido(s): {unknown}. Disponíveis: {list(SINKS)}")
+    return [SINKS[fmt]() for fmt in dict.fromkeys(formats)]
+
+
+def write_report(df: pd.DataFrame, base_name: str, sheet_name: str, sinks: List[OutputSink]) -> List[str]:
+    """
+    Grava o mesmo DataFrame (calculado uma única vez) em todos os sinks. A falha de um
+    formato é registrada e não impede a gravação nos demais.
+    """
+    paths = []
+    for sink in sinks:
+        try:
+            with stage(f'relatorio.{sink.name}', rows_in=len(df), arquivo=sink.path_for(base_name)):
+                paths.append(sink.write(df, base_name, sheet_name))
+        except Exception as e:
+            logger.error("Erro ao salvar %s: %s", sink.path_for(base_name), e, exc_info=True)
+    return paths